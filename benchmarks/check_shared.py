@@ -0,0 +1,51 @@
+"""
+Checks that the modules which hatch-robotpy and hatch-mkpkgconf each carry a
+copy of are still identical. The packages don't depend on each other, so
+the copies are only kept in sync by this check.
+
+    python benchmarks/check_shared.py
+
+Fails and shows a diff if any of the copies in SHARED_FILES differ.
+"""
+
+import difflib
+import pathlib
+import sys
+
+ROOT = pathlib.Path(__file__).absolute().parent.parent
+
+#: files (relative to the repository root) that must be byte-identical
+SHARED_FILES = [
+    (
+        "hatch-robotpy/src/hatch_robotpy/tracing.py",
+        "hatch-mkpkgconf/src/hatch_mkpkgconf/tracing.py",
+    ),
+]
+
+
+def main() -> None:
+    failed = False
+    for first, second in SHARED_FILES:
+        a = (ROOT / first).read_bytes()
+        b = (ROOT / second).read_bytes()
+        if a == b:
+            print(f"ok   {first} == {second}")
+            continue
+
+        failed = True
+        print(f"FAIL {first} != {second}")
+        sys.stdout.writelines(
+            difflib.unified_diff(
+                a.decode("utf-8", errors="replace").splitlines(keepends=True),
+                b.decode("utf-8", errors="replace").splitlines(keepends=True),
+                first,
+                second,
+            )
+        )
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Checks that registering the build hook of a project (such as hatch-robotpy)
+stays cheap. hatch imports the hooks module of every installed plugin, even
+for projects that don't use it, so it must not pull in the modules that are
+only needed for a build.
+
+    python benchmarks/import_time.py [-p PROJECT] [--budget-us N] [--runs N]
+
+The project defaults to the current directory. Its hooks module is imported
+with -X importtime after hatchling has been imported (hatch has always done
+that first). Fails if it imports any modules of the package other than the
+ones the hook needs, or any of the modules listed in IMPORT_TIME_FORBIDDEN
+in the project's benchmarks/__init__.py, or if the median cumulative import
+time is over the budget.
+"""
+
+import argparse
+import importlib
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import typing as T
+
+#: modules of the package that registering the hook may import
+ALLOWED_MODULES = ["", "._version", ".hooks", ".plugin", ".tracing"]
+
+DEFAULT_BUDGET_US = 5000
+
+_marker = "--- hooks ---"
+_code = """
+import os
+import hatchling.plugin
+import hatchling.builders.hooks.plugin.interface
+os.write(2, b"{marker}\\n")
+import {package}.hooks
+"""
+
+
+def get_forbidden(project_dir: pathlib.Path) -> T.Set[str]:
+    """
+    :returns: other modules that must not be imported by registering the
+              hook. Some of them may already have been imported by
+              hatchling, which is fine
+    """
+    sys.path.insert(0, str(project_dir))
+    try:
+        benchmarks = importlib.import_module("benchmarks")
+    finally:
+        sys.path.remove(str(project_dir))
+    return set(benchmarks.IMPORT_TIME_FORBIDDEN)
+
+
+def measure(project_dir: pathlib.Path, package: str) -> T.Tuple[int, T.List[str]]:
+    """
+    :returns: cumulative microseconds spent importing the hooks module, and
+              the modules that were imported for it
+    """
+    env = dict(os.environ)
+    src = str(project_dir / "src")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src, env.get("PYTHONPATH")]))
+    # measure loading bytecode, not compiling the source
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+
+    code = _code.format(marker=_marker, package=package)
+    r = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=False,
+    )
+    if r.returncode != 0:
+        raise RuntimeError(f"importing {package}.hooks failed:\n{r.stderr}")
+
+    lines = r.stderr.splitlines()
+    lines = lines[lines.index(_marker) + 1 :]
+
+    # import time: self [us] | cumulative | imported package
+    total = 0
+    modules = []
+    for line in lines:
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        modules.append(name.strip())
+        # only top level imports, nested ones are included in their parent
+        if name[1:2] != " ":
+            total += int(cumulative)
+
+    return total, modules
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-p",
+        "--project",
+        type=pathlib.Path,
+        default=pathlib.Path("."),
+        help="project whose hook is imported (default: current directory)",
+    )
+    parser.add_argument("--budget-us", type=int, default=DEFAULT_BUDGET_US)
+    parser.add_argument("--runs", type=int, default=7)
+    args = parser.parse_args()
+
+    project_dir = args.project.absolute()
+    package = project_dir.name.replace("-", "_")
+    allowed = {f"{package}{m}" for m in ALLOWED_MODULES}
+    forbidden = get_forbidden(project_dir)
+
+    # the first run writes the bytecode
+    measure(project_dir, package)
+
+    times = []
+    modules: T.List[str] = []
+    for _ in range(args.runs):
+        elapsed, modules = measure(project_dir, package)
+        times.append(elapsed)
+
+    median = statistics.median(times)
+    print(f"{package}.hooks: {median:.0f}us (budget {args.budget_us}us)")
+    for name in modules:
+        print(f"  {name}")
+
+    problems = []
+    for name in modules:
+        top = name.split(".")[0]
+        if name.startswith(f"{package}.") and name not in allowed:
+            problems.append(f"imports {name}")
+        elif name in forbidden or top in forbidden:
+            problems.append(f"imports {name}")
+    if median > args.budget_us:
+        problems.append(f"took {median:.0f}us, over the {args.budget_us}us budget")
+
+    if problems:
+        print()
+        for problem in problems:
+            print(f"FAIL: {package}.hooks {problem}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
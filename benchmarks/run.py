@@ -0,0 +1,309 @@
+"""
+Runs the benchmarks in the benchmarks directory of a project (such as
+hatch-robotpy) and records the results, so that they can be compared across
+commits.
+
+    python benchmarks/run.py [-p PROJECT] [-b REGEX] [--quick]
+    python benchmarks/run.py compare OLD.json NEW.json [--factor 1.1]
+
+The project defaults to the current directory. The bench_*.py modules follow
+asv's conventions (time_* methods, params, param_names, setup and teardown,
+raising NotImplementedError from setup to skip), so they can also be run
+with asv and the project's asv.conf.json. This runner imports the package
+from src instead of building it for each commit, which is much quicker when
+working on a change.
+
+Results are written to PROJECT/benchmarks/results/<commit>.json. Only
+compare results that were recorded on the same machine.
+"""
+
+import argparse
+import datetime
+import importlib
+import inspect
+import itertools
+import json
+import os
+import pathlib
+import platform
+import re
+import subprocess
+import sys
+import time
+import typing as T
+
+#: minimum duration of a sample, short benchmarks are called repeatedly
+SAMPLE_TIME = 0.05
+
+#: (min samples, max samples, max seconds), unless a benchmark sets repeat
+DEFAULT_REPEAT = (3, 10, 10.0)
+
+
+class Benchmark:
+    def __init__(self, name: str, cls: T.Optional[type], func: T.Callable) -> None:
+        self.name = name
+        self.cls = cls
+        self.func = func
+
+        owner: T.Any = cls if cls is not None else func
+        params = getattr(owner, "params", [])
+        if params and not isinstance(params[0], (list, tuple)):
+            params = [params]
+        self.params: T.List[T.List[T.Any]] = [list(p) for p in params]
+        self.param_names: T.List[str] = list(
+            getattr(owner, "param_names", [f"param{i}" for i in range(len(params))])
+        )
+        self.number: T.Optional[int] = getattr(owner, "number", None)
+        repeat = getattr(owner, "repeat", DEFAULT_REPEAT)
+        if isinstance(repeat, int):
+            repeat = (repeat, repeat, float("inf"))
+        self.repeat: T.Tuple[int, int, float] = tuple(repeat)  # type: ignore
+
+    def combinations(self) -> T.Iterator[T.Tuple[T.Any, ...]]:
+        return itertools.product(*self.params)
+
+    def key(self, args: T.Tuple[T.Any, ...]) -> str:
+        if not args:
+            return self.name
+        return f"{self.name}({', '.join(map(repr, args))})"
+
+    def run(self, args: T.Tuple[T.Any, ...], quick: bool) -> T.Optional[T.Dict]:
+        """
+        :returns: timing statistics, or None if the benchmark was skipped
+        """
+        # setup and teardown are methods, or module functions for
+        # benchmarks that are functions
+        owner: T.Any = sys.modules[self.func.__module__]
+        func = self.func
+        if self.cls is not None:
+            owner = self.cls()
+            func = getattr(owner, self.func.__name__)
+
+        setup = getattr(owner, "setup", None)
+        teardown = getattr(owner, "teardown", None)
+        if setup is not None:
+            try:
+                setup(*args)
+            except NotImplementedError:
+                return None
+
+        try:
+            if quick:
+                number, min_repeat, max_repeat, max_time = 1, 1, 1, 0.0
+            else:
+                # the first call warms up, and tells how many calls fit in
+                # a sample
+                elapsed = _time_calls(func, args, 1)
+                number = self.number or max(1, int(SAMPLE_TIME / max(elapsed, 1e-9)))
+                min_repeat, max_repeat, max_time = self.repeat
+
+            samples: T.List[float] = []
+            start = time.perf_counter()
+            while len(samples) < max_repeat:
+                samples.append(_time_calls(func, args, number) / number)
+                if (
+                    len(samples) >= min_repeat
+                    and time.perf_counter() - start >= max_time
+                ):
+                    break
+        finally:
+            if teardown is not None:
+                teardown(*args)
+
+        samples.sort()
+        return {
+            "median": samples[len(samples) // 2],
+            "min": samples[0],
+            "max": samples[-1],
+            "number": number,
+            "samples": samples,
+        }
+
+
+def _time_calls(func: T.Callable, args: T.Tuple[T.Any, ...], number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        func(*args)
+    return time.perf_counter() - start
+
+
+def discover(project_dir: pathlib.Path, pattern: T.Optional[str]) -> T.List[Benchmark]:
+    # import the benchmarks as a package, like asv does, with the package
+    # from src rather than an installed copy
+    sys.path[:0] = [str(project_dir / "src"), str(project_dir)]
+
+    bench_dir = project_dir / "benchmarks"
+    benchmarks = []
+    for path in sorted(bench_dir.glob("bench_*.py")):
+        module = importlib.import_module(f"{bench_dir.name}.{path.stem}")
+        for name, obj in vars(module).items():
+            if getattr(obj, "__module__", None) != module.__name__:
+                continue
+            if inspect.isclass(obj):
+                for attr, method in vars(obj).items():
+                    if attr.startswith("time_") and callable(method):
+                        benchmarks.append(
+                            Benchmark(f"{path.stem}.{name}.{attr}", obj, method)
+                        )
+            elif name.startswith("time_") and inspect.isfunction(obj):
+                benchmarks.append(Benchmark(f"{path.stem}.{name}", None, obj))
+
+    if pattern:
+        regex = re.compile(pattern)
+        benchmarks = [b for b in benchmarks if regex.search(b.name)]
+    return benchmarks
+
+
+def get_commit(project_dir: pathlib.Path) -> str:
+    def git(*args: str) -> str:
+        r = subprocess.run(
+            ["git", *args],
+            cwd=project_dir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        )
+        return r.stdout.strip() if r.returncode == 0 else ""
+
+    commit = git("rev-parse", "--short", "HEAD") or "unknown"
+    if git("status", "--porcelain", "--untracked-files=no", "--", "src"):
+        commit += "-dirty"
+    return commit
+
+
+def get_machine() -> T.Dict[str, T.Any]:
+    return {
+        "node": platform.node(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+    }
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g}{unit}"
+    return f"{seconds / 1e-9:.3g}ns"
+
+
+def run_command(args: argparse.Namespace) -> None:
+    project_dir = args.project.absolute()
+    if not (project_dir / "benchmarks").is_dir():
+        sys.exit(f"{project_dir} has no benchmarks directory")
+
+    benchmarks = discover(project_dir, args.bench)
+    if not benchmarks:
+        sys.exit("no benchmarks match")
+
+    results: T.Dict[str, T.Dict] = {}
+    for bench in benchmarks:
+        for combination in bench.combinations():
+            key = bench.key(combination)
+            stats = bench.run(combination, args.quick)
+            if stats is None:
+                print(f"{key:72} skipped", flush=True)
+                continue
+            results[key] = stats
+            spread = f"{format_time(stats['min'])}..{format_time(stats['max'])}"
+            print(
+                f"{key:72} {format_time(stats['median']):>8}  ({spread})",
+                flush=True,
+            )
+
+    commit = get_commit(project_dir)
+    results_dir = project_dir / "benchmarks" / "results"
+    results_dir.mkdir(exist_ok=True)
+    path = args.output or results_dir / f"{commit}.json"
+
+    # keep results of benchmarks that weren't run this time
+    data: T.Dict[str, T.Any] = {"results": {}}
+    if path.exists() and not args.output:
+        with open(path) as fp:
+            data = json.load(fp)
+    data.update(
+        commit=commit,
+        date=datetime.datetime.now().isoformat(timespec="seconds"),
+        machine=get_machine(),
+        quick=args.quick or data.get("quick", False),
+    )
+    data["results"].update(results)
+
+    with open(path, "w") as fp:
+        json.dump(data, fp, indent=2, sort_keys=True)
+        fp.write("\n")
+    print(f"\nResults saved to {path}")
+
+
+def compare_command(args: argparse.Namespace) -> None:
+    with open(args.old) as fp:
+        old = json.load(fp)
+    with open(args.new) as fp:
+        new = json.load(fp)
+
+    if old.get("machine") != new.get("machine"):
+        print("warning: the results were recorded on different machines\n")
+    if old.get("quick") or new.get("quick"):
+        print("warning: --quick results are a single call, expect noise\n")
+
+    worse = 0
+    print(f"{'':72} {old['commit']:>10} {new['commit']:>10}  ratio")
+    for key in sorted(set(old["results"]) & set(new["results"])):
+        before = old["results"][key]["median"]
+        after = new["results"][key]["median"]
+        ratio = after / before if before else float("inf")
+        mark = ""
+        if ratio > args.factor:
+            mark = "  slower"
+            worse += 1
+        elif ratio < 1 / args.factor:
+            mark = "  faster"
+        print(
+            f"{key:72} {format_time(before):>10} {format_time(after):>10}"
+            f"  {ratio:.2f}{mark}"
+        )
+
+    if worse:
+        print(f"\n{worse} benchmarks are more than {args.factor}x slower")
+        sys.exit(1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command")
+
+    run = sub.add_parser("run", help="run benchmarks (the default)")
+    for p in (parser, run):
+        p.add_argument(
+            "-p",
+            "--project",
+            type=pathlib.Path,
+            default=pathlib.Path("."),
+            help="project whose benchmarks are run (default: current directory)",
+        )
+        p.add_argument("-b", "--bench", help="only run benchmarks matching a regex")
+        p.add_argument(
+            "--quick", action="store_true", help="call each benchmark once"
+        )
+        p.add_argument("-o", "--output", type=pathlib.Path, help="results file")
+
+    compare = sub.add_parser("compare", help="compare two results files")
+    compare.add_argument("old", type=pathlib.Path)
+    compare.add_argument("new", type=pathlib.Path)
+    compare.add_argument(
+        "--factor",
+        type=float,
+        default=1.1,
+        help="report changes larger than this ratio (default 1.1)",
+    )
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        compare_command(args)
+    else:
+        run_command(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+#: modules that registering the build hook must not import, checked by
+#: benchmarks/import_time.py at the root of the repository
+IMPORT_TIME_FORBIDDEN = [
+    "cProfile",
+    "delocate",
+    "json",
+    "pkgconf",
+    "subprocess",
+    "validobj",
+]
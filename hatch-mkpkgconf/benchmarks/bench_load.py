@@ -0,0 +1,140 @@
+"""
+Importing init modules for a chain of shared libraries that each link to
+the previous one, built with the system compiler
+"""
+
+import atexit
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+import tempfile
+import typing as T
+
+import hatch_mkpkgconf
+from hatch_mkpkgconf.load_profile import LOAD_PROFILE_ENV
+from hatch_mkpkgconf.plugin import _write_libinit_py
+
+_tmpdir: T.Optional[pathlib.Path] = None
+_chains: T.Dict[T.Tuple[int, bool], pathlib.Path] = {}
+
+
+def make_chain(depth: int, lazy: bool) -> pathlib.Path:
+    """
+    Builds a package named chain containing libdep0.so .. libdepN.so and
+    their init modules, which are created once per process
+
+    :returns: directory that the package is in
+    """
+    global _tmpdir
+    if (depth, lazy) in _chains:
+        return _chains[(depth, lazy)]
+
+    if not sys.platform.startswith("linux"):
+        # the libraries are linked with ELF sonames
+        raise NotImplementedError
+    cc = os.environ.get("CC") or shutil.which("cc")
+    if cc is None:
+        raise NotImplementedError
+
+    if _tmpdir is None:
+        _tmpdir = pathlib.Path(tempfile.mkdtemp())
+        atexit.register(shutil.rmtree, _tmpdir, True)
+
+    root = _tmpdir / f"chain{depth}{'-lazy' if lazy else ''}"
+    pkgdir = root / "chain"
+    pkgdir.mkdir(parents=True)
+    (pkgdir / "__init__.py").touch()
+
+    environ = dict(os.environ)
+    os.environ["PKG_CONFIG_PATH"] = str(pkgdir)
+    try:
+        for i in range(depth):
+            name = f"dep{i}"
+            lib = pkgdir / f"lib{name}.so"
+            source = root / f"{name}.c"
+            cmd = [cc, "-shared", "-fPIC", f"-Wl,-soname,{lib.name}"]
+            cmd += ["-o", str(lib), str(source)]
+            if i == 0:
+                source.write_text(f"int {name}(void) {{ return 0; }}\n")
+            else:
+                source.write_text(
+                    f"int dep{i - 1}(void);\n"
+                    f"int {name}(void) {{ return dep{i - 1}() + 1; }}\n"
+                )
+                cmd += [f"-L{pkgdir}", f"-ldep{i - 1}"]
+            subprocess.check_call(cmd)
+
+            lines = [
+                "prefix=${pcfiledir}",
+                f"pkgconf_pypi_initpy=chain._init_{name}",
+                "",
+                f"Name: {name}",
+                f"Description: dependency {i}",
+                "Version: 1.0",
+                f"Libs: -L${{prefix}} -l{name}",
+            ]
+            requires = []
+            if i > 0:
+                requires = [f"dep{i - 1}"]
+                lines.append(f"Requires: dep{i - 1}")
+            (pkgdir / f"{name}.pc").write_text("\n".join(lines) + "\n")
+
+            _write_libinit_py(pkgdir / f"_init_{name}.py", [lib], requires, lazy)
+    finally:
+        os.environ.clear()
+        os.environ.update(environ)
+
+    _chains[(depth, lazy)] = root
+    return root
+
+
+class ImportChain:
+    """
+    Libraries can't be unloaded, so each import is in a new interpreter.
+    Compare with time_startup, which is the cost of the interpreter alone.
+    """
+
+    params = ([1, 10, 50], ["eager", "lazy"])
+    param_names = ["depth", "load"]
+
+    def setup(self, depth: int, load: str) -> None:
+        self.root = make_chain(depth, load == "lazy")
+        self.module = f"chain._init_dep{depth - 1}"
+        self.environ = dict(os.environ)
+        self.environ.pop(LOAD_PROFILE_ENV, None)
+        # measure loading rather than compiling the init modules
+        self.environ.pop("PYTHONDONTWRITEBYTECODE", None)
+        self._run(f"import {self.module}")
+
+    def _run(self, code: str, **env: str) -> None:
+        subprocess.run(
+            [sys.executable, "-S", "-c", code],
+            cwd=self.root,
+            env=dict(self.environ, **env),
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+
+    def time_startup(self, depth: int, load: str) -> None:
+        self._run("pass")
+
+    def time_import(self, depth: int, load: str) -> None:
+        # lazy modules don't load anything yet
+        self._run(f"import {self.module}")
+
+    def time_import_loaded(self, depth: int, load: str) -> None:
+        self._run(self._load_code())
+
+    def time_import_profiled(self, depth: int, load: str) -> None:
+        # including the report at exit. The init modules import
+        # hatch_mkpkgconf to record their events
+        src = pathlib.Path(hatch_mkpkgconf.__file__).parent.parent
+        self._run(self._load_code(), PYTHONPATH=str(src), **{LOAD_PROFILE_ENV: "1"})
+
+    def _load_code(self) -> str:
+        return (
+            f"import {self.module} as m\n"
+            "if hasattr(m, 'ensure_loaded'): m.ensure_loaded()"
+        )
@@ -0,0 +1,134 @@
+"""
+Generating .pc files and init modules for packages with long requires chains
+"""
+
+import os
+import pathlib
+import shutil
+import tempfile
+import typing as T
+
+from hatchling.bridge.app import Application
+from hatchling.builders.wheel import WheelBuilder
+
+from hatch_mkpkgconf.pkgconfig import PkgConfig
+from hatch_mkpkgconf.plugin import MkPkgconfHook, _write_libinit_py
+from hatch_mkpkgconf.state import BuildState
+
+
+def make_chain(pcdir: pathlib.Path, n: int) -> T.List[str]:
+    """
+    Writes .pc files for n packages that each require the previous one
+
+    :returns: the package names
+    """
+    names = []
+    for i in range(n):
+        name = f"dep{i}"
+        lines = [
+            "prefix=${pcfiledir}",
+            f"pkgconf_pypi_initpy=deps._init_{name}",
+            "",
+            f"Name: {name}",
+            f"Description: dependency {i}",
+            "Version: 1.0",
+            f"Libs: -L${{prefix}} -l{name}",
+        ]
+        if names:
+            lines.append(f"Requires: {names[-1]}")
+        (pcdir / f"{name}.pc").write_text("\n".join(lines) + "\n")
+        names.append(name)
+    return names
+
+
+class GeneratePcfile:
+    params = [1, 10, 100]
+    param_names = ["requires"]
+
+    def setup(self, requires: int) -> None:
+        self.tmpdir = pathlib.Path(tempfile.mkdtemp())
+        pcdir = self.tmpdir / "pkgconfig"
+        pcdir.mkdir()
+        self.requires = make_chain(pcdir, requires)
+
+        self.environ = dict(os.environ)
+        os.environ["PKG_CONFIG_PATH"] = str(pcdir)
+        os.environ["HATCH_QUIET"] = "1"
+        os.environ["HATCH_MKPKGCONF_INDEX"] = str(self.tmpdir / "pc-index.json")
+
+        root = self.tmpdir / "project"
+        pkgdir = root / "bench"
+        pkgdir.mkdir(parents=True)
+        (pkgdir / "__init__.py").touch()
+        (root / "pyproject.toml").write_text(
+            '[project]\nname = "bench"\nversion = "1.0"\n'
+        )
+
+        pcfile = {
+            "outpath": "bench",
+            "name": "bench",
+            "description": "benchmark",
+            "includedir": "bench/include",
+            "requires": self.requires,
+        }
+        config = {
+            "pcfile": [
+                pcfile,
+                dict(pcfile, name="bench_init", shared_libraries=["bench"]),
+            ]
+        }
+
+        builder = WheelBuilder(str(root), app=Application())
+        self.hook = MkPkgconfHook(
+            str(root),
+            config,
+            builder.config,
+            builder.metadata,
+            str(root / "dist"),
+            "wheel",
+            builder.app,
+        )
+        self.hook.root_pth = root
+        self.pcfg, self.pcfg_init = self.hook._pcfiles
+        self.lib = pkgdir / self.hook._make_shared_lib_fname("bench")
+        self.lib.touch()
+        self.init_py = pkgdir / "_init_bench.py"
+
+        # the state after a build, for a rebuild where nothing changed. The
+        # other benchmarks start from a clean tree
+        state_path = self.tmpdir / "state.json"
+        self.hook._state = BuildState(root, state_path)
+        self.hook._generate_pcfile(self.pcfg_init, {"artifacts": []})
+        self.hook._state.save()
+        self.built_state = BuildState(root, state_path)
+        del self.hook._state
+
+    def teardown(self, requires: int) -> None:
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.tmpdir)
+
+    def time_generate_pcfile(self, requires: int) -> None:
+        self.hook._generate_pcfile(self.pcfg, {"artifacts": []})
+
+    def time_generate_pcfile_with_init(self, requires: int) -> None:
+        self.hook._generate_pcfile(self.pcfg_init, {"artifacts": []})
+
+    def time_generate_pcfile_unchanged(self, requires: int) -> None:
+        self.hook._state = self.built_state
+        self.hook._generate_pcfile(self.pcfg_init, {"artifacts": []})
+        del self.hook._state
+
+    def time_write_libinit_py(self, requires: int) -> None:
+        # lookups are shared with the previous calls, as they are between
+        # the pcfiles of a build
+        _write_libinit_py(self.init_py, [self.lib], self.requires)
+
+    def time_resolve(self, requires: int) -> None:
+        # finding and reading everything again, using the saved index of
+        # entry points
+        PkgConfig().resolve(self.requires)
+
+    def time_write_libinit_py_lazy(self, requires: int) -> None:
+        # also flattens the chain of requires
+        _write_libinit_py(self.init_py, [self.lib], self.requires, lazy=True)
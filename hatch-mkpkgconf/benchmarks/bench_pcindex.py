@@ -0,0 +1,29 @@
+"""
+Finding the .pc files of pkg_config entry points, with and without the
+saved index. The cost of building the index grows with the number of
+distributions in the environment that runs the benchmarks.
+"""
+
+import pathlib
+import shutil
+import tempfile
+
+from hatch_mkpkgconf.pcindex import PcIndex
+
+
+class IndexEntryPoints:
+    def setup(self) -> None:
+        self.tmpdir = pathlib.Path(tempfile.mkdtemp())
+        self.path = self.tmpdir / "pc-index.json"
+        PcIndex.build().save(self.path)
+
+    def teardown(self) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def time_build(self) -> None:
+        # what every lookup did before there was an index
+        PcIndex.build()
+
+    def time_load(self) -> None:
+        # includes checking that the environment hasn't changed
+        PcIndex.load(self.path)
@@ -0,0 +1,51 @@
+"""
+Answering a pkg-config query, which is done once for every dependency()
+in a meson project. A saved answer only has to be checked against the
+mtimes of the .pc files it came from.
+"""
+
+import contextlib
+import io
+import os
+import pathlib
+import shutil
+import tempfile
+
+from hatch_mkpkgconf.query import Query, answer, main
+
+_ARGV = ["--cflags", "--libs", "b"]
+
+
+class AnswerQuery:
+    def setup(self) -> None:
+        self.tmpdir = pathlib.Path(tempfile.mkdtemp())
+        pcdir = self.tmpdir / "pkgconfig"
+        pcdir.mkdir()
+        (pcdir / "a.pc").write_text(
+            "prefix=/opt/a\nName: a\nDescription: a\nVersion: 1.0\n"
+            "Cflags: -I${prefix}/include\nLibs: -L${prefix}/lib -la\n"
+        )
+        (pcdir / "b.pc").write_text(
+            "prefix=/opt/b\nName: b\nDescription: b\nVersion: 1.0\n"
+            "Requires: a >= 1.0\n"
+            "Cflags: -I${prefix}/include\nLibs: -L${prefix}/lib -lb\n"
+        )
+
+        self.environ = dict(os.environ)
+        os.environ["PKG_CONFIG_PATH"] = str(pcdir)
+        os.environ["HATCH_MKPKGCONF_INDEX"] = str(self.tmpdir / "pc-index.json")
+
+        # saves the answer
+        self.time_main_saved()
+
+    def teardown(self) -> None:
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.tmpdir)
+
+    def time_answer(self) -> None:
+        answer(Query.parse(_ARGV))
+
+    def time_main_saved(self) -> None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            main(_ARGV)
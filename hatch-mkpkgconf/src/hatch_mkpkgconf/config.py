@@ -67,6 +67,22 @@ class PcFileConfig:
     the .pc file which will load the shared_libraries
     """
 
+    lazy_load: bool = False
+    """
+    If True, importing the init module does not load the shared_libraries.
+    They are loaded (along with the libraries of everything this package
+    requires, dependencies first) by calling its ensure_loaded() function,
+    or by accessing its lib or libs attributes.
+    """
+
+    dlopen_flags: T.Optional[T.List[str]] = None
+    """
+    Names of the os.RTLD_* flags used to load the shared_libraries, such as
+    ["RTLD_GLOBAL", "RTLD_NODELETE"]. RTLD_LAZY is not allowed, since ctypes
+    always resolves symbols immediately (RTLD_NOW). Defaults to RTLD_GLOBAL
+    on macOS and the ctypes default elsewhere. Ignored on Windows.
+    """
+
     def get_out_path(self) -> pathlib.Path:
         outpath = pathlib.PurePosixPath(self.outpath)
         if outpath.is_absolute():
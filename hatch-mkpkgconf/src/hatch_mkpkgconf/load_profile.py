@@ -0,0 +1,78 @@
+"""
+Records how long the generated init modules take to load their shared
+libraries. Set HATCH_MKPKGCONF_LOAD_PROFILE=1 when running a program, and
+each init module (of any package built with hatch-mkpkgconf) imports this
+module to record its events. They are reported to stderr at exit, or can be
+retrieved with :func:`load_profile`.
+
+Init modules don't depend on hatch-mkpkgconf, so it must be installed in the
+environment being profiled. If it isn't, profiling is skipped with a warning.
+"""
+
+import atexit
+import sys
+import time
+import typing as T
+
+#: set at runtime to profile the loading of init modules
+LOAD_PROFILE_ENV = "HATCH_MKPKGCONF_LOAD_PROFILE"
+
+_profiles: T.List[T.Dict[str, T.Any]] = []
+
+
+def start(module: str) -> T.Dict[str, T.Any]:
+    """
+    Called by an init module when it starts loading
+
+    :returns: the record of the module, which it adds its events to as
+              (kind, name, start, seconds)
+    """
+    profile: T.Dict[str, T.Any] = {
+        "module": module,
+        "started": time.perf_counter(),
+        "events": [],
+    }
+    if not _profiles:
+        atexit.register(report)
+    _profiles.append(profile)
+    return profile
+
+
+def load_profile() -> T.List[T.Dict[str, T.Any]]:
+    """
+    :returns: the records of init modules loaded so far, in the order that
+              they started loading. Each has the module name, when it
+              started (time.perf_counter) and its events: imports of other
+              init modules and dlopen of libraries, as (kind, name, start,
+              seconds).
+    """
+    return list(_profiles)
+
+
+def report() -> None:
+    """Prints a timeline of the events of every init module to stderr"""
+    profiles = load_profile()
+    if not profiles:
+        return
+
+    events = sorted(
+        (start, seconds, kind, name, profile["module"])
+        for profile in profiles
+        for kind, name, start, seconds in profile["events"]
+    )
+    origin = profiles[0]["started"]
+    dlopen = [seconds for _, seconds, kind, _, _ in events if kind == "dlopen"]
+
+    print(f"init module load profile ({LOAD_PROFILE_ENV}):", file=sys.stderr)
+    print(f"  {'start':>10} {'time':>10}  event", file=sys.stderr)
+    for start, seconds, kind, name, module in events:
+        print(
+            f"  {(start - origin) * 1000:8.3f}ms {seconds * 1000:8.3f}ms  "
+            f"{kind} {name} (from {module})",
+            file=sys.stderr,
+        )
+    print(
+        f"  {len(dlopen)} libraries loaded in {sum(dlopen) * 1000:.3f}ms, "
+        f"{len(profiles)} init modules",
+        file=sys.stderr,
+    )
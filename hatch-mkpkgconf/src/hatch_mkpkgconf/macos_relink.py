@@ -34,13 +34,15 @@
 import dataclasses
 from os.path import basename, relpath
 import pathlib
-import shlex
 import site
 import typing as T
 
 from delocate.delocating import filter_system_libs
 from delocate.tools import get_install_names, set_install_name as _set_install_name
-import pkgconf
+
+from .pkgconfig import PkgConfigError, get_pkgconfig
+from .state import BuildState, fingerprint
+from . import tracing
 
 
 @dataclasses.dataclass
@@ -82,7 +84,11 @@ class PackageCache:
 
 
 # def relink_libs(install_root: str, pkg: PkgCfg, pkgcfg: PkgCfgProvider):
-def relink_pkgconf_packages(pkgs: T.List[Package], absolute_ok: bool):
+def relink_pkgconf_packages(
+    pkgs: T.List[Package],
+    absolute_ok: bool,
+    state: T.Optional[BuildState] = None,
+):
     """
     Fix shared libraries for the given pkgconf packages
 
@@ -90,6 +96,8 @@ def relink_pkgconf_packages(pkgs: T.List[Package], absolute_ok: bool):
     :param absolute_ok: If True, requirements will be set to their absolute paths.
                         This should only be used for local development, and not
                         when creating a wheel for distribution
+    :param state: If specified, packages whose libraries and requirements
+                  haven't changed since they were last relinked are skipped
     """
 
     pcache = PackageCache()
@@ -97,7 +105,21 @@ def relink_pkgconf_packages(pkgs: T.List[Package], absolute_ok: bool):
         pcache.add(pkg)
 
     for pkg in pkgs:
-        relink_pkgconf_package(pkg, absolute_ok, pcache)
+        if state is None:
+            relink_pkgconf_package(pkg, absolute_ok, pcache)
+            continue
+
+        # the install names only depend on where the libraries are
+        key = f"relink:{pkg.name}"
+        reqs = [pcache.get(req) for req in pkg.requires or []]
+        inputs = fingerprint(
+            absolute_ok,
+            [(lib.file_path, lib.dist_path) for lib in pkg.shared_libs],
+            [[lib.file_path for lib in req.shared_libs] for req in reqs],
+        )
+        if not state.is_current(key, inputs):
+            relink_pkgconf_package(pkg, absolute_ok, pcache)
+            state.record(key, inputs, [lib.file_path for lib in pkg.shared_libs])
 
 
 def relink_pkgconf_package(pkg: Package, absolute_ok: bool, pcache: PackageCache):
@@ -168,28 +190,29 @@ def set_install_name(file: pathlib.Path, old_install_name: str, new_install_name
     :param new_install_name: new path to dependency
     """
 
-    _set_install_name(str(file), old_install_name, new_install_name)
+    tracer = tracing.get_tracer()
+    with tracer.span("install_name_tool", "subprocess", file=file.name):
+        _set_install_name(str(file), old_install_name, new_install_name)
+    tracer.count("subprocesses")
     print("Relink:", file, ":", old_install_name, "->", new_install_name)
 
 
 def get_package(name: str) -> Package:
     """
-    Queries pkgconf and returns Package information
+    Looks up a pkgconf package and returns Package information
     """
 
-    r = pkgconf.run_pkgconf(name, "--libs-only-L", "--static", capture_output=True)
-    if r.returncode != 0:
-        raise ValueError(f"Could not find pkgconf package '{name}'")
+    try:
+        flags = get_pkgconfig().libs([name], static=True)
+    except PkgConfigError as e:
+        raise ValueError(f"Could not find pkgconf package '{name}'") from e
 
-    libdirs: T.List[pathlib.Path] = []
-    for l in shlex.split(r.stdout.decode("utf-8").strip()):
-        assert l.startswith("-L")
-        libdirs.append(pathlib.Path(l[2:]))
+    libdirs = [pathlib.Path(f[2:]) for f in flags if f.startswith("-L")]
 
     libs = []
-    r = pkgconf.run_pkgconf(name, "--libs-only-l", "--static", capture_output=True)
-    for l in shlex.split(r.stdout.decode("utf-8").strip()):
-        assert l.startswith("-l")
+    for l in flags:
+        if not l.startswith("-l"):
+            continue
         lname = l[2:]
         libname = f"lib{lname}.dylib"
         for ldir in libdirs:
@@ -200,7 +223,7 @@ def get_package(name: str) -> Package:
         else:
             raise ValueError(f"{name}: can't locate lib '{lname}'")
 
-    # don't need to resolve requires since --static does that for us
+    # the libraries of everything it requires are already included
     return Package(name=name, shared_libs=libs, requires=[])
 
 
@@ -226,7 +249,12 @@ def _ensure_dist_paths(pkgs: T.List[Package]):
 
 
 def _iter_install_names(lib_path: pathlib.Path, remap: dict):
-    for install_name in get_install_names(str(lib_path)):
+    tracer = tracing.get_tracer()
+    with tracer.span("otool", "subprocess", file=lib_path.name):
+        install_names = get_install_names(str(lib_path))
+    tracer.count("subprocesses")
+
+    for install_name in install_names:
         resolved = remap.get(basename(install_name))
         if resolved is None:
             if not filter_system_libs(install_name):
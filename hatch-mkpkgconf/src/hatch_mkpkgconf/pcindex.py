@@ -0,0 +1,257 @@
+"""
+A persistent index of the .pc files that pkg_config entry points provide.
+
+Finding those .pc files means reading the metadata of every distribution
+in the environment, which takes a while in environments with hundreds of
+them, and would otherwise be done by every process that looks up a
+package. The index is saved to a file (one per sys.path) and reused until
+the environment changes, which is detected by the mtimes of:
+
+- the sys.path directories, which change when a distribution is
+  installed or removed
+- the dist-info directories of the distributions with entry points
+- the directories that the entry points refer to, which change when a
+  .pc file is added or removed
+
+HATCH_MKPKGCONF_INDEX can be set to the file to use, or to an empty
+string to not save the index.
+"""
+
+import hashlib
+import importlib.machinery
+import json
+import os
+import pathlib
+import sys
+import time
+import typing as T
+
+ENTRY_POINT_GROUP = "pkg_config"
+
+INDEX_ENV = "HATCH_MKPKGCONF_INDEX"
+
+#: index files of other environments that haven't been used for this long
+#: are deleted
+MAX_UNUSED_AGE = 7 * 24 * 60 * 60
+
+_VERSION = 1
+
+
+def _mtime(path: str) -> T.Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class PcIndex:
+    """
+    Maps package names to the .pc files in the directories of pkg_config
+    entry points
+    """
+
+    def __init__(
+        self,
+        packages: T.Dict[str, str],
+        dirs: T.List[str],
+        mtimes: T.Dict[str, T.Optional[int]],
+    ) -> None:
+        #: package name: path of its .pc file
+        self.packages = packages
+
+        #: directories of the entry points, sorted by entry point name
+        self.dirs = dirs
+
+        #: path: mtime_ns of everything that invalidates the index
+        self.mtimes = mtimes
+
+    def find(self, name: str) -> T.Optional[pathlib.Path]:
+        path = self.packages.get(name)
+        return pathlib.Path(path) if path is not None else None
+
+    def is_current(self) -> bool:
+        return all(_mtime(path) == mtime for path, mtime in self.mtimes.items())
+
+    @classmethod
+    def build(cls) -> "PcIndex":
+        """Creates an index from the entry points that are installed"""
+        # importing this is a large part of loading a saved index
+        from importlib.metadata import entry_points
+
+        # taken first, so that anything installed while this runs makes
+        # the index out of date
+        mtimes = {path: _mtime(path) for path in _sys_path()}
+
+        if sys.version_info >= (3, 10):
+            eps = entry_points(group=ENTRY_POINT_GROUP)
+        else:
+            eps = entry_points().get(ENTRY_POINT_GROUP, [])
+
+        packages: T.Dict[str, str] = {}
+        dirs: T.List[str] = []
+        for ep in sorted(eps, key=lambda ep: ep.name):
+            dist_path = getattr(getattr(ep, "dist", None), "_path", None)
+            if dist_path is not None:
+                mtimes[str(dist_path)] = _mtime(str(dist_path))
+
+            d = _entry_point_dir(ep)
+            if d is None or d in dirs:
+                continue
+
+            dirs.append(d)
+            mtimes[d] = _mtime(d)
+            try:
+                names = sorted(os.listdir(d))
+            except OSError:
+                continue
+            for fname in names:
+                if fname.endswith(".pc"):
+                    packages.setdefault(fname[:-3], os.path.join(d, fname))
+
+        return cls(packages, dirs, mtimes)
+
+    @classmethod
+    def load(cls, path: pathlib.Path) -> T.Optional["PcIndex"]:
+        """
+        :returns: the index saved at path, or None if there isn't one or
+                  it is out of date
+        """
+        try:
+            with open(path) as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(data, dict) or data.get("version") != _VERSION:
+            return None
+
+        index = cls(data["packages"], data["dirs"], data["mtimes"])
+        if not index.is_current():
+            return None
+        return index
+
+    def save(self, path: pathlib.Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "version": _VERSION,
+            "packages": self.packages,
+            "dirs": self.dirs,
+            "mtimes": self.mtimes,
+        }
+        # other processes may be saving the same index
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as fp:
+            json.dump(data, fp, sort_keys=True)
+        os.replace(tmp_path, path)
+
+
+def _sys_path() -> T.List[str]:
+    # importlib.metadata treats '' as the current directory
+    return list(dict.fromkeys(os.path.abspath(p or ".") for p in sys.path))
+
+
+def _entry_point_dir(ep) -> T.Optional[str]:
+    """
+    Finds the directory of the package an entry point refers to without
+    importing it
+    """
+    parts = ep.value.split(":")[0].strip().split(".")
+
+    dist = getattr(ep, "dist", None)
+    if dist is not None:
+        try:
+            located = pathlib.Path(dist.locate_file(pathlib.PurePosixPath(*parts)))
+        except (NotImplementedError, TypeError):
+            pass
+        else:
+            if located.is_dir():
+                return str(located)
+
+    # editable installs aren't where the metadata is, so search sys.path
+    search: T.Optional[T.List[str]] = None
+    for i in range(len(parts)):
+        name = ".".join(parts[: i + 1])
+        spec = importlib.machinery.PathFinder.find_spec(name, search)
+        if spec is None or not spec.submodule_search_locations:
+            return None
+        search = list(spec.submodule_search_locations)
+
+    return search[0] if search else None
+
+
+def get_index_path() -> T.Optional[pathlib.Path]:
+    """
+    :returns: where the index for this sys.path is saved, or None if it
+              shouldn't be
+    """
+    env = os.environ.get(INDEX_ENV)
+    if env is not None:
+        return pathlib.Path(env) if env else None
+
+    key = hashlib.sha256("\0".join(_sys_path()).encode("utf-8")).hexdigest()
+    return get_cache_dir() / f"pc-index-{key[:16]}.json"
+
+
+def get_cache_dir() -> pathlib.Path:
+    """
+    :returns: the directory in the user's cache where hatch-mkpkgconf
+              keeps its files
+    """
+    if sys.platform == "win32":
+        cache = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        cache = os.path.expanduser("~/Library/Caches")
+    else:
+        cache = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return pathlib.Path(cache) / "hatch-mkpkgconf"
+
+
+def remove_unused(path: pathlib.Path, pattern: str) -> None:
+    """
+    Deletes the files next to path that match pattern and haven't been
+    modified for MAX_UNUSED_AGE
+    """
+    cutoff = time.time() - MAX_UNUSED_AGE
+    for other in path.parent.glob(pattern):
+        try:
+            if other != path and other.stat().st_mtime < cutoff:
+                other.unlink()
+        except OSError:
+            pass
+
+
+def get_index() -> PcIndex:
+    """
+    :returns: the saved index for this environment, or a new one (which
+              is saved) if it is out of date
+    """
+    from . import tracing
+
+    tracer = tracing.get_tracer()
+    path = get_index_path()
+
+    if path is not None:
+        with tracer.span("load pc index"):
+            index = PcIndex.load(path)
+        if index is not None:
+            # used recently, so that it isn't removed
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return index
+
+    with tracer.span("build pc index"):
+        index = PcIndex.build()
+
+    if path is not None:
+        try:
+            index.save(path)
+            # isolated build environments each have a different sys.path,
+            # so there's a new index for every build
+            remove_unused(path, "pc-index-*.json")
+        except OSError:
+            # a read-only home directory doesn't stop lookups
+            pass
+
+    return index
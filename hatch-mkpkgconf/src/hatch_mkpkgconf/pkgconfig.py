@@ -0,0 +1,453 @@
+"""
+Reads pkg-config .pc files and resolves their dependencies in process, so
+that looking up a package doesn't need a pkgconf subprocess.
+
+Packages are searched for in PKG_CONFIG_PATH, and then in the directories
+of ``pkg_config`` entry points, which is where hatch_mkpkgconf (and
+pkgconf-pypi) packages register their .pc files. Those are looked up in
+an index (see :mod:`.pcindex`). Packages that aren't in any of those, such
+as ones installed by the system, are located by asking pkgconf for their
+path if it is installed.
+"""
+
+import dataclasses
+import os
+import pathlib
+import re
+import shlex
+import typing as T
+
+from . import tracing
+from .pcindex import PcIndex, get_index
+
+_line_re = re.compile(r"([A-Za-z0-9_.]+)\s*([:=])\s*(.*)")
+_variable_re = re.compile(r"\$\$|\$\{([^}]*)\}")
+_requires_re = re.compile(r"<=|>=|!=|[<>=]|[^\s,<>=!]+")
+_version_re = re.compile(r"~|\d+|[a-zA-Z]+")
+
+_comparisons = {
+    "<": lambda c: c < 0,
+    "<=": lambda c: c <= 0,
+    "=": lambda c: c == 0,
+    "!=": lambda c: c != 0,
+    ">=": lambda c: c >= 0,
+    ">": lambda c: c > 0,
+}
+
+
+class PkgConfigError(ValueError):
+    pass
+
+
+@dataclasses.dataclass
+class Requirement:
+    #: name of the required package
+    name: str
+
+    #: comparison operator and version, if the version is constrained
+    op: T.Optional[str] = None
+    version: T.Optional[str] = None
+
+    def matches(self, version: str) -> bool:
+        if self.op is None or self.version is None:
+            return True
+        return _comparisons[self.op](compare_versions(version, self.version))
+
+    def __str__(self) -> str:
+        if self.op is None:
+            return self.name
+        return f"{self.name} {self.op} {self.version}"
+
+
+@dataclasses.dataclass
+class PcFile:
+    """
+    Contents of a .pc file. Values are stored as written, and variables
+    are expanded when they are retrieved.
+    """
+
+    #: name the package was found by, the filename without .pc
+    name: str
+
+    path: pathlib.Path
+
+    #: variable definitions (prefix=...)
+    variables: T.Dict[str, str] = dataclasses.field(default_factory=dict)
+
+    #: fields (Name: ...), with lowercase keys
+    fields: T.Dict[str, str] = dataclasses.field(default_factory=dict)
+
+    def get_variable(self, name: str) -> T.Optional[str]:
+        """
+        :returns: the expanded value of a variable, or None if it isn't defined
+        """
+        if name == "pcfiledir":
+            return str(self.path.parent)
+        value = self.variables.get(name)
+        if value is None:
+            return None
+        return self.expand(value)
+
+    def get_field(self, name: str) -> str:
+        """
+        :returns: the expanded value of a field, or "" if it isn't present
+        """
+        return self.expand(self.fields.get(name.lower(), ""))
+
+    def expand(self, value: str, _seen: T.FrozenSet[str] = frozenset()) -> str:
+        def _replace(m: T.Match) -> str:
+            name = m.group(1)
+            if name is None:
+                return "$"
+            if name in _seen:
+                raise PkgConfigError(f"{self.path}: variable '{name}' refers to itself")
+            if name == "pcfiledir":
+                return str(self.path.parent)
+            # undefined variables are empty, like pkgconf
+            return self.expand(self.variables.get(name, ""), _seen | {name})
+
+        return _variable_re.sub(_replace, value)
+
+    @property
+    def version(self) -> str:
+        return self.get_field("Version")
+
+    @property
+    def requires(self) -> T.List[Requirement]:
+        return parse_requires(self.get_field("Requires"))
+
+    @property
+    def requires_private(self) -> T.List[Requirement]:
+        return parse_requires(self.get_field("Requires.private"))
+
+    def libs(self, static: bool = False) -> T.List[str]:
+        flags = shlex.split(self.get_field("Libs"))
+        if static:
+            flags += shlex.split(self.get_field("Libs.private"))
+        return flags
+
+    def cflags(self) -> T.List[str]:
+        return shlex.split(self.get_field("Cflags"))
+
+
+def read_pc_file(path: pathlib.Path, name: T.Optional[str] = None) -> PcFile:
+    """
+    Parses a .pc file
+
+    :param name: name the package is found by, defaults to the filename
+    """
+    if name is None:
+        name = path.stem
+
+    pc = PcFile(name=name, path=path)
+    with open(path, encoding="utf-8", errors="replace") as fp:
+        text = fp.read()
+
+    # lines ending with a backslash are continued on the next line
+    for line in text.replace("\\\r\n", "").replace("\\\n", "").splitlines():
+        # comments start with an unescaped #
+        idx = line.find("#")
+        while idx > 0 and line[idx - 1] == "\\":
+            line = line[: idx - 1] + line[idx:]
+            idx = line.find("#", idx)
+        if idx != -1:
+            line = line[:idx]
+
+        m = _line_re.match(line.strip())
+        if m is None:
+            continue
+
+        key, sep, value = m.groups()
+        if sep == "=":
+            pc.variables[key] = value.strip()
+        else:
+            pc.fields[key.lower()] = value.strip()
+
+    return pc
+
+
+def parse_requires(value: str) -> T.List[Requirement]:
+    """
+    Parses a Requires field, such as "foo >= 1.0, bar"
+    """
+    reqs: T.List[Requirement] = []
+    tokens = _requires_re.findall(value)
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token in _comparisons:
+            if not reqs or i + 1 == len(tokens):
+                raise PkgConfigError(f"invalid requirement: {value!r}")
+            reqs[-1].op = token
+            reqs[-1].version = tokens[i + 1]
+            i += 2
+        else:
+            reqs.append(Requirement(token))
+            i += 1
+    return reqs
+
+
+def compare_versions(a: str, b: str) -> int:
+    """
+    Compares versions like pkgconf does (rpm's algorithm): runs of digits
+    compare as numbers, runs of letters as strings, numbers are newer than
+    letters, and ~ is older than anything.
+
+    :returns: negative if a is older than b, 0 if equal, positive if newer
+    """
+    if a == b:
+        return 0
+
+    sa = _version_re.findall(a)
+    sb = _version_re.findall(b)
+    for x, y in zip(sa, sb):
+        if x == "~" or y == "~":
+            if x != y:
+                return -1 if x == "~" else 1
+            continue
+
+        if x.isdigit() != y.isdigit():
+            return 1 if x.isdigit() else -1
+
+        if x.isdigit():
+            x, y = int(x), int(y)  # type: ignore
+        if x != y:
+            return -1 if x < y else 1
+
+    if len(sa) == len(sb):
+        return 0
+
+    # the longer one is newer, unless what it has next is a ~
+    n = min(len(sa), len(sb))
+    if len(sa) > len(sb):
+        return -1 if sa[n] == "~" else 1
+    return 1 if sb[n] == "~" else -1
+
+
+def get_search_path() -> T.List[str]:
+    """
+    :returns: the directories in PKG_CONFIG_PATH, followed by the
+              directories of pkg_config entry points
+    """
+    path = _get_env_path()
+    for d in get_index().dirs:
+        if d not in path:
+            path.append(d)
+    return path
+
+
+def _get_env_path() -> T.List[str]:
+    return [p for p in os.environ.get("PKG_CONFIG_PATH", "").split(os.pathsep) if p]
+
+
+class PkgConfig:
+    """
+    Finds packages and resolves their requirements. Results are memoized,
+    so create a new instance (or use :func:`get_pkgconfig`) to see changes
+    to the .pc files.
+    """
+
+    def __init__(
+        self,
+        path: T.Optional[T.Sequence[str]] = None,
+        use_pkgconf: bool = True,
+        defines: T.Optional[T.Dict[str, str]] = None,
+    ) -> None:
+        """
+        :param path: directories to search, defaults to PKG_CONFIG_PATH and
+                     then the .pc files of pkg_config entry points
+        :param use_pkgconf: ask pkgconf where packages that aren't in path are
+        :param defines: variables to override in every package, like
+                        pkg-config's --define-variable
+        """
+        self.index: T.Optional[PcIndex] = None
+        if path is None:
+            self.path = _get_env_path()
+            self.index = get_index()
+        else:
+            self.path = list(path)
+        self.use_pkgconf = use_pkgconf
+        self.defines = defines or {}
+
+        self._packages: T.Dict[str, T.Optional[PcFile]] = {}
+        self._resolved: T.Dict[T.Tuple[T.Tuple[str, ...], bool], T.List[PcFile]] = {}
+
+    def find(self, name: str) -> PcFile:
+        """
+        :raises PkgConfigError: if the package can't be found
+        """
+        if name not in self._packages:
+            self._packages[name] = self._find(name)
+
+        pc = self._packages[name]
+        if pc is None:
+            raise PkgConfigError(f"pkg-config package '{name}' was not found")
+        return pc
+
+    def found(self) -> T.List[PcFile]:
+        """:returns: the packages that have been found so far"""
+        return [pc for pc in self._packages.values() if pc is not None]
+
+    def _find(self, name: str) -> T.Optional[PcFile]:
+        path = self._find_path(name)
+        if path is None:
+            return None
+
+        pc = read_pc_file(path, name)
+        pc.variables.update(self.defines)
+        return pc
+
+    def _find_path(self, name: str) -> T.Optional[pathlib.Path]:
+        fname = f"{name}.pc"
+        for d in self.path:
+            path = pathlib.Path(d) / fname
+            if path.is_file():
+                return path
+
+        if self.index is not None:
+            path = self.index.find(name)
+            if path is not None:
+                return path
+
+        if self.use_pkgconf:
+            return _find_with_pkgconf(name)
+
+        return None
+
+    def resolve(self, names: T.Iterable[str], static: bool = False) -> T.List[PcFile]:
+        """
+        Resolves the whole requires graph of one or more packages
+
+        :param names: packages, optionally with version constraints ("foo >= 1.0")
+        :param static: include Requires.private
+        :returns: every package in the graph once, each before the packages
+                  it requires (the order their libraries are linked in)
+
+        :raises PkgConfigError: if a package can't be found, or a version
+                                constraint isn't met
+        """
+        key = (tuple(names), static)
+        resolved = self._resolved.get(key)
+        if resolved is not None:
+            return resolved
+
+        order: T.List[PcFile] = []
+        visited: T.Set[str] = set()
+
+        def _visit(req: Requirement, parent: T.Optional[PcFile]) -> None:
+            try:
+                pc = self.find(req.name)
+            except PkgConfigError:
+                if parent is None:
+                    raise
+                raise PkgConfigError(
+                    f"pkg-config package '{req.name}', required by "
+                    f"'{parent.name}', was not found"
+                ) from None
+
+            if not req.matches(pc.version):
+                by = f", required by '{parent.name}'," if parent else ""
+                raise PkgConfigError(
+                    f"pkg-config package '{req}'{by} was not found "
+                    f"(version {pc.version} is installed)"
+                )
+
+            if pc.name in visited:
+                return
+            visited.add(pc.name)
+
+            reqs = pc.requires
+            if static:
+                reqs += pc.requires_private
+            for r in reqs:
+                _visit(r, pc)
+
+            order.append(pc)
+
+        for name in key[0]:
+            for req in parse_requires(name):
+                _visit(req, None)
+
+        # post order puts dependencies first
+        resolved = self._resolved[key] = order[::-1]
+        return resolved
+
+    def get_variable(self, name: str, variable: str) -> T.Optional[str]:
+        """
+        :returns: the expanded value of a variable of a package, or None if
+                  it isn't defined
+
+        :raises PkgConfigError: if the package or its requirements can't be found
+        """
+        self.resolve([name])
+        return self.find(name).get_variable(variable)
+
+    def libs(self, names: T.Iterable[str], static: bool = False) -> T.List[str]:
+        """
+        :returns: link flags for the packages and everything they require
+        """
+        flags: T.List[str] = []
+        for pc in self.resolve(names, static):
+            flags += pc.libs(static)
+
+        # a library must be linked after everything that needs it, so keep
+        # the last occurrence of each, and the first of other flags
+        last = {flag: i for i, flag in enumerate(flags)}
+        seen: T.Set[str] = set()
+        kept: T.List[str] = []
+        for i, flag in enumerate(flags):
+            if flag.startswith("-l") and last[flag] != i:
+                continue
+            if flag in seen:
+                continue
+            seen.add(flag)
+            kept.append(flag)
+        return kept
+
+    def cflags(self, names: T.Iterable[str]) -> T.List[str]:
+        """
+        :returns: compiler flags for the packages and everything they
+                  require, including privately
+        """
+        flags: T.List[str] = []
+        for pc in self.resolve(names, static=True):
+            flags += pc.cflags()
+        return _unique(flags)
+
+
+def _unique(items: T.Iterable[str]) -> T.List[str]:
+    return list(dict.fromkeys(items))
+
+
+def _find_with_pkgconf(name: str) -> T.Optional[pathlib.Path]:
+    try:
+        import pkgconf
+    except ImportError:
+        return None
+
+    tracer = tracing.get_tracer()
+    with tracer.span("pkgconf", "subprocess", package=name):
+        r = pkgconf.run_pkgconf("--path", name, capture_output=True)
+    tracer.count("subprocesses")
+    if r.returncode != 0:
+        return None
+
+    lines = r.stdout.decode("utf-8").splitlines()
+    return pathlib.Path(lines[0]) if lines else None
+
+
+_pkgconfig: T.Optional[PkgConfig] = None
+_pkgconfig_env: T.Optional[str] = None
+
+
+def get_pkgconfig() -> PkgConfig:
+    """
+    :returns: a PkgConfig that is shared by the whole process. A new one is
+              created if PKG_CONFIG_PATH changes.
+    """
+    global _pkgconfig, _pkgconfig_env
+    env = os.environ.get("PKG_CONFIG_PATH")
+    if _pkgconfig is None or env != _pkgconfig_env:
+        _pkgconfig = PkgConfig()
+        _pkgconfig_env = env
+    return _pkgconfig
@@ -1,22 +1,27 @@
+import dataclasses
 import functools
 import os
 import pathlib
-import platform
+import sys
 import typing as T
 
 # from hatchling.builders.wheel import WheelBuilder
 from hatchling.builders.hooks.plugin.interface import BuildHookInterface
 
-import pkgconf
-from validobj.validation import parse_input
+from . import tracing
 
-from .config import PcFileConfig
+# hatch imports every installed hook plugin to register it, even for
+# projects that don't use it and for sdists. Keep this module cheap to
+# import: everything else is imported where it is first needed, and
+# benchmarks/import_time.py checks that it stays that way.
+if T.TYPE_CHECKING:
+    from .config import PcFileConfig
+    from .state import BuildState
 
 INITPY_VARNAME = "pkgconf_pypi_initpy"
 
-platform_sys = platform.system()
-is_windows = platform_sys == "Windows"
-is_macos = platform_sys == "Darwin"
+is_windows = sys.platform == "win32"
+is_macos = sys.platform == "darwin"
 
 
 class MkPkgconfHook(BuildHookInterface):
@@ -29,6 +34,22 @@ class MkPkgconfHook(BuildHookInterface):
         if self.target_name != "wheel":
             return
 
+        # HATCH_MKPKGCONF_TRACE=trace.json records where the time goes
+        with tracing.trace("HATCH_MKPKGCONF") as tracer:
+            try:
+                self._initialize(version, build_data)
+            finally:
+                if tracer.enabled:
+                    c = tracer.counters
+                    self.app.display_info(
+                        f"Trace: {tracer.summary()}; "
+                        f"{c.get('pcfiles', 0)} pc files, "
+                        f"{c.get('init modules', 0)} init modules, "
+                        f"{c.get('subprocesses', 0)} subprocesses -> {tracer.path}"
+                    )
+
+    def _initialize(self, version: str, build_data: T.Dict[str, T.Any]) -> None:
+        tracer = tracing.get_tracer()
         self.root_pth = pathlib.Path(self.root)
 
         # hatchling only knows about packages in the wheel builder, so get
@@ -38,14 +59,26 @@ class MkPkgconfHook(BuildHookInterface):
         #     for pkg in WheelBuilder(self.root).config.packages
         # ]
 
-        for pcfg in self._pcfiles:
-            self._generate_pcfile(pcfg, build_data)
+        with tracer.span("pcfiles", "phase"):
+            for pcfg in self._pcfiles:
+                with tracer.span("pcfile", pcfile=pcfg.name):
+                    self._generate_pcfile(pcfg, build_data)
+                tracer.count("pcfiles")
 
         if is_macos:
             is_editable = version == "editable"
-            self._relink_macos_libs(is_editable)
+            with tracer.span("relink", "phase"):
+                self._relink_macos_libs(is_editable)
+
+        try:
+            self._state.save()
+        except OSError as e:
+            # a read-only cache only means that the next build does everything
+            self.app.display_debug(f"Could not save build state: {e}")
 
     def clean(self, versions: T.List[str]) -> None:
+        from .state import get_state_path
+
         root = pathlib.Path(self.root)
         for pcfg in self._pcfiles:
             for relname in (pcfg.get_pc_path(), pcfg.get_init_module_path()):
@@ -53,13 +86,15 @@ class MkPkgconfHook(BuildHookInterface):
                 self.app.display_debug(f"Deleting {fname}")
                 fname.unlink(missing_ok=True)
 
+        get_state_path(root).unlink(missing_ok=True)
+
     def _get_pkg_from_path(self, path: pathlib.Path) -> str:
         rel = path.relative_to(self.root_pth)
         # TODO: this seems right? is it?
         dist_pth = self.build_config.get_distribution_path(str(rel))
         return ".".join(dist_pth.split(os.sep))
 
-    def _generate_pcfile(self, pcfg: PcFileConfig, build_data: T.Dict[str, T.Any]):
+    def _generate_pcfile(self, pcfg: "PcFileConfig", build_data: T.Dict[str, T.Any]):
 
         pcfile_rel = pcfg.get_pc_path()
         pcfile = self.root_pth / pcfile_rel
@@ -95,10 +130,16 @@ class MkPkgconfHook(BuildHookInterface):
             variables.update(variables)
 
         # If there are libraries, generate _init_NAME.py for each
+        lib_paths: T.List[pathlib.Path] = []
+        modules: T.List[str] = []
         if pcfg.shared_libraries:
             package = self._get_pkg_from_path(prefix_path)
             variables[INITPY_VARNAME] = f"{package}.{pcfg.get_init_module()}"
-            self._generate_init_py(pcfg, prefix_path, build_data)
+            lib_paths = self._get_lib_paths(pcfg)
+
+            requires = pcfg.requires or []
+            with tracing.get_tracer().span("resolve requires", requires=len(requires)):
+                modules = _get_requires_modules(requires, flatten=pcfg.lazy_load)
 
             # .. not documented but it works?
             eps = self.metadata.core.entry_points.setdefault("pkg_config", {})
@@ -143,25 +184,48 @@ class MkPkgconfHook(BuildHookInterface):
         if cflags:
             contents.append(f"Cflags: {' '.join(cflags)}")
 
-        self.app.display_info(f"Generating {pcfile}")
+        # Rewriting the files when nothing has changed would cause meson to
+        # reconfigure everything that uses them, so they are only generated
+        # when the inputs have changed, and then only written if different
+        from . import __version__
+        from .state import fingerprint, write_if_changed
+
+        key = f"pcfile:{pcfg.name}"
+        inputs = fingerprint(
+            __version__,
+            sys.platform,
+            dataclasses.asdict(pcfg),
+            self.metadata.version,
+            variables,
+            lib_paths,
+            modules,
+        )
+
+        outputs = [pcfile]
+        if pcfg.shared_libraries:
+            outputs.append(self.root_pth / pcfg.get_init_module_path())
 
-        with open(pcfile, "w") as fp:
-            fp.writelines(f"{line}\n" for line in contents)
+        if self._state.is_current(key, inputs):
+            self.app.display_info(f"{pcfile} is up to date")
+        else:
+            if pcfg.shared_libraries:
+                self._generate_init_py(pcfg, lib_paths)
 
-        build_data["artifacts"].append(pcfile_rel.as_posix())
+            self.app.display_info(f"Generating {pcfile}")
+            if not write_if_changed(pcfile, contents):
+                self.app.display_debug(f"{pcfile} is unchanged")
 
-    def _generate_init_py(
-        self,
-        pcfg: PcFileConfig,
-        prefix_path: pathlib.Path,
-        build_data: T.Dict[str, T.Any],
-    ):
-        libinit_py_rel = pcfg.get_init_module_path()
-        libinit_py = self.root_pth / libinit_py_rel
+            self._state.record(key, inputs, outputs)
 
-        libdir = prefix_path
+        if pcfg.shared_libraries:
+            build_data["artifacts"].append(pcfg.get_init_module_path().as_posix())
+        build_data["artifacts"].append(pcfile_rel.as_posix())
+
+    def _get_lib_paths(self, pcfg: "PcFileConfig") -> T.List[pathlib.Path]:
         if pcfg.libdir:
             libdir = self.root_pth / pathlib.PurePosixPath(pcfg.libdir)
+        else:
+            libdir = self.root_pth / pcfg.get_pc_path().parent
 
         lib_paths = []
         assert pcfg.shared_libraries is not None
@@ -171,14 +235,28 @@ class MkPkgconfHook(BuildHookInterface):
                 raise FileNotFoundError(f"shared library not found: {lib_path}")
             lib_paths.append(lib_path)
 
+        return lib_paths
+
+    def _generate_init_py(self, pcfg: "PcFileConfig", lib_paths: T.List[pathlib.Path]):
+        libinit_py = self.root_pth / pcfg.get_init_module_path()
+
         self.app.display_info(f"Generating {libinit_py}")
         if pcfg.requires:
             requires = pcfg.requires
         else:
             requires = []
 
-        _write_libinit_py(libinit_py, lib_paths, requires)
-        build_data["artifacts"].append(libinit_py_rel.as_posix())
+        with tracing.get_tracer().span("init module", requires=len(requires)):
+            written = _write_libinit_py(
+                libinit_py,
+                lib_paths,
+                requires,
+                lazy=pcfg.lazy_load,
+                dlopen_flags=pcfg.dlopen_flags,
+            )
+        tracing.get_tracer().count("init modules")
+        if not written:
+            self.app.display_debug(f"{libinit_py} is unchanged")
 
     def _make_shared_lib_fname(self, lib: str):
         if is_windows:
@@ -196,14 +274,8 @@ class MkPkgconfHook(BuildHookInterface):
             if pcfg.shared_libraries is None:
                 continue
 
-            if pcfg.libdir:
-                libdir = self.root_pth / pathlib.PurePosixPath(pcfg.libdir)
-            else:
-                libdir = self.root_pth / pcfg.get_pc_path().parent
-
             shared_libs = []
-            for lib in pcfg.shared_libraries:
-                lib_path = libdir / self._make_shared_lib_fname(lib)
+            for lib_path in self._get_lib_paths(pcfg):
                 rel = lib_path.relative_to(self.root_pth)
                 dist_path = pathlib.Path(
                     self.build_config.get_distribution_path(str(rel))
@@ -223,10 +295,20 @@ class MkPkgconfHook(BuildHookInterface):
                 )
             )
 
-        relink_pkgconf_packages(pkgs, is_editable)
+        relink_pkgconf_packages(pkgs, is_editable, self._state)
+
+    @functools.cached_property
+    def _state(self) -> "BuildState":
+        from .state import BuildState
+
+        return BuildState(pathlib.Path(self.root))
 
     @functools.cached_property
-    def _pcfiles(self) -> T.List[PcFileConfig]:
+    def _pcfiles(self) -> T.List["PcFileConfig"]:
+        from validobj.validation import parse_input
+
+        from .config import PcFileConfig
+
         pcfiles = []
         for raw_pc in self.config.get("pcfile", []):
             pcfile = parse_input(raw_pc, PcFileConfig)
@@ -240,6 +322,8 @@ def _write_libinit_py(
     init_py: pathlib.Path,
     libs: T.List[pathlib.Path],
     requires: T.List[str],
+    lazy: bool = False,
+    dlopen_flags: T.Optional[T.List[str]] = None,
 ):
     """
     :param init_py: the _init module for the library(ies) that is written out
@@ -248,7 +332,13 @@ def _write_libinit_py(
 
     :param requires: other pkgconf packages that these libraries depend on.
                      Their init_py will be looked up and imported first.
+    :param lazy: if True, the libraries (and those of everything required)
+                 are loaded by ensure_loaded() instead of on import
+    :param dlopen_flags: names of the os.RTLD_* flags to load the libraries
+                         with (see :data:`DLOPEN_FLAGS`), ignored on Windows
+    :returns: True if the file was written, False if it was already current
     """
+    from .state import write_if_changed
 
     contents = [
         "# This file is automatically generated, DO NOT EDIT",
@@ -256,27 +346,153 @@ def _write_libinit_py(
         "",
     ]
 
+    with tracing.get_tracer().span("resolve requires", requires=len(requires)):
+        modules = _get_requires_modules(requires, flatten=lazy)
+
+    mode = _get_dlopen_mode(dlopen_flags)
+
+    from .load_profile import LOAD_PROFILE_ENV
+
+    contents += _LOAD_PROFILE_PY.format(env=LOAD_PROFILE_ENV).splitlines()
+    contents.append("")
+
+    if lazy:
+        contents += _make_lazy_libinit_py(init_py, libs, modules, mode)
+    else:
+        contents += _make_libinit_py(init_py, libs, modules, mode)
+
+    return write_if_changed(init_py, contents)
+
+
+def _get_requires_modules(requires: T.List[str], flatten: bool) -> T.List[str]:
+    """
+    :param flatten: include the init modules of indirect requirements
+    :returns: init modules of the required packages. If flattened, the
+              modules of dependencies come before their dependents.
+    """
+    from .pkgconfig import PkgConfigError, get_pkgconfig
+
+    pkgconfig = get_pkgconfig()
+
+    found = []
     for req in requires:
-        r = pkgconf.run_pkgconf(
-            req, f"--variable={INITPY_VARNAME}", capture_output=True
-        )
         # TODO: should this be a fatal error
-        if r.returncode == 0:
-            module = r.stdout.decode("utf-8").strip()
-            contents.append(f"import {module}")
+        try:
+            pkgconfig.resolve([req])
+        except PkgConfigError:
+            continue
+        found.append(req)
+
+    if flatten:
+        pcs = reversed(pkgconfig.resolve(found))
+    else:
+        pcs = (pkgconfig.find(req) for req in found)
+
+    modules = []
+    for pc in pcs:
+        module = pc.get_variable(INITPY_VARNAME)
+        if module and module not in modules:
+            modules.append(module)
+    return modules
+
+
+# Added to every init module. The records are kept by
+# hatch_mkpkgconf.load_profile, which is only imported when profiling
+_LOAD_PROFILE_PY = """\
+# Set {env}=1 to record how long loading takes, see
+# hatch_mkpkgconf.load_profile
+from os import environ as __environ
+from time import perf_counter as __perf_counter
+
+__load_profile__ = None
+if __environ.get({env!r}):
+    try:
+        from hatch_mkpkgconf.load_profile import start as __start
+    except ImportError:
+        from sys import stderr as __stderr
+
+        print('{env} is set, but hatch-mkpkgconf is not installed', file=__stderr)
+    else:
+        __load_profile__ = __start(__name__)
 
-    if contents[-1] != "":
-        contents.append("")
+
+def __record(kind, name, start):
+    if __load_profile__ is not None:
+        __load_profile__['events'].append((kind, name, start, __perf_counter() - start))
+"""
+
+
+# ctypes always adds RTLD_NOW, so RTLD_LAZY and RTLD_NOW would do nothing
+DLOPEN_FLAGS = (
+    "RTLD_GLOBAL",
+    "RTLD_LOCAL",
+    "RTLD_NODELETE",
+    "RTLD_NOLOAD",
+    "RTLD_DEEPBIND",
+)
+
+
+def _get_dlopen_mode(dlopen_flags: T.Optional[T.List[str]]) -> T.Optional[str]:
+    """
+    :returns: expression for the dlopen mode, or None for ctypes' default
+    """
+    if is_windows:
+        return None
+
+    if dlopen_flags is None:
+        return "RTLD_GLOBAL" if is_macos else None
+
+    for flag in dlopen_flags:
+        if flag in ("RTLD_LAZY", "RTLD_NOW"):
+            raise ValueError(
+                f"dlopen_flags: {flag} has no effect, ctypes always uses RTLD_NOW"
+            )
+        if flag not in DLOPEN_FLAGS:
+            raise ValueError(
+                f"dlopen_flags must be some of {', '.join(DLOPEN_FLAGS)} (got {flag})"
+            )
+        if not hasattr(os, flag):
+            raise ValueError(f"dlopen_flags: {flag} is not available on this platform")
+
+    return " | ".join(f"os.{flag}" for flag in dlopen_flags) or "0"
+
+
+def _make_libinit_py(
+    init_py: pathlib.Path,
+    libs: T.List[pathlib.Path],
+    modules: T.List[str],
+    mode: T.Optional[str],
+) -> T.List[str]:
+    contents = []
+    for module in modules:
+        contents += [
+            "__t = __perf_counter()",
+            f"import {module}",
+            f"__record('import', {module!r}, __t)",
+        ]
+
+    if contents:
+        # requirements that are lazily loaded must be loaded before these
+        # libraries, since importing them doesn't do it
+        contents += [
+            "",
+            f"for __module in ({', '.join(modules)},):",
+            "    if hasattr(__module, 'ensure_loaded'):",
+            "        __module.ensure_loaded()",
+            "",
+        ]
 
     contents += [
         "def __load_library():",
         "    from os.path import abspath, join, dirname, exists",
     ]
 
-    if is_macos:
+    if mode is None:
+        contents += ["    from ctypes import cdll", ""]
+    elif mode == "RTLD_GLOBAL":
         contents += ["    from ctypes import CDLL, RTLD_GLOBAL"]
     else:
-        contents += ["    from ctypes import cdll", ""]
+        contents += ["    from ctypes import CDLL", "    import os", ""]
 
     for lib in libs:
         rel = lib.relative_to(init_py.parent)
@@ -289,27 +505,129 @@ def _write_libinit_py(
             "    try:",
         ]
 
-        if is_macos:
-            contents.append(f"        return CDLL(lib_path, mode=RTLD_GLOBAL)")
-        else:
+        if mode is None:
             contents.append(f"        return cdll.LoadLibrary(lib_path)")
+        else:
+            contents.append(f"        return CDLL(lib_path, mode={mode})")
 
         contents += [
             "    except FileNotFoundError:",
             f"        if not exists(lib_path):",
             f'            raise FileNotFoundError("{lib.name} was not found on your system. Is this package correctly installed?")',
+            f"        {_load_error(lib)}",
         ]
 
-        if is_windows:
-            contents.append(
-                f'        raise Exception("{lib.name} could not be loaded. Do you have Visual Studio C++ Redistributible installed?")'
-            )
-        else:
-            contents.append(
-                f'        raise FileNotFoundError("{lib.name} could not be loaded. There is a missing dependency.")'
-            )
+        contents += [
+            "",
+            "__t = __perf_counter()",
+            "__lib = __load_library()",
+            f"__record('dlopen', {lib.name!r}, __t)",
+            "",
+        ]
 
-        contents += ["", "__lib = __load_library()", ""]
+    return contents
+
+
+def _make_lazy_libinit_py(
+    init_py: pathlib.Path,
+    libs: T.List[pathlib.Path],
+    modules: T.List[str],
+    mode: T.Optional[str],
+) -> T.List[str]:
+    contents = [
+        "# The shared libraries are loaded by ensure_loaded(), or when lib or",
+        "# libs is first used",
+        "",
+    ]
 
-    with open(init_py, "w") as fp:
-        fp.writelines(f"{line}\n" for line in contents)
+    if mode is not None:
+        contents += ["import os", ""]
+
+    contents += ["# init modules of everything this requires, dependencies first"]
+    contents += ["_requires = ["]
+    contents += [f"    {module!r}," for module in modules]
+    contents += ["]", ""]
+
+    contents += ["# shared libraries of this package, relative to this file"]
+    contents += ["_libraries = ["]
+    for lib in libs:
+        rel = lib.relative_to(init_py.parent)
+        contents.append(f"    {rel.parts!r},")
+    contents += ["]", ""]
+
+    contents += [
+        "_loaded = None",
+        "",
+        "",
+        "def _load_libraries():",
+        '    """Loads the shared libraries of this package, but not its requirements"""',
+        "    global _loaded",
+        "    if _loaded is None:",
+        "        from ctypes import CDLL",
+        "        from os.path import abspath, join, dirname, exists",
+        "",
+        "        root = abspath(dirname(__file__))",
+        "        loaded = []",
+        "        for parts in _libraries:",
+        "            lib_path = join(root, *parts)",
+        "            start = __perf_counter()",
+        "            try:",
+    ]
+
+    if mode is None:
+        contents.append("                loaded.append(CDLL(lib_path))")
+    else:
+        contents.append(f"                loaded.append(CDLL(lib_path, mode={mode}))")
+
+    contents += [
+        "            except FileNotFoundError:",
+        "                if not exists(lib_path):",
+        '                    raise FileNotFoundError(f"{parts[-1]} was not found on your system. Is this package correctly installed?")',
+        f"                {_load_error(None)}",
+        "            __record('dlopen', parts[-1], start)",
+        "        _loaded = loaded",
+        "    return _loaded",
+        "",
+        "",
+        "def ensure_loaded():",
+        '    """Loads the shared libraries of this package and everything it requires"""',
+        "    if _loaded is None:",
+        "        from importlib import import_module",
+        "",
+        "        for name in _requires:",
+        "            # lazy modules only load their own libraries here, since",
+        "            # their requirements are in this list too. Other modules",
+        "            # loaded everything when they were imported",
+        "            start = __perf_counter()",
+        "            module = import_module(name)",
+        "            __record('import', name, start)",
+        "            load = getattr(module, '_load_libraries', None)",
+        "            if load is not None:",
+        "                load()",
+        "",
+        "        _load_libraries()",
+        "",
+        "",
+        "def __getattr__(name):",
+        "    if name == 'lib':",
+        "        ensure_loaded()",
+        "        return _loaded[0]",
+        "    elif name == 'libs':",
+        "        ensure_loaded()",
+        "        return list(_loaded)",
+        '    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")',
+    ]
+
+    return contents
+
+
+def _load_error(lib: T.Optional[pathlib.Path]) -> str:
+    """
+    :returns: raise statement for a library that exists but can't be loaded
+    """
+    name = lib.name if lib is not None else "{parts[-1]}"
+    prefix = "f" if lib is None else ""
+    if is_windows:
+        return f'raise Exception({prefix}"{name} could not be loaded. Do you have Visual Studio C++ Redistributible installed?")'
+    else:
+        return f'raise FileNotFoundError({prefix}"{name} could not be loaded. There is a missing dependency.")'
@@ -0,0 +1,335 @@
+"""
+A pkg-config compatible command, which answers queries with the resolver
+in :mod:`.pkgconfig` instead of running pkgconf. Answers are saved, and
+reused until one of the .pc files they came from (or the directories that
+were searched) changes, so a repeated query only costs starting python.
+
+Point meson (or anything else that runs pkg-config) at it::
+
+    PKG_CONFIG=hatch-mkpkgconf-pkg-config meson setup build
+
+Queries it doesn't support (such as --list-all) are passed to pkgconf,
+with PKG_CONFIG_PATH set to include the pkg_config entry points.
+"""
+
+# This runs once for every query, so only what is needed to answer from the
+# saved results is imported up front
+
+import json
+import os
+import pathlib
+import sys
+import typing as T
+
+from .pcindex import get_index_path
+
+#: version of pkg-config that this behaves like, for tools that check it
+PKG_CONFIG_VERSION = "0.29.2"
+
+#: saved answers beyond this many are discarded, oldest first
+MAX_SAVED_QUERIES = 1000
+
+_VERSION = 1
+
+#: options that select what is printed, in the order pkg-config prints them
+_OUTPUTS = [
+    "--cflags",
+    "--cflags-only-I",
+    "--cflags-only-other",
+    "--libs",
+    "--libs-only-L",
+    "--libs-only-l",
+    "--libs-only-other",
+]
+
+_FLAGS = {
+    *_OUTPUTS,
+    "--modversion",
+    "--exists",
+    "--static",
+    "--print-errors",
+    "--short-errors",
+    "--silence-errors",
+    "--keep-system-cflags",
+    "--keep-system-libs",
+}
+
+#: default system directories, whose flags are left out like pkgconf does
+_SYSTEM_INCLUDE_PATH = ["/usr/include"]
+_SYSTEM_LIBRARY_PATH = ["/usr/lib", "/lib", "/usr/lib64", "/lib64"]
+
+
+class Query:
+    """A parsed pkg-config command line"""
+
+    def __init__(self) -> None:
+        self.flags: T.Set[str] = set()
+        self.variable: T.Optional[str] = None
+        self.defines: T.Dict[str, str] = {}
+
+        #: package names and version constraints ("foo", ">=", "1.0")
+        self.packages: T.List[str] = []
+
+    @classmethod
+    def parse(cls, argv: T.List[str]) -> T.Optional["Query"]:
+        """
+        :returns: the query, or None if it uses options that aren't
+                  supported here
+        """
+        query = cls()
+        args = iter(argv)
+        for arg in args:
+            if not arg.startswith("--"):
+                query.packages.append(arg)
+                continue
+
+            opt, eq, value = arg.partition("=")
+            if opt in ("--variable", "--define-variable"):
+                if not eq:
+                    value = next(args, "")
+                if opt == "--variable":
+                    query.variable = value
+                else:
+                    name, eq, value = value.partition("=")
+                    if not eq:
+                        return None
+                    query.defines[name] = value
+            elif arg in _FLAGS:
+                query.flags.add(arg)
+            else:
+                return None
+
+        if not query.packages:
+            return None
+        return query
+
+
+def answer(query: Query) -> T.Tuple[int, str, str, T.Dict[str, T.Optional[int]]]:
+    """
+    :returns: exit status, stdout, stderr, and the mtimes of the files and
+              directories that the answer depends on
+    """
+    from .pkgconfig import PkgConfig, PkgConfigError, parse_requires
+
+    pkgconfig = PkgConfig(defines=query.defines)
+    spec = " ".join(query.packages)
+    static = "--static" in query.flags
+
+    lines = []
+    try:
+        pkgconfig.resolve([spec], static)
+
+        if "--modversion" in query.flags:
+            for req in parse_requires(spec):
+                lines.append(pkgconfig.find(req.name).version)
+
+        if query.variable is not None:
+            values = []
+            for req in parse_requires(spec):
+                values.append(pkgconfig.find(req.name).get_variable(query.variable))
+            lines.append(" ".join(v for v in values if v))
+
+        flags = []
+        outputs = [o for o in _OUTPUTS if o in query.flags]
+        if any(o.startswith("--cflags") for o in outputs):
+            cflags = _remove_system_dirs(
+                pkgconfig.cflags([spec]),
+                "-I",
+                "PKG_CONFIG_ALLOW_SYSTEM_CFLAGS",
+                "--keep-system-cflags" in query.flags,
+                "PKG_CONFIG_SYSTEM_INCLUDE_PATH",
+                _SYSTEM_INCLUDE_PATH,
+            )
+            flags += _select(cflags, outputs, "--cflags", {"-I": "I"})
+        if any(o.startswith("--libs") for o in outputs):
+            libs = _remove_system_dirs(
+                pkgconfig.libs([spec], static),
+                "-L",
+                "PKG_CONFIG_ALLOW_SYSTEM_LIBS",
+                "--keep-system-libs" in query.flags,
+                "PKG_CONFIG_SYSTEM_LIBRARY_PATH",
+                _SYSTEM_LIBRARY_PATH,
+            )
+            flags += _select(libs, outputs, "--libs", {"-L": "L", "-l": "l"})
+        if outputs:
+            lines.append(" ".join(flags))
+
+    except PkgConfigError as e:
+        errors = "--print-errors" in query.flags
+        if "--exists" not in query.flags:
+            errors = "--silence-errors" not in query.flags
+        return 1, "", f"{e}\n" if errors else "", {}
+
+    # the answer changes if any of the .pc files change, or if a .pc file
+    # that takes precedence over one of them is added
+    depends: T.Dict[str, T.Optional[int]] = {}
+    for pc in pkgconfig.found():
+        depends[str(pc.path)] = _mtime(str(pc.path))
+    for d in pkgconfig.path:
+        depends[d] = _mtime(d)
+    if pkgconfig.index is not None:
+        depends.update(pkgconfig.index.mtimes)
+
+    stdout = "".join(f"{line}\n" for line in lines)
+    return 0, stdout, "", depends
+
+
+def _select(
+    flags: T.List[str], outputs: T.List[str], option: str, kinds: T.Dict[str, str]
+) -> T.List[str]:
+    """
+    :param kinds: flag prefix: the suffix of the --option-only-X that
+                  selects those flags
+    """
+    if option in outputs:
+        return flags
+
+    selected = []
+    for flag in flags:
+        kind = kinds.get(flag[:2], "other")
+        if f"{option}-only-{kind}" in outputs:
+            selected.append(flag)
+    return selected
+
+
+def _remove_system_dirs(
+    flags: T.List[str],
+    prefix: str,
+    allow_env: str,
+    keep: bool,
+    path_env: str,
+    default_path: T.List[str],
+) -> T.List[str]:
+    if keep or os.environ.get(allow_env):
+        return flags
+
+    path = os.environ.get(path_env)
+    system = path.split(os.pathsep) if path else default_path
+    exclude = {os.path.normpath(d) for d in system if d}
+    return [
+        f
+        for f in flags
+        if not f.startswith(prefix) or os.path.normpath(f[2:]) not in exclude
+    ]
+
+
+def _mtime(path: str) -> T.Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class SavedQueries:
+    """
+    Answers of previous queries. An answer is used again when the query and
+    the PKG_CONFIG_* environment variables are the same, and the files and
+    directories that it depended on have the same mtimes.
+    """
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        self._queries: T.Dict[str, T.Dict[str, T.Any]] = {}
+
+        try:
+            with open(path) as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            pass
+        else:
+            if isinstance(data, dict) and data.get("version") == _VERSION:
+                self._queries = data["queries"]
+
+    @staticmethod
+    def key(argv: T.List[str]) -> str:
+        env = {k: v for k, v in os.environ.items() if k.startswith("PKG_CONFIG")}
+        return json.dumps([argv, env], sort_keys=True)
+
+    def get(self, key: str) -> T.Optional[str]:
+        """:returns: the saved stdout of the query"""
+        entry = self._queries.get(key)
+        if entry is None:
+            return None
+        for path, mtime in entry["depends"].items():
+            if _mtime(path) != mtime:
+                return None
+        return entry["stdout"]
+
+    def put(self, key: str, stdout: str, depends: T.Dict[str, T.Optional[int]]):
+        self._queries.pop(key, None)
+        self._queries[key] = {"stdout": stdout, "depends": depends}
+        for old in list(self._queries)[:-MAX_SAVED_QUERIES]:
+            del self._queries[old]
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # meson may run several queries at once
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as fp:
+            json.dump({"version": _VERSION, "queries": self._queries}, fp)
+        os.replace(tmp_path, self.path)
+
+
+def get_saved_queries_path() -> T.Optional[pathlib.Path]:
+    """:returns: where answers are saved, next to the pc index"""
+    index_path = get_index_path()
+    if index_path is None:
+        return None
+    return index_path.with_name(f"{index_path.stem}-queries.json")
+
+
+def run_pkgconf(argv: T.List[str]) -> int:
+    """Runs pkgconf, which also finds the packages of entry points"""
+    import subprocess
+
+    from .pkgconfig import get_search_path
+
+    try:
+        import pkgconf
+
+        executable = str(pkgconf.get_executable())
+    except (ImportError, RuntimeError) as e:
+        print(f"pkgconf is needed for {' '.join(argv)}: {e}", file=sys.stderr)
+        return 1
+
+    env = dict(os.environ)
+    env["PKG_CONFIG_PATH"] = os.pathsep.join(get_search_path())
+    return subprocess.call([executable, *argv], env=env)
+
+
+def main(argv: T.Optional[T.List[str]] = None) -> int:
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if argv == ["--version"]:
+        print(PKG_CONFIG_VERSION)
+        return 0
+
+    query = Query.parse(argv)
+    if query is None:
+        return run_pkgconf(argv)
+
+    path = get_saved_queries_path()
+    saved = SavedQueries(path) if path is not None else None
+    key = SavedQueries.key(argv)
+
+    stdout = saved.get(key) if saved is not None else None
+    if stdout is None:
+        status, stdout, stderr, depends = answer(query)
+        sys.stderr.write(stderr)
+        if status != 0:
+            return status
+
+        if saved is not None:
+            saved.put(key, stdout, depends)
+            try:
+                saved.save()
+            except OSError:
+                pass
+
+    sys.stdout.write(stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import pathlib
+import typing as T
+
+from .pcindex import get_cache_dir, remove_unused
+
+
+def fingerprint(*inputs: T.Any) -> str:
+    """
+    :param inputs: anything that json can serialize, paths are converted
+                   to strings
+    :returns: a digest that changes when any of the inputs change
+    """
+    data = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def write_if_changed(path: pathlib.Path, contents: T.List[str]) -> bool:
+    """
+    Writes each line of contents to path, unless the file already has
+    that content. Leaving it alone keeps its mtime, so that things that
+    depend on it (such as meson) aren't reconfigured.
+
+    :returns: True if the file was written
+    """
+    data = "".join(f"{line}\n" for line in contents)
+    try:
+        with open(path) as fp:
+            if fp.read() == data:
+                return False
+    except (OSError, ValueError):
+        pass
+
+    with open(path, "w") as fp:
+        fp.write(data)
+    return True
+
+
+class BuildState:
+    """
+    Records a fingerprint of the inputs of each step of the build, and the
+    files that the step produced, so that a rebuild can skip steps whose
+    inputs have not changed.
+
+    A step is current when its fingerprint matches what was recorded, and
+    each of its files has the same size and mtime that it had afterwards.
+
+    The state is saved in the user's cache rather than the project, so
+    that it doesn't end up in sdists or show up as an untracked file.
+    """
+
+    def __init__(
+        self, root: pathlib.Path, path: T.Optional[pathlib.Path] = None
+    ) -> None:
+        """
+        :param root: the project directory, which recorded files are
+                     relative to
+        :param path: where the state is saved, defaults to
+                     :func:`get_state_path`
+        """
+        self.root = root
+        self.path = path if path is not None else get_state_path(root)
+
+        self._current: T.Dict[str, T.Dict[str, T.Any]] = {}
+        self._previous: T.Dict[str, T.Dict[str, T.Any]] = {}
+
+        try:
+            with open(self.path) as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            pass
+        else:
+            if isinstance(data, dict) and data.get("version") == 1:
+                self._previous = data["steps"]
+
+    def is_current(self, key: str, fingerprint: str) -> bool:
+        """
+        :returns: True if the step called key has already been done with
+                  inputs that have this fingerprint
+        """
+        entry = self._previous.get(key)
+        if entry is None or entry["fingerprint"] != fingerprint:
+            return False
+
+        for name, (size, mtime_ns) in entry["files"].items():
+            try:
+                st = (self.root / pathlib.PurePosixPath(name)).stat()
+            except FileNotFoundError:
+                return False
+            if st.st_size != size or st.st_mtime_ns != mtime_ns:
+                return False
+
+        self._current[key] = entry
+        return True
+
+    def record(
+        self, key: str, fingerprint: str, files: T.Iterable[pathlib.Path]
+    ) -> None:
+        """Records that the step called key produced files"""
+        stats = {}
+        for path in files:
+            st = path.stat()
+            stats[path.relative_to(self.root).as_posix()] = [
+                st.st_size,
+                st.st_mtime_ns,
+            ]
+        self._current[key] = {"fingerprint": fingerprint, "files": stats}
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # other processes may be building the same project
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as fp:
+            json.dump({"version": 1, "steps": self._current}, fp, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+        # the state of projects that have been deleted or moved
+        remove_unused(self.path, "state-*.json")
+
+
+def get_state_path(root: pathlib.Path) -> pathlib.Path:
+    """
+    :returns: where the build state of the project in root is saved
+    """
+    key = hashlib.sha256(str(root.absolute()).encode("utf-8")).hexdigest()
+    return get_cache_dir() / f"state-{key[:16]}.json"
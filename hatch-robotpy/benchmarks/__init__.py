@@ -0,0 +1,16 @@
+#: modules that registering the build hook must not import, checked by
+#: benchmarks/import_time.py at the root of the repository
+IMPORT_TIME_FORBIDDEN = [
+    "concurrent.futures",
+    "cProfile",
+    "json",
+    "subprocess",
+    "tempfile",
+    "tomllib",
+    "tomli",
+    "urllib.request",
+    "uuid",
+    "validobj",
+    "zipfile",
+    "zlib",
+]
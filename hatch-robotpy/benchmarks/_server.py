@@ -0,0 +1,133 @@
+"""
+Local HTTP server that simulates the latency and bandwidth of a real one
+"""
+
+import collections
+import hashlib
+import http.server
+import threading
+import time
+import typing as T
+
+#: name: (seconds of latency per request, bytes per second or None)
+NETWORKS = {
+    "local": (0.0, None),
+    "lan": (0.001, 100_000_000),
+    "wan": (0.03, 20_000_000),
+}
+
+#: bytes sent between bandwidth checks
+_CHUNK_SIZE = 64 * 1024
+
+
+class ThrottledServer:
+    """
+    Serves content for any path that ends with one of the names in files,
+    so that each request can use a distinct URL (and miss the cache). Other
+    paths are not found. Every response is delayed by the latency, and
+    bodies are sent no faster than the bandwidth.
+
+    The connections that were accepted and the requests for each path are
+    counted, so that tests can check how the server was used.
+    """
+
+    def __init__(
+        self,
+        files: T.Dict[str, bytes],
+        latency: float = 0.0,
+        bandwidth: T.Optional[int] = None,
+    ) -> None:
+        self.files = files
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.etags = {
+            name: f'"{hashlib.sha256(data).hexdigest()[:16]}"'
+            for name, data in files.items()
+        }
+
+        self._lock = threading.Lock()
+
+        #: number of connections accepted
+        self.connections = 0
+
+        #: path: number of requests for it
+        self.requests: T.Counter[str] = collections.Counter()
+
+        server = self
+
+        class HTTPServer(http.server.ThreadingHTTPServer):
+            def get_request(self):
+                request = super().get_request()
+                with server._lock:
+                    server.connections += 1
+                return request
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:
+                server._handle(self, body=True)
+
+            def do_HEAD(self) -> None:
+                server._handle(self, body=False)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self._httpd = HTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _handle(self, req: http.server.BaseHTTPRequestHandler, body: bool) -> None:
+        with self._lock:
+            self.requests[req.path] += 1
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        name = req.path.rsplit("/", 1)[-1]
+        data = self.files.get(name)
+        if data is None:
+            req.send_response(404)
+            req.send_header("Content-Length", "0")
+            req.end_headers()
+            return
+
+        etag = self.etags[name]
+        if req.headers.get("If-None-Match") == etag:
+            req.send_response(304)
+            req.send_header("ETag", etag)
+            req.send_header("Content-Length", "0")
+            req.end_headers()
+            return
+
+        req.send_response(200)
+        req.send_header("ETag", etag)
+        req.send_header("Content-Length", str(len(data)))
+        req.end_headers()
+        if not body:
+            return
+
+        if self.bandwidth is None:
+            req.wfile.write(data)
+            return
+
+        view = memoryview(data)
+        start = time.perf_counter()
+        for offset in range(0, len(data), _CHUNK_SIZE):
+            req.wfile.write(view[offset : offset + _CHUNK_SIZE])
+            ahead = (offset + _CHUNK_SIZE) / self.bandwidth
+            ahead -= time.perf_counter() - start
+            if ahead > 0:
+                time.sleep(ahead)
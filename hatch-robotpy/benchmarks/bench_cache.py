@@ -0,0 +1,40 @@
+"""
+ArtifactCache lookups in caches with many entries
+"""
+
+import os
+import pathlib
+import shutil
+import tempfile
+
+from hatch_robotpy.cache import ArtifactCache
+
+
+class CacheLookup:
+    params = [10, 2000]
+    param_names = ["entries"]
+    timeout = 300
+
+    def setup(self, entries: int) -> None:
+        self.tmpdir = pathlib.Path(tempfile.mkdtemp())
+        self.cache = ArtifactCache(self.tmpdir / "cache")
+        for i in range(entries):
+            tmp_path = self.tmpdir / "download"
+            data = os.urandom(64)
+            tmp_path.write_bytes(data)
+            self.cache.store(
+                f"https://example.com/{i}/artifact.zip",
+                tmp_path,
+                f"{i:064x}",
+                len(data),
+            )
+        self.url = "https://example.com/0/artifact.zip"
+
+    def teardown(self, entries: int) -> None:
+        shutil.rmtree(self.tmpdir)
+
+    def time_contains(self, entries: int) -> None:
+        self.cache.contains(self.url)
+
+    def time_lookup(self, entries: int) -> None:
+        self.cache.lookup(self.url)
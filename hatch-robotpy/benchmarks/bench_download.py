@@ -0,0 +1,58 @@
+"""
+download_file against a local server with simulated latency and bandwidth
+"""
+
+import hashlib
+import itertools
+import os
+import pathlib
+import shutil
+import tempfile
+
+from hatch_robotpy.cache import ArtifactCache
+from hatch_robotpy.download import download_file
+
+from ._server import NETWORKS, ThrottledServer
+
+
+class DownloadFile:
+    params = ([1024 * 1024, 16 * 1024 * 1024], list(NETWORKS))
+    param_names = ["size", "network"]
+    timeout = 300
+
+    def setup(self, size: int, network: str) -> None:
+        data = os.urandom(size)
+        self.sha256 = hashlib.sha256(data).hexdigest()
+
+        latency, bandwidth = NETWORKS[network]
+        self.server = ThrottledServer({"artifact.zip": data}, latency, bandwidth)
+        self.server.start()
+
+        self.tmpdir = pathlib.Path(tempfile.mkdtemp())
+        self.cache = ArtifactCache(self.tmpdir / "cache")
+        self.cached_url = f"{self.server.url}/cached/artifact.zip"
+        download_file(self.cached_url, self.cache)
+
+        # each download uses a new URL so that it isn't in the cache. The
+        # content is the same, so the cache only stores it once
+        self.counter = itertools.count()
+
+    def teardown(self, size: int, network: str) -> None:
+        self.server.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def _new_url(self) -> str:
+        return f"{self.server.url}/{next(self.counter)}/artifact.zip"
+
+    def time_download(self, size: int, network: str) -> None:
+        # also looks for a published checksum, which isn't there
+        download_file(self._new_url(), self.cache)
+
+    def time_download_pinned(self, size: int, network: str) -> None:
+        download_file(self._new_url(), self.cache, sha256=self.sha256)
+
+    def time_cached(self, size: int, network: str) -> None:
+        download_file(self.cached_url, self.cache)
+
+    def time_revalidate(self, size: int, network: str) -> None:
+        download_file(self.cached_url, self.cache, revalidate=True)
@@ -0,0 +1,91 @@
+"""
+extract_zip on synthetic archives
+"""
+
+import atexit
+import os
+import pathlib
+import shutil
+import tempfile
+import typing as T
+import zipfile
+
+from hatch_robotpy.download import ExtractManifest, extract_zip
+
+_tmpdir: T.Optional[pathlib.Path] = None
+_archives: T.Dict[int, pathlib.Path] = {}
+
+
+def make_archive(members: int) -> pathlib.Path:
+    """
+    Creates an archive like the ones on maven: lots of small headers that
+    are deflated, and some binaries that are stored. Archives are only
+    created once per process.
+    """
+    global _tmpdir
+    if members in _archives:
+        return _archives[members]
+
+    if _tmpdir is None:
+        _tmpdir = pathlib.Path(tempfile.mkdtemp())
+        atexit.register(shutil.rmtree, _tmpdir, True)
+
+    path = _tmpdir / f"archive{members}.zip"
+    header = b"#pragma once\n\nint function(int argument);\n" * 20
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("include/", b"")
+        for i in range(min(members, 100)):
+            z.writestr(f"include/d{i}/", b"")
+        for name in member_names(members):
+            if name.endswith(".so"):
+                z.writestr(name, os.urandom(4096), zipfile.ZIP_STORED)
+            else:
+                z.writestr(name, header, zipfile.ZIP_DEFLATED)
+
+    _archives[members] = path
+    return path
+
+
+def member_names(members: int) -> T.List[str]:
+    return [
+        f"include/d{i % 100}/lib{i}.so" if i % 10 == 0 else f"include/d{i % 100}/h{i}.h"
+        for i in range(members)
+    ]
+
+
+class ExtractZip:
+    params = ([10, 1000, 100_000], ["directory", "files"])
+    param_names = ["members", "mapping"]
+    repeat = (1, 5, 30.0)
+    timeout = 600
+
+    def setup(self, members: int, mapping: str) -> None:
+        self.archive = make_archive(members)
+        self.out = pathlib.Path(tempfile.mkdtemp())
+        manifest_path = self.out.with_name(f"{self.out.name}.json")
+
+        # the include directory as a whole, or every member individually
+        # (like the libraries of a download)
+        if mapping == "directory":
+            self.to = {"include": self.out}
+        else:
+            self.to = {name: self.out / name for name in member_names(members)}
+
+        manifest = ExtractManifest(self.out, manifest_path)
+        for _ in extract_zip(self.archive, self.to, manifest=manifest):
+            pass
+        manifest.save()
+        self.manifest = ExtractManifest(self.out, manifest_path)
+
+    def teardown(self, members: int, mapping: str) -> None:
+        shutil.rmtree(self.out)
+        self.manifest.path.unlink()
+
+    def time_extract(self, members: int, mapping: str) -> None:
+        for _ in extract_zip(self.archive, self.to):
+            pass
+
+    def time_extract_unchanged(self, members: int, mapping: str) -> None:
+        # a rebuild, where the manifest shows that nothing needs writing
+        for _ in extract_zip(self.archive, self.to, manifest=self.manifest):
+            pass
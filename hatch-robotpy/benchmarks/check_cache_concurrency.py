@@ -0,0 +1,113 @@
+"""
+Stress test for the cache shared by concurrent builds: several processes
+download the same artifacts at once from a local server into one
+HATCH_ROBOTPY_CACHE.
+
+    python benchmarks/check_cache_concurrency.py [--processes N] [--artifacts N]
+
+Each artifact (and each checksum file that is looked for next to it) must
+be fetched from the server exactly once, and every process must end up
+with the same content for it.
+"""
+
+import argparse
+import hashlib
+import multiprocessing
+import os
+import pathlib
+import random
+import sys
+import tempfile
+import traceback
+import typing as T
+
+PROJECT_DIR = pathlib.Path(__file__).absolute().parent.parent
+sys.path.insert(0, str(PROJECT_DIR / "src"))
+sys.path.insert(0, str(PROJECT_DIR))
+
+from benchmarks._server import ThrottledServer  # noqa: E402
+from hatch_robotpy.cache import ArtifactCache, file_sha256  # noqa: E402
+from hatch_robotpy.download import download_file  # noqa: E402
+
+
+def worker(urls: T.List[str], start: T.Any, results: T.Any, seed: int) -> None:
+    cache = ArtifactCache(pathlib.Path(os.environ["HATCH_ROBOTPY_CACHE"]))
+
+    # every process asks for the artifacts in a different order
+    urls = list(urls)
+    random.Random(seed).shuffle(urls)
+
+    start.wait()
+    digests = {}
+    try:
+        for url in urls:
+            path, _ = download_file(url, cache)
+            digests[url] = file_sha256(path)
+    except Exception:
+        # reported instead of the digests, so the test doesn't wait forever
+        results.put(traceback.format_exc())
+    else:
+        results.put(digests)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--artifacts", type=int, default=10)
+    parser.add_argument("--size", type=int, default=1024 * 1024)
+    args = parser.parse_args()
+
+    files = {f"a{i}.zip": os.urandom(args.size) for i in range(args.artifacts)}
+    expected = {name: hashlib.sha256(data).hexdigest() for name, data in files.items()}
+
+    # slow enough that the downloads overlap
+    server = ThrottledServer(files, latency=0.01, bandwidth=50_000_000)
+    server.start()
+    urls = [f"{server.url}/{name}" for name in files]
+
+    ctx = multiprocessing.get_context("spawn")
+    start = ctx.Event()
+    results = ctx.Queue()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.environ["HATCH_ROBOTPY_CACHE"] = tmpdir
+            processes = [
+                ctx.Process(target=worker, args=(urls, start, results, seed))
+                for seed in range(args.processes)
+            ]
+            for p in processes:
+                p.start()
+            start.set()
+
+            outcomes = [results.get() for _ in processes]
+            for p in processes:
+                p.join()
+    finally:
+        server.stop()
+
+    errors = [o for o in outcomes if isinstance(o, str)]
+    digests = [o for o in outcomes if not isinstance(o, str)]
+
+    for path, count in sorted(server.requests.items()):
+        if count != 1:
+            errors.append(f"{path} was fetched {count} times")
+
+    for url in urls:
+        name = url.rsplit("/", 1)[-1]
+        got = {d[url] for d in digests}
+        if got != {expected[name]}:
+            errors.append(f"{name}: processes got {sorted(got)}")
+
+    print(f"processes:   {args.processes}")
+    print(f"artifacts:   {args.artifacts}")
+    print(f"requests:    {sum(server.requests.values())}")
+    print(f"connections: {server.connections}")
+
+    if errors:
+        raise SystemExit("\n".join(f"error: {e}" for e in errors))
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
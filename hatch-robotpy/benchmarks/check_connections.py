@@ -0,0 +1,112 @@
+"""
+Checks that downloads reuse keep-alive connections: two build hooks in one
+process fetch many artifacts from a local server, and the connections that
+the server accepted are compared with the requests that were made.
+
+    python benchmarks/check_connections.py [--artifacts N] [--jobs N]
+
+Each hook has its own cache, so both of them download every artifact (and
+look for its checksum files, which the server doesn't have). With --jobs 1
+everything is sent on one connection; otherwise no more connections than
+the number of parallel downloads should be opened.
+"""
+
+import argparse
+import io
+import os
+import pathlib
+import sys
+import tempfile
+import zipfile
+
+PROJECT_DIR = pathlib.Path(__file__).absolute().parent.parent
+sys.path.insert(0, str(PROJECT_DIR / "src"))
+sys.path.insert(0, str(PROJECT_DIR))
+
+from hatchling.builders.wheel import WheelBuilder  # noqa: E402
+
+from benchmarks._server import ThrottledServer  # noqa: E402
+from hatch_robotpy.httppool import get_pool  # noqa: E402
+from hatch_robotpy.plugin import DownloadHook  # noqa: E402
+
+
+def make_zip(i: int) -> bytes:
+    bio = io.BytesIO()
+    with zipfile.ZipFile(bio, "w") as z:
+        z.writestr(f"include/header{i}.h", b"int function(int argument);\n" * 100)
+    return bio.getvalue()
+
+
+def run_hook(root: pathlib.Path, url: str, artifacts: int, jobs: int) -> None:
+    (root / "pyproject.toml").write_text(
+        '[project]\nname = "check"\nversion = "1.0"\n'
+    )
+    config = {
+        "download_jobs": jobs,
+        "download": [
+            {"url": f"{url}/a{i}.zip", "extract_to": f"check/a{i}", "incdir": ""}
+            for i in range(artifacts)
+        ],
+    }
+    builder = WheelBuilder(str(root))
+    hook = DownloadHook(
+        str(root),
+        config,
+        builder.config,
+        builder.metadata,
+        str(root / "dist"),
+        "wheel",
+    )
+    build_data = {"artifacts": [], "force_include": {}}
+    hook.initialize("standard", build_data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--artifacts", type=int, default=20)
+    parser.add_argument("--jobs", type=int, default=1)
+    args = parser.parse_args()
+
+    # the hooks must not share a cache, or the second would download nothing
+    os.environ.pop("HATCH_ROBOTPY_CACHE", None)
+
+    files = {f"a{i}.zip": make_zip(i) for i in range(args.artifacts)}
+    server = ThrottledServer(files)
+    server.start()
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ("project1", "project2"):
+                root = pathlib.Path(tmpdir) / name
+                root.mkdir()
+                run_hook(root, server.url, args.artifacts, args.jobs)
+    finally:
+        server.stop()
+
+    pool = get_pool()
+    requests = sum(server.requests.values())
+    print(f"requests sent:        {pool.requests}")
+    print(f"requests received:    {requests}")
+    print(f"connections opened:   {pool.connections_opened}")
+    print(f"connections accepted: {server.connections}")
+
+    errors = []
+    for i in range(args.artifacts):
+        if server.requests[f"/a{i}.zip"] < 2:
+            errors.append(f"a{i}.zip was not downloaded by both hooks")
+    if requests != pool.requests:
+        errors.append("the server didn't receive every request that was sent")
+    if server.connections != pool.connections_opened:
+        errors.append("the server didn't accept every connection that was opened")
+    if server.connections > args.jobs:
+        errors.append(
+            f"{server.connections} connections for {requests} requests, "
+            f"expected at most {args.jobs}"
+        )
+
+    if errors:
+        raise SystemExit("\n".join(f"error: {e}" for e in errors))
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
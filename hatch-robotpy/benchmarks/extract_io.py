@@ -0,0 +1,217 @@
+"""
+Compares the syscalls and memory used to download and extract artifacts
+with the previous implementation (the extract_zip that was replaced, which
+used zipfile and copyfileobj, and 8 KiB reads for downloads).
+
+    python benchmarks/extract_io.py [--members N] [--member-size BYTES]
+
+Syscall counts come from /proc/self/io (Linux only) and include every
+thread of the process. The kernel counts copy_file_range as both a read
+and a write of the bytes it copies, even though they never pass through
+userspace, so those columns don't shrink for stored members; the time
+does. Memory is the tracemalloc peak.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import http.server
+import os
+import pathlib
+import posixpath
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import typing as T
+import zipfile
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / "src"))
+
+from hatch_robotpy.cache import ArtifactCache  # noqa: E402
+from hatch_robotpy.download import download_file, extract_zip  # noqa: E402
+
+
+def read_proc_io() -> T.Dict[str, int]:
+    try:
+        with open("/proc/self/io") as fp:
+            return {k: int(v) for k, v in (line.split(":") for line in fp)}
+    except OSError:
+        return {}
+
+
+@contextlib.contextmanager
+def measure(name: str, results: T.List[T.Tuple[str, T.Dict[str, float]]]):
+    tracemalloc.start()
+    before = read_proc_io()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        after = read_proc_io()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        r: T.Dict[str, float] = {"time": elapsed, "peak": peak}
+        for key in ("syscr", "syscw", "rchar", "wchar"):
+            if key in before:
+                r[key] = after[key] - before[key]
+        results.append((name, r))
+
+
+def make_zip(path: pathlib.Path, members: int, member_size: int) -> None:
+    # shared libraries are usually stored in maven zips, headers deflated
+    with zipfile.ZipFile(path, "w") as z:
+        for i in range(members):
+            z.writestr(
+                f"lib/libstored{i}.so",
+                os.urandom(member_size),
+                compress_type=zipfile.ZIP_STORED,
+            )
+            z.writestr(
+                f"include/header{i}.h",
+                b"int function(int argument);\n" * (member_size // 28),
+                compress_type=zipfile.ZIP_DEFLATED,
+            )
+
+
+def old_extract_zip(
+    fname: pathlib.Path, to: T.Dict[str, pathlib.Path]
+) -> T.List[pathlib.Path]:
+    # extract_zip before it was rewritten, unchanged
+    extracted: T.List[pathlib.Path] = []
+
+    with zipfile.ZipFile(fname) as z:
+        for src, dst in to.items():
+            if src != "":
+                # if is directory, copy whole thing recursively
+                try:
+                    info = z.getinfo(src)
+                except KeyError as e:
+                    osrc = src
+                    src = src + "/"
+                    try:
+                        info = z.getinfo(src)
+                    except KeyError:
+                        info = None
+                    if info is None:
+                        msg = f"error extracting {osrc} from {fname}"
+                        raise ValueError(msg) from e
+
+                src = info.filename
+
+            if src == "" or info.is_dir():
+                ilen = len(src)
+                for minfo in z.infolist():
+                    if minfo.is_dir():
+                        continue
+                    srcname = posixpath.normpath(minfo.filename)
+                    if srcname.startswith(src):
+                        dstname = dst / srcname[ilen:]
+                        dstname.parent.mkdir(parents=True, exist_ok=True)
+
+                        with z.open(minfo.filename, "r") as zfp, open(
+                            dstname, "wb"
+                        ) as fp:
+                            shutil.copyfileobj(zfp, fp)
+
+                        extracted.append(dstname)
+            else:
+                # otherwise write a single file
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                with z.open(src, "r") as zfp, open(dst, "wb") as fp:
+                    shutil.copyfileobj(zfp, fp)
+
+                extracted.append(dst)
+
+        return extracted
+
+
+def old_download(url: str, dst: pathlib.Path) -> None:
+    import urllib.request
+
+    h = hashlib.sha256()
+    with urllib.request.urlopen(url) as ufp, open(dst, "wb") as fp:
+        while True:
+            block = ufp.read(1024 * 8)
+            if not block:
+                break
+            fp.write(block)
+            h.update(block)
+
+
+@contextlib.contextmanager
+def serve(directory: pathlib.Path) -> T.Iterator[str]:
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=str(directory), **kwargs)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, default=50)
+    parser.add_argument("--member-size", type=int, default=1024 * 1024)
+    args = parser.parse_args()
+
+    results: T.List[T.Tuple[str, T.Dict[str, float]]] = []
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmp = pathlib.Path(tmpdir)
+        zip_path = tmp / "artifact.zip"
+        make_zip(zip_path, args.members, args.member_size)
+
+        with measure("extract (zipfile)", results):
+            old_extract_zip(zip_path, {"": tmp / "old"})
+
+        # as a build extracts an archive from the cache
+        with measure("extract_zip", results):
+            for _ in extract_zip(zip_path, {"": tmp / "new"}, verified=True):
+                pass
+
+        with serve(tmp) as base_url:
+            url = f"{base_url}/artifact.zip"
+
+            with measure("download (8 KiB reads)", results):
+                old_download(url, tmp / "old.zip")
+
+            cache = ArtifactCache(tmp / "cache")
+            with measure("download_file", results):
+                download_file(url, cache)
+
+    size = args.members * args.member_size * 2
+    print(f"{args.members * 2} members, {size / 1e6:.1f} MB uncompressed")
+    print()
+    # rchar/wchar are bytes that went through read/write syscalls
+    print(
+        f"{'':24} {'time':>8} {'peak mem':>10} {'syscr':>7} {'syscw':>7} "
+        f"{'rchar':>9} {'wchar':>9}"
+    )
+    for name, r in results:
+        io = [
+            f"{r[k] / 1e6:.1f}MB" if k.endswith("char") else f"{r[k]:.0f}"
+            if k in r
+            else "n/a"
+            for k in ("syscr", "syscw", "rchar", "wchar")
+        ]
+        print(
+            f"{name:24} {r['time']:7.3f}s {r['peak'] / 1024:8.0f}KB "
+            f"{io[0]:>7} {io[1]:>7} {io[2]:>9} {io[3]:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import argparse
+import os
+import pathlib
+import sys
+import tempfile
+import typing as T
+
+from .cache import ArtifactCache, format_size, get_max_size, parse_size
+from .platforms import get_platform_names
+
+
+def _get_cache(args: argparse.Namespace) -> ArtifactCache:
+    root = args.cache or os.environ.get("HATCH_ROBOTPY_CACHE")
+    if not root:
+        raise SystemExit("error: specify --cache or set HATCH_ROBOTPY_CACHE")
+    return ArtifactCache(pathlib.Path(root))
+
+
+def cache_stats(args: argparse.Namespace) -> int:
+    cache = _get_cache(args)
+    stats = cache.stats()
+    print(f"cache:   {cache.root}")
+    print(f"entries: {stats.entries}")
+    print(f"objects: {stats.objects}")
+    print(f"trees:   {stats.trees}")
+    print(f"strip:   {stats.stripped}")
+    print(f"extract: {stats.manifests} manifests")
+    print(f"size:    {format_size(stats.size)}")
+    print(f"hits:    {stats.hits}")
+    print(f"checked: {stats.verified}")
+
+    max_size = get_max_size()
+    if max_size is not None:
+        print(f"budget:  {format_size(max_size)}")
+    return 0
+
+
+def cache_gc(args: argparse.Namespace) -> int:
+    cache = _get_cache(args)
+    if args.max_size is not None:
+        max_size = parse_size(args.max_size)
+    else:
+        max_size = get_max_size()
+
+    before = cache.stats()
+    evicted = cache.gc(max_size)
+    after = cache.stats()
+
+    for url in evicted:
+        print(f"evicted {url}")
+    print(
+        f"{len(evicted)} entries evicted, "
+        f"{format_size(before.size - after.size)} freed, "
+        f"{format_size(after.size)} in use"
+    )
+    return 0
+
+
+def cache_verify(args: argparse.Namespace) -> int:
+    cache = _get_cache(args)
+    problems = cache.verify()
+    for url, problem in problems:
+        print(f"{url}: {problem}")
+
+    if problems:
+        print(f"{len(problems)} bad entries removed")
+        return 1
+
+    print("cache ok")
+    return 0
+
+
+def prefetch_command(args: argparse.Namespace) -> int:
+    from .metadata import MavenResolver
+    from .prefetch import get_project_downloads, load_project, prefetch
+
+    cache = _get_cache(args)
+
+    if not args.platform:
+        platform_names = [None]
+    elif "all" in args.platform:
+        platform_names = get_platform_names()
+    else:
+        platform_names = args.platform
+
+    projects = [load_project(pyproject) for pyproject in args.pyproject]
+    resolver = MavenResolver(cache.root / "metadata")
+    downloads = get_project_downloads(projects, platform_names, resolver, args.jobs)
+
+    fetched = present = failed = 0
+    size = 0
+    for result in prefetch(downloads, cache, args.jobs, args.revalidate):
+        if result.error is not None:
+            print(f"failed  {result.url}: {result.error}")
+            failed += 1
+        elif result.present:
+            present += 1
+        else:
+            print(f"fetched {result.url} ({format_size(result.size)})")
+            fetched += 1
+            size += result.size
+
+    print(
+        f"{fetched} downloaded ({format_size(size)}), "
+        f"{present} already cached, {failed} failed"
+    )
+
+    # the budget is applied once at the end instead of after every download
+    max_size = get_max_size()
+    if max_size is not None:
+        evicted = cache.gc(max_size)
+        if evicted:
+            print(
+                f"warning: {len(evicted)} entries evicted to fit the cache "
+                f"budget of {format_size(max_size)}"
+            )
+    return 1 if failed else 0
+
+
+def lock_command(args: argparse.Namespace) -> int:
+    from .lock import LOCK_FILENAME
+    from .metadata import MavenResolver
+    from .prefetch import create_lock, load_project
+
+    platform_names = args.platform or get_platform_names()
+    if "all" in platform_names:
+        platform_names = get_platform_names()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # downloads are needed to hash them, keep them if there is a cache
+        if args.cache or os.environ.get("HATCH_ROBOTPY_CACHE"):
+            cache = _get_cache(args)
+        else:
+            cache = ArtifactCache(pathlib.Path(tmpdir))
+        resolver = MavenResolver(cache.root / "metadata")
+
+        retval = 0
+        for pyproject in args.pyproject:
+            project = load_project(pyproject)
+            lock, failed = create_lock(
+                project, platform_names, cache, resolver, args.jobs
+            )
+
+            for result in failed:
+                print(f"failed  {result.url}: {result.error}")
+                retval = 1
+
+            for name in platform_names:
+                if name not in lock.platforms:
+                    print(f"warning: {name} is not locked because of failed downloads")
+
+            if not lock.platforms:
+                print(f"error: no platforms could be locked for {pyproject}")
+                retval = 1
+                continue
+
+            lock_path = project.root / LOCK_FILENAME
+            lock.save(lock_path)
+            nfiles = len({d.url for dls in lock.platforms.values() for d in dls})
+            print(
+                f"wrote {lock_path} ({len(lock.platforms)} platforms, "
+                f"{nfiles} artifacts)"
+            )
+
+    return retval
+
+
+def main(argv: T.Optional[T.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m hatch_robotpy")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    cache_parser = subparsers.add_parser("cache", help="Manage the download cache")
+    cache_parser.add_argument(
+        "--cache",
+        type=pathlib.Path,
+        help="Cache directory (default: $HATCH_ROBOTPY_CACHE)",
+    )
+    cache_subparsers = cache_parser.add_subparsers(dest="cache_command", required=True)
+
+    p = cache_subparsers.add_parser("stats", help="Show cache usage")
+    p.set_defaults(func=cache_stats)
+
+    p = cache_subparsers.add_parser(
+        "gc", help="Evict least recently used entries to fit the size budget"
+    )
+    p.add_argument(
+        "--max-size",
+        help="Size budget such as 2G (default: $HATCH_ROBOTPY_CACHE_MAX_SIZE)",
+    )
+    p.set_defaults(func=cache_gc)
+
+    p = cache_subparsers.add_parser(
+        "verify", help="Check cached files and remove corrupt entries"
+    )
+    p.set_defaults(func=cache_verify)
+
+    p = subparsers.add_parser(
+        "prefetch", help="Download the artifacts of projects into the cache"
+    )
+    p.add_argument(
+        "pyproject", nargs="+", type=pathlib.Path, help="pyproject.toml to read"
+    )
+    p.add_argument(
+        "--cache",
+        type=pathlib.Path,
+        help="Cache directory (default: $HATCH_ROBOTPY_CACHE)",
+    )
+    p.add_argument(
+        "-p",
+        "--platform",
+        action="append",
+        choices=get_platform_names() + ["all"],
+        help="Platform to fetch artifacts for, can be given multiple times "
+        "(default: the current platform)",
+    )
+    p.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=8,
+        help="Number of parallel downloads (default: %(default)s)",
+    )
+    p.add_argument(
+        "--revalidate",
+        action="store_true",
+        help="Check whether cached artifacts changed on the server",
+    )
+    p.set_defaults(func=prefetch_command)
+
+    p = subparsers.add_parser(
+        "lock", help="Record the resolved downloads of projects in a lock file"
+    )
+    p.add_argument(
+        "pyproject",
+        nargs="*",
+        type=pathlib.Path,
+        default=[pathlib.Path("pyproject.toml")],
+        help="pyproject.toml to lock (default: pyproject.toml)",
+    )
+    p.add_argument(
+        "--cache",
+        type=pathlib.Path,
+        help="Cache directory (default: $HATCH_ROBOTPY_CACHE, or a temporary one)",
+    )
+    p.add_argument(
+        "-p",
+        "--platform",
+        action="append",
+        choices=get_platform_names() + ["all"],
+        help="Platform to lock, can be given multiple times (default: all)",
+    )
+    p.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=8,
+        help="Number of parallel downloads (default: %(default)s)",
+    )
+    p.set_defaults(func=lock_command)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,658 @@
+"""
+Content addressed cache for downloaded artifacts.
+
+Layout of the cache directory::
+
+    entries/ab/abcd...json  the entry of a url (see below), named by url_key
+    objects/ab/abcd...  file contents, named by sha256
+    trees/ab/abcd.../   contents of the zip file object abcd..., extracted
+    trees/ab/abcd...json  size of the extracted tree
+    stripped/ab/abcd... stripped libraries, named by input hash and strip tool
+    tmp/                in-progress and interrupted downloads
+    locks/              lock files that coordinate processes sharing the cache
+    manifests/abcd...json  files extracted into each project (see manifest_path)
+
+Each entry records the sha256 and size of the content, the checksums it
+was verified against when it was downloaded, and how many times it was
+used. The entry is rewritten when it is used, so its mtime is the last time
+that it was accessed. Multiple URLs may refer to the same object. The mtime
+of a stripped library is the last time it was used. When a size budget is
+configured, the least recently used objects (and their extracted trees) are
+evicted once the budget is exceeded.
+
+Extracted trees are shared by every project that uses the same artifact;
+files are created from them with reflinks or hardlinks where possible (see
+:mod:`.materialize`). Files in the trees are read-only.
+
+Several processes may use the cache at once. Looking up an entry only
+reads (and rewrites) its own file. Objects and trees are added and removed
+while holding locks/gc.lock, so that gc never sees an object before its
+entry is written. Only one process downloads a URL or extracts a tree at a
+time (the others wait for it and use the result), and objects that were
+used recently are not evicted since another process may be using them.
+"""
+
+import contextlib
+import dataclasses
+import hashlib
+import json
+import os
+import pathlib
+import re
+import shutil
+import sys
+import threading
+import time
+import typing as T
+import uuid
+
+from .filelock import lock_file
+
+ENTRY_VERSION = 1
+
+#: Interrupted downloads are kept this long (in seconds) so they can be resumed
+STALE_TMP_AGE = 7 * 24 * 60 * 60
+
+#: Extraction manifests that haven't been saved for this long (in seconds) are
+#: removed, since the directory they describe probably no longer exists
+STALE_MANIFEST_AGE = 7 * 24 * 60 * 60
+
+#: Objects used within this many seconds are not evicted, because another
+#: process may be using them
+RECENT_USE_AGE = 60 * 60
+
+_size_re = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*$", re.IGNORECASE)
+_size_units = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+
+
+def parse_size(size: str) -> int:
+    """
+    Converts a human readable size such as ``500M`` or ``10GiB`` to bytes
+    """
+    m = _size_re.match(size)
+    if m is None:
+        raise ValueError(f"invalid size {size!r}")
+    return int(float(m.group(1)) * _size_units[m.group(2).lower()])
+
+
+def format_size(size: int) -> str:
+    if size < 1024:
+        return f"{size}B"
+
+    value = float(size)
+    for unit in ("KiB", "MiB", "GiB", "TiB"):
+        value /= 1024
+        if value < 1024:
+            break
+    return f"{value:.1f}{unit}"
+
+
+def get_max_size(default: T.Optional[str] = None) -> T.Optional[int]:
+    """
+    Size budget for the cache, HATCH_ROBOTPY_CACHE_MAX_SIZE overrides the
+    configured default
+    """
+    size = os.environ.get("HATCH_ROBOTPY_CACHE_MAX_SIZE") or default
+    if not size:
+        return None
+    return parse_size(size)
+
+
+def get_user_cache_dir() -> pathlib.Path:
+    """
+    :returns: the directory in the user's cache where hatch-robotpy keeps
+              files that must outlive a build when HATCH_ROBOTPY_CACHE is
+              not set
+    """
+    if sys.platform == "win32":
+        cache = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        cache = os.path.expanduser("~/Library/Caches")
+    else:
+        cache = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return pathlib.Path(cache) / "hatch-robotpy"
+
+
+def file_sha256(fname: pathlib.Path) -> str:
+    h = hashlib.sha256()
+    with open(fname, "rb") as fp:
+        while True:
+            block = fp.read(1024 * 1024)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def url_key(url: str) -> str:
+    """Stable filesystem-safe key for a URL"""
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+@dataclasses.dataclass
+class CacheStats:
+    #: Number of URLs in the cache
+    entries: int
+
+    #: Number of distinct objects
+    objects: int
+
+    #: Number of extracted trees
+    trees: int
+
+    #: Number of stripped libraries
+    stripped: int
+
+    #: Number of extraction manifests
+    manifests: int
+
+    #: Total size of everything in the cache in bytes
+    size: int
+
+    #: Total number of cache hits recorded
+    hits: int
+
+    #: Number of URLs whose content was verified against a checksum
+    verified: int = 0
+
+
+@dataclasses.dataclass
+class CacheEntry:
+    url: str
+
+    #: Location of the cached content
+    path: pathlib.Path
+
+    sha256: str
+    size: int
+
+    #: Validators sent by the server when the content was downloaded
+    etag: T.Optional[str] = None
+    last_modified: T.Optional[str] = None
+
+    #: algorithm: digest of checksums that the content was verified against
+    #: when it was downloaded. If empty, the content was not verified.
+    verified: T.Dict[str, str] = dataclasses.field(default_factory=dict)
+
+    @classmethod
+    def _from_entry(cls, path: pathlib.Path, entry: T.Dict[str, T.Any]) -> "CacheEntry":
+        return cls(
+            url=entry["url"],
+            path=path,
+            sha256=entry["sha256"],
+            size=entry["size"],
+            etag=entry.get("etag"),
+            last_modified=entry.get("last_modified"),
+            verified=entry.get("verified") or {},
+        )
+
+
+class ArtifactCache:
+    """
+    A cache of downloaded files keyed by full URL, with content stored by
+    its sha256. Safe to use from multiple threads.
+    """
+
+    def __init__(
+        self,
+        root: pathlib.Path,
+        max_size: T.Optional[int] = None,
+        manifests_dir: T.Optional[pathlib.Path] = None,
+    ) -> None:
+        """
+        :param manifests_dir: where extraction manifests are saved, defaults
+                              to the manifests directory of root. A cache
+                              that is deleted after the build needs one
+                              that isn't.
+        """
+        self.root = root
+        self.max_size = max_size
+
+        self.entries_dir = root / "entries"
+        self.objects_dir = root / "objects"
+        self.trees_dir = root / "trees"
+        self.stripped_dir = root / "stripped"
+        self.tmp_dir = root / "tmp"
+        self.locks_dir = root / "locks"
+        self.manifests_dir = (
+            manifests_dir if manifests_dir is not None else root / "manifests"
+        )
+
+        self.entries_dir.mkdir(parents=True, exist_ok=True)
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self.locks_dir.mkdir(parents=True, exist_ok=True)
+
+        # objects used by this process are never evicted automatically
+        self._pinned: T.Set[str] = set()
+        self._pinned_lock = threading.Lock()
+
+    def entry_path(self, url: str) -> pathlib.Path:
+        key = url_key(url)
+        return self.entries_dir / key[:2] / f"{key}.json"
+
+    def object_path(self, digest: str) -> pathlib.Path:
+        return self.objects_dir / digest[:2] / digest
+
+    def tree_path(self, digest: str) -> pathlib.Path:
+        return self.trees_dir / digest[:2] / digest
+
+    def stripped_path(self, key: str) -> pathlib.Path:
+        return self.stripped_dir / key[:2] / key
+
+    def manifest_path(self, extract_root: pathlib.Path) -> pathlib.Path:
+        """
+        :returns: where the extraction manifest of the directory
+                  extract_root is saved
+        """
+        key = hashlib.sha256(str(extract_root.absolute()).encode("utf-8"))
+        return self.manifests_dir / f"{key.hexdigest()[:16]}.json"
+
+    def tmp_path(self, url: str) -> pathlib.Path:
+        """
+        Location that a download of url should be written to. Only write
+        to it while holding :meth:`download_lock`.
+        """
+        return self.tmp_dir / f"{url_key(url)}.part"
+
+    def download_lock(self, url: str) -> T.ContextManager[None]:
+        """
+        Lock held while downloading url, so that other threads and processes
+        wait for the download instead of doing it again
+        """
+        return lock_file(self.locks_dir / f"{url_key(url)}.lock")
+
+    def contains(self, url: str) -> bool:
+        """
+        :returns: True if url is in the cache (does not count as a hit)
+        """
+        entry = self._read_entry(self.entry_path(url))
+        return entry is not None and self.object_path(entry["sha256"]).exists()
+
+    def lookup(self, url: str) -> T.Optional["CacheEntry"]:
+        """
+        :returns: the cached content of url, or None if not cached
+        """
+        entry_path = self.entry_path(url)
+        entry = self._read_entry(entry_path)
+        if entry is None:
+            return None
+
+        digest = entry["sha256"]
+        path = self.object_path(digest)
+        if not path.exists():
+            entry_path.unlink(missing_ok=True)
+            return None
+
+        self._pin(digest)
+
+        # rewriting the entry also records when it was used. A hit that is
+        # lost to another process rewriting it at the same time is harmless
+        entry["hits"] += 1
+        with contextlib.suppress(OSError):
+            self._write_entry(entry_path, entry)
+
+        return CacheEntry._from_entry(path, entry)
+
+    def store(
+        self,
+        url: str,
+        tmp_path: pathlib.Path,
+        digest: str,
+        size: int,
+        etag: T.Optional[str] = None,
+        last_modified: T.Optional[str] = None,
+        verified: T.Optional[T.Dict[str, str]] = None,
+    ) -> "CacheEntry":
+        """
+        Moves a completed download into the cache
+
+        :param tmp_path: downloaded file, will be moved or removed
+        :param digest: sha256 of the file contents
+        :param size: size of the file
+        :param etag: ETag header sent by the server, used for revalidation
+        :param last_modified: Last-Modified header sent by the server
+        :param verified: algorithm: digest of checksums that the download
+                         was verified against
+        """
+        path = self.object_path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        entry = {
+            "version": ENTRY_VERSION,
+            "url": url,
+            "sha256": digest,
+            "size": size,
+            "created": time.time(),
+            "hits": 0,
+            "etag": etag,
+            "last_modified": last_modified,
+            "verified": verified or {},
+        }
+
+        self._pin(digest)
+        with self._gc_lock():
+            if path.exists():
+                tmp_path.unlink()
+            else:
+                os.replace(tmp_path, path)
+            self._write_entry(self.entry_path(url), entry)
+
+        if self.max_size is not None:
+            self.gc(self.max_size)
+
+        return CacheEntry._from_entry(path, entry)
+
+    def extracted_tree(self, url: str) -> T.Optional[pathlib.Path]:
+        """
+        :returns: directory containing all members of the cached zip file
+                  for url, which is extracted the first time it is
+                  requested. None if url is not cached.
+        """
+        entry = self._read_entry(self.entry_path(url))
+        if entry is None:
+            return None
+
+        digest = entry["sha256"]
+        self._pin(digest)
+
+        path = self.tree_path(digest)
+        if path.exists():
+            return path
+
+        # wait for anyone else extracting it
+        with lock_file(self.locks_dir / f"{digest}.tree.lock"):
+            if path.exists():
+                return path
+
+            from .download import extract_zip
+
+            tmp_path = self.tmp_dir / "trees" / uuid.uuid4().hex
+            tmp_path.mkdir(parents=True)
+
+            size = 0
+            object_path = self.object_path(digest)
+            for fname in extract_zip(object_path, {"": tmp_path}, verified=True):
+                size += fname.stat().st_size
+                if os.name != "nt":
+                    fname.chmod(0o444)
+
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with self._gc_lock():
+                self._write_json(self._tree_size_path(digest), {"size": size})
+                os.replace(tmp_path, path)
+
+        return path
+
+    def lookup_stripped(self, key: str) -> T.Optional[pathlib.Path]:
+        """
+        :param key: identifies the input file and how it was stripped
+        :returns: path to the stripped file, or None if not cached
+        """
+        path = self.stripped_path(key)
+        try:
+            # records when it was used
+            os.utime(path)
+        except OSError:
+            return None
+
+        self._pin(key)
+        return path
+
+    def store_stripped(self, key: str, fname: pathlib.Path) -> None:
+        """
+        Stores a copy of a stripped file
+        """
+        from .materialize import materialize
+
+        tmp_path = self.tmp_dir / f"{uuid.uuid4().hex}.stripped"
+        materialize(fname, tmp_path, "reflink")
+
+        path = self.stripped_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._pin(key)
+        os.replace(tmp_path, path)
+
+    def stats(self) -> CacheStats:
+        entries = [entry for _, entry in self._entries()]
+        objects = {e["sha256"]: e["size"] for e in entries}
+        trees = self._tree_sizes()
+        stripped = [st.st_size for _, st in self._stripped()]
+        manifests = [st.st_size for _, st in self._manifests()]
+        return CacheStats(
+            entries=len(entries),
+            objects=len(objects),
+            trees=len(trees),
+            stripped=len(stripped),
+            manifests=len(manifests),
+            size=sum(objects.values())
+            + sum(trees.values())
+            + sum(stripped)
+            + sum(manifests),
+            hits=sum(e["hits"] for e in entries),
+            verified=sum(1 for e in entries if e.get("verified")),
+        )
+
+    def gc(self, max_size: T.Optional[int] = None) -> T.List[str]:
+        """
+        Removes orphaned files, and if max_size is specified evicts least
+        recently used objects until the cache fits within it. Objects used
+        by this process, or by anyone in the last :data:`RECENT_USE_AGE`
+        seconds, are not evicted.
+
+        :returns: URLs that were evicted
+        """
+        evicted: T.List[str] = []
+
+        with self._gc_lock():
+            # group entries by object
+            by_digest: T.Dict[str, T.List[T.Tuple[pathlib.Path, str]]] = {}
+            sizes: T.Dict[str, int] = {}
+            for entry_path, entry in self._entries():
+                digest = entry["sha256"]
+                by_digest.setdefault(digest, []).append((entry_path, entry["url"]))
+                sizes[digest] = entry["size"]
+
+            # remove files that nothing refers to, and downloads that were
+            # interrupted long ago
+            for path in self.objects_dir.glob("*/*"):
+                if path.name not in by_digest:
+                    path.unlink()
+
+            trees = self._tree_sizes()
+            for digest in list(trees):
+                if digest not in by_digest:
+                    del trees[digest]
+                    self._remove_tree(digest)
+
+            stale = time.time() - STALE_TMP_AGE
+            for path in self.tmp_dir.iterdir():
+                with contextlib.suppress(FileNotFoundError):
+                    if path.is_file() and path.stat().st_mtime < stale:
+                        path.unlink()
+
+            self.remove_stale_manifests()
+
+            if max_size is not None:
+                # (atime, size, is_stripped, key) of everything evictable
+                candidates = [
+                    (
+                        _last_used(p for p, _ in paths),
+                        sizes[digest] + trees.get(digest, 0),
+                        False,
+                        digest,
+                    )
+                    for digest, paths in by_digest.items()
+                ]
+                candidates += [
+                    (st.st_mtime, st.st_size, True, path.name)
+                    for path, st in self._stripped()
+                ]
+
+                total = sum(c[1] for c in candidates)
+                recent = time.time() - RECENT_USE_AGE
+                for atime, size, is_stripped, key in sorted(candidates):
+                    if total <= max_size or atime > recent:
+                        break
+                    with self._pinned_lock:
+                        if key in self._pinned:
+                            continue
+
+                    if is_stripped:
+                        path = self.stripped_path(key)
+                        with contextlib.suppress(OSError):
+                            if path.stat().st_mtime > recent:
+                                # used since it was looked at
+                                continue
+                            path.unlink()
+                    else:
+                        entry_paths = [p for p, _ in by_digest[key]]
+                        if _last_used(entry_paths) > recent:
+                            continue
+                        for entry_path in entry_paths:
+                            entry_path.unlink(missing_ok=True)
+                        self.object_path(key).unlink(missing_ok=True)
+                        self._remove_tree(key)
+                        evicted.extend(url for _, url in by_digest[key])
+                    total -= size
+
+        return evicted
+
+    def verify(self) -> T.List[T.Tuple[str, str]]:
+        """
+        Checks the content of every cached object against its hash. Entries
+        that are missing or corrupt are removed from the cache.
+
+        :returns: list of (url, problem)
+        """
+        problems: T.List[T.Tuple[str, str]] = []
+
+        with self._gc_lock():
+            checked: T.Dict[str, T.Optional[str]] = {}
+
+            for entry_path, entry in self._entries():
+                digest = entry["sha256"]
+                if digest not in checked:
+                    checked[digest] = self._check_object(digest, entry["size"])
+
+                problem = checked[digest]
+                if problem is not None:
+                    problems.append((entry["url"], problem))
+                    entry_path.unlink(missing_ok=True)
+
+            for digest, problem in checked.items():
+                if problem is not None:
+                    self.object_path(digest).unlink(missing_ok=True)
+                    self._remove_tree(digest)
+
+        return problems
+
+    def _check_object(self, digest: str, size: int) -> T.Optional[str]:
+        path = self.object_path(digest)
+        if not path.exists():
+            return "missing"
+
+        h = hashlib.sha256()
+        actual_size = 0
+        with open(path, "rb") as fp:
+            while True:
+                block = fp.read(1024 * 1024)
+                if not block:
+                    break
+                h.update(block)
+                actual_size += len(block)
+
+        if actual_size != size:
+            return f"size mismatch (expected {size}, got {actual_size})"
+        if h.hexdigest() != digest:
+            return "sha256 mismatch"
+        return None
+
+    def _pin(self, key: str) -> None:
+        with self._pinned_lock:
+            self._pinned.add(key)
+
+    def _gc_lock(self) -> T.ContextManager[None]:
+        """
+        Held while objects and trees are added or removed. Not reentrant.
+        """
+        return lock_file(self.locks_dir / "gc.lock")
+
+    def _read_entry(self, path: pathlib.Path) -> T.Optional[T.Dict[str, T.Any]]:
+        try:
+            with open(path) as fp:
+                entry = json.load(fp)
+        except (OSError, ValueError):
+            # missing, or corrupt; gc will clean up the object
+            return None
+
+        if not isinstance(entry, dict) or entry.get("version") != ENTRY_VERSION:
+            return None
+        return entry
+
+    def _write_entry(self, path: pathlib.Path, entry: T.Dict[str, T.Any]) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._write_json(path, entry)
+
+    def _write_json(self, path: pathlib.Path, data: T.Any) -> None:
+        """Writes path atomically, so that readers never see part of it"""
+        tmp_path = self.tmp_dir / f"{uuid.uuid4().hex}.json"
+        with open(tmp_path, "w") as fp:
+            json.dump(data, fp, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def _entries(self) -> T.Iterator[T.Tuple[pathlib.Path, T.Dict[str, T.Any]]]:
+        for path in self.entries_dir.glob("*/*.json"):
+            entry = self._read_entry(path)
+            if entry is not None:
+                yield path, entry
+
+    def _tree_size_path(self, digest: str) -> pathlib.Path:
+        return self.trees_dir / digest[:2] / f"{digest}.json"
+
+    def _tree_sizes(self) -> T.Dict[str, int]:
+        """:returns: digest: size of each extracted tree"""
+        sizes = {}
+        for path in self.trees_dir.glob("*/*"):
+            if path.suffix == ".json":
+                continue
+            try:
+                with open(self._tree_size_path(path.name)) as fp:
+                    sizes[path.name] = json.load(fp)["size"]
+            except (OSError, ValueError, KeyError):
+                sizes[path.name] = 0
+        return sizes
+
+    def _remove_tree(self, digest: str) -> None:
+        shutil.rmtree(self.tree_path(digest), ignore_errors=True)
+        self._tree_size_path(digest).unlink(missing_ok=True)
+
+    def _stripped(self) -> T.Iterator[T.Tuple[pathlib.Path, os.stat_result]]:
+        for path in self.stripped_dir.glob("*/*"):
+            with contextlib.suppress(FileNotFoundError):
+                yield path, path.stat()
+
+    def remove_stale_manifests(self) -> None:
+        """
+        Deletes extraction manifests that haven't been saved for
+        :data:`STALE_MANIFEST_AGE` seconds
+        """
+        stale = time.time() - STALE_MANIFEST_AGE
+        for path, st in self._manifests():
+            if st.st_mtime < stale:
+                path.unlink(missing_ok=True)
+
+    def _manifests(self) -> T.Iterator[T.Tuple[pathlib.Path, os.stat_result]]:
+        for path in self.manifests_dir.glob("*.json"):
+            with contextlib.suppress(FileNotFoundError):
+                yield path, path.stat()
+
+
+def _last_used(entry_paths: T.Iterable[pathlib.Path]) -> float:
+    """:returns: the latest mtime of entry_paths, which is when they were used"""
+    mtimes = [0.0]
+    for path in entry_paths:
+        with contextlib.suppress(FileNotFoundError):
+            mtimes.append(path.stat().st_mtime)
+    return max(mtimes)
+
@@ -28,7 +28,8 @@ class MavenLibDownload:
     #:
     #: * header artifacts will be extracted to ${extract_to}/include
     #: * library artifacts will be extracted to ${extract_to}/lib
-    #: * The lib and include output directory will be deleted when content is updated
+    #: * Files in the lib and include output directories that are no longer
+    #:   part of the artifacts are deleted when content is updated
     extract_to: str
 
     #: Maven artifact ID
@@ -43,6 +44,14 @@ class MavenLibDownload:
     #: Version of artifact to download
     version: str
 
+    #: Local maven repositories that are checked for the artifact before
+    #: repo_url, in order. These can be ``file://`` URLs or directories
+    #: (such as ``~/.m2/repository``) with the standard maven layout.
+    #: Artifacts found locally are extracted directly without downloading
+    #: or caching them. Repositories in the HATCH_ROBOTPY_LOCAL_REPOS
+    #: environment variable (separated by os.pathsep) are checked first.
+    local_repos: T.Optional[T.List[str]] = None
+
     #: Configure the sources classifier
     # sources_classifier: str = "sources"
 
@@ -81,6 +90,11 @@ class MavenLibDownload:
 
     strip: bool = True
 
+    #: Check whether cached artifacts have changed on the server before
+    #: using them. Use this for development repositories where artifacts
+    #: are updated in place.
+    revalidate: bool = False
+
 
 @dataclasses.dataclass
 class Download:
@@ -104,18 +118,41 @@ class Download:
     #: ${ARCH} and ${OS} are replaced with the architecture/os name
     url: str
 
+    #: Local files that are used instead of downloading url. The first one
+    #: that exists is used, and is checked against sha256 if that is set.
+    #: Relative paths are relative to pyproject.toml.
+    #:
+    #: ${ARCH} and ${OS} are replaced with the architecture/os name
+    local_files: T.Optional[T.List[str]] = None
+
+    #: Expected sha256 of the file at url. If not specified, the download is
+    #: checked against the url.sha256, url.sha1 or url.md5 file published
+    #: next to it, if the server has one.
+    sha256: T.Optional[str] = None
+
+    #: Expected size of the file at url in bytes. It is checked as soon as
+    #: the download starts, before the whole file has been fetched to check
+    #: sha256. The lock file sets this.
+    size: T.Optional[int] = None
+
+    #: Checksum files to look for next to url when sha256 isn't specified,
+    #: in order (such as ["sha1"] for url.sha1). Each one that the server
+    #: doesn't have costs a request. Defaults to sha256, sha1 and md5; maven
+    #: downloads only use the sha1 file that maven repositories publish.
+    checksums: T.Optional[T.List[str]] = None
+
     #: Directory within downloaded file that contains include files.
     #:
     #: * ${ARCH} and ${OS} are replaced with the architecture/os name
     #: * Output directory is ${extract_to}/include
-    #: * Output directory will be deleted when content is updated
+    #: * Stale files in the output directory are deleted when content is updated
     incdir: T.Optional[str] = None
 
     #: Directory within downloaded file that contains library files
     #:
     #: * ${ARCH} and ${OS} are replaced with the architecture/os name
     #: * Output directory is ${extract_to}/lib
-    #: * Output directory will be deleted when content is updated
+    #: * Stale files in the output directory are deleted when content is updated
     libdir: T.Optional[str] = None
 
     # Common with MavenLibDownload
@@ -128,6 +165,10 @@ class Download:
 
     strip: bool = True
 
+    #: Check whether a cached copy of url has changed on the server before
+    #: using it. Use this for URLs whose content is updated in place.
+    revalidate: bool = False
+
     #: If specified, names of contained shared link only libraries (in loading order).
     #: If None, set to name. If empty list, link only libs will not be downloaded.
     # dlopenlibs: T.Optional[T.List[str]] = None
@@ -156,6 +197,12 @@ class Download:
                 v = _os_re.sub(platform.os, _arch_re.sub(platform.arch, v))
                 setattr(self, n, v)
 
+        if self.local_files is not None:
+            self.local_files = [
+                _os_re.sub(platform.os, _arch_re.sub(platform.arch, v))
+                for v in self.local_files
+            ]
+
         # if self.extra_includes:
         #     self.extra_includes = [
         #         _os_re.sub(platform.os, _arch_re.sub(platform.arch, v))
@@ -170,3 +217,28 @@ class HookConfig:
     )
 
     download: T.List[Download] = dataclasses.field(default_factory=list)
+
+    #: Maximum number of artifacts that will be fetched in parallel. The
+    #: HATCH_ROBOTPY_DOWNLOAD_JOBS environment variable overrides this.
+    download_jobs: int = 4
+
+    #: Maximum size of HATCH_ROBOTPY_CACHE (such as "2G"). When exceeded, the
+    #: least recently used artifacts are removed. The
+    #: HATCH_ROBOTPY_CACHE_MAX_SIZE environment variable overrides this.
+    cache_max_size: T.Optional[str] = None
+
+    #: When an artifact is not cached, fetch only the members of the zip
+    #: file that will be extracted (using HTTP range requests) instead of
+    #: the whole file. Partially fetched files are not cached. Downloads with
+    #: a sha256 (from the config or robotpy-lock.json) are always fetched
+    #: whole, since only the whole file can be checked against it. The
+    #: HATCH_ROBOTPY_REMOTE_ZIP environment variable overrides this.
+    remote_zip: bool = False
+
+    #: How files are created from the extracted artifacts that are shared
+    #: between projects using HATCH_ROBOTPY_CACHE: "auto" (reflink, then
+    #: hardlink, then copy), "reflink", "hardlink" or "copy" (don't share
+    #: extracted artifacts). Libraries that get stripped are never
+    #: hardlinked. The HATCH_ROBOTPY_LINK_MODE environment variable
+    #: overrides this.
+    link_mode: str = "auto"
@@ -1,97 +1,895 @@
+import collections
 import contextlib
+import errno
+import hashlib
+import json
 import os
 import pathlib
 import posixpath
 import shutil
-import tempfile
+import stat
+import struct
+import sys
+import threading
 import typing as T
+import urllib.error
+import urllib.parse
 import urllib.request
 import zipfile
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from ._version import __version__
+from .cache import ArtifactCache, CacheEntry
+from .httppool import get_pool
+from .materialize import materialize
 
 
 USER_AGENT = f"hatch-robotpy/{__version__}"
 
+#: Buffer size used when extracting archive members. Each thread has one,
+#: and decompresses that much at a time
+COPY_BUFSIZE = 64 * 1024
 
-def download_file(url: str, cache: pathlib.Path) -> T.Tuple[pathlib.Path, bool]:
+#: Buffer size used when downloading
+DOWNLOAD_BUFSIZE = 256 * 1024
+
+#: Checksum files that repositories publish next to artifacts (such as
+#: artifact.zip.sha1), in order of preference
+CHECKSUM_ALGORITHMS = ("sha256", "sha1", "md5")
+
+_checksum_lengths = {"sha256": 64, "sha1": 40, "md5": 32}
+
+# zip local file header
+_LOCAL_HEADER_FMT = "<4s5H3L2H"
+_LOCAL_HEADER_SIZE = struct.calcsize(_LOCAL_HEADER_FMT)
+_LOCAL_HEADER_SIG = b"PK\x03\x04"
+
+# errors that mean a zero-copy syscall can't be used for these files
+_ZERO_COPY_UNSUPPORTED = {
+    errno.ENOSYS,
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.EPERM,
+    errno.EBADF,
+}
+
+
+class ChecksumMismatch(ValueError):
+    pass
+
+
+def download_file(
+    url: str,
+    cache: ArtifactCache,
+    revalidate: bool = False,
+    sha256: T.Optional[str] = None,
+    checksums: T.Optional[T.Sequence[str]] = None,
+    size: T.Optional[int] = None,
+) -> T.Tuple[pathlib.Path, bool]:
     """
+    Downloads url into the cache. The download is checked against sha256
+    if given, otherwise against a checksum file published next to it
+    (url.sha256, url.sha1 or url.md5) if there is one.
+
+    :param revalidate: If the file is cached, ask the server whether it has
+                       changed (for artifacts that are updated in place)
+    :param sha256: expected sha256 of the file
+    :param checksums: checksum files to look for, defaults to
+                      :data:`CHECKSUM_ALGORITHMS`
+    :param size: expected size of the file, checked before it is
+                 downloaded when the server reports it
     :returns: path of file, and whether it was already cached
+
+    :raises ChecksumMismatch: if the download doesn't match its checksum
     """
 
-    fname = posixpath.basename(url)
-    cached_fname = cache / fname
-    present = cached_fname.exists()
-
-    if not present:
-        tmp_cached_fname = cached_fname.with_suffix(".tmp")
-        with open(tmp_cached_fname, "wb") as fp:
-            request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
-            with contextlib.closing(urllib.request.urlopen(request)) as ufp:
-                while True:
-                    block = ufp.read(1024 * 8)
-                    if not block:
-                        break
-                    fp.write(block)
+    entry = _lookup(url, cache, sha256)
+    if entry is not None and not revalidate:
+        return entry.path, True
+
+    # Only one thread or process downloads url at a time. Anyone else waits
+    # here, and then finds it in the cache
+    with cache.download_lock(url):
+        if entry is None:
+            entry = _lookup(url, cache, sha256)
+            if entry is not None and not revalidate:
+                return entry.path, True
+
+        return _download(url, cache, entry, sha256, checksums, size)
+
+
+def _lookup(
+    url: str, cache: ArtifactCache, sha256: T.Optional[str]
+) -> T.Optional[CacheEntry]:
+    entry = cache.lookup(url)
+    if entry is not None and sha256 and entry.sha256 != sha256.lower():
+        # the expected content changed, so the cached file is not it
+        return None
+    return entry
+
+
+def _download(
+    url: str,
+    cache: ArtifactCache,
+    entry: T.Optional[CacheEntry],
+    sha256: T.Optional[str],
+    checksums: T.Optional[T.Sequence[str]],
+    expected_size: T.Optional[int],
+) -> T.Tuple[pathlib.Path, bool]:
+    # must hold cache.download_lock(url)
+    headers = {"User-Agent": USER_AGENT}
+    if entry is not None:
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+
+    tmp_cached_fname = cache.tmp_path(url)
+    meta_fname = tmp_cached_fname.with_name(f"{tmp_cached_fname.name}.json")
+
+    # resume an interrupted download if we know what it was a part of
+    offset = 0
+    partial_validator = _read_partial_validator(meta_fname)
+    if partial_validator is not None and tmp_cached_fname.exists():
+        offset = tmp_cached_fname.stat().st_size
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = partial_validator
+
+    # the checksum is fetched before the download so that both can use the
+    # same connection, except when revalidating, which usually finds that
+    # nothing has changed
+    expected: T.Optional[T.Tuple[str, str]] = None
+    if sha256:
+        expected = ("sha256", sha256.lower())
+    elif entry is None:
+        expected = fetch_checksum(url, checksums)
+
+    try:
+        ufp = open_url(url, headers)
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and entry is not None:
+            return entry.path, True
+        elif e.code == 416 and offset:
+            # partial file is no good, start over
+            tmp_cached_fname.unlink()
+            meta_fname.unlink()
+            return _download(url, cache, entry, sha256, checksums, expected_size)
+        raise
+
+    if ufp.status == 206 and (not offset or _range_start(ufp.headers) != offset):
+        ufp.close()
+        if not offset:
+            raise urllib.error.HTTPError(
+                url, 206, "partial content that was not requested", ufp.headers, None
+            )
+        # not the part that was asked for, start over
+        tmp_cached_fname.unlink()
+        meta_fname.unlink()
+        return _download(url, cache, entry, sha256, checksums, expected_size)
+    elif ufp.status not in (200, 206, None):
+        # anything else may not be the whole file (None is a non-http url)
+        ufp.close()
+        raise urllib.error.HTTPError(
+            url, ufp.status, f"unexpected {ufp.reason}", ufp.headers, None
+        )
+
+    # a wrong size is found before anything is downloaded
+    total_size = _total_size(ufp)
+    if expected_size is not None and total_size not in (None, expected_size):
+        ufp.close()
+        raise ChecksumMismatch(
+            f"{url}: size mismatch (expected {expected_size}, got {total_size})"
+        )
+
+    with contextlib.closing(ufp):
+        etag = ufp.headers.get("ETag")
+        last_modified = ufp.headers.get("Last-Modified")
+
+        if not sha256 and entry is not None:
+            expected = fetch_checksum(url, checksums)
+
+        # the content is hashed as it is written, sha256 is always needed
+        # because the cache is addressed by it
+        h = hashlib.sha256()
+        hashers = [h]
+        if expected is not None and expected[0] != "sha256":
+            hashers.append(_new_hash(expected[0]))
+
+        if ufp.status == 206:
+            mode = "r+b"
+        else:
+            mode = "wb"
+            offset = 0
+
+        # a single buffer is reused for the whole download
+        view = memoryview(bytearray(DOWNLOAD_BUFSIZE))
+
+        with open(tmp_cached_fname, mode) as fp:
+            # existing content must be hashed too
+            size = 0
+            while size < offset:
+                n = fp.readinto(view[: offset - size])
+                if not n:
+                    break
+                for hasher in hashers:
+                    hasher.update(view[:n])
+                size += n
+            fp.truncate(size)
+
+            # remember what this is a part of so it can be resumed
+            validator = etag if etag and not etag.startswith("W/") else last_modified
+            with open(meta_fname, "w") as mfp:
+                json.dump({"url": url, "validator": validator}, mfp)
+
+            while True:
+                n = ufp.readinto(view)
+                if not n:
+                    break
+                block = view[:n]
+                fp.write(block)
+                for hasher in hashers:
+                    hasher.update(block)
+                size += n
+
+    meta_fname.unlink()
+
+    if expected_size is not None and size != expected_size:
+        tmp_cached_fname.unlink()
+        raise ChecksumMismatch(
+            f"{url}: size mismatch (expected {expected_size}, got {size})"
+        )
+
+    verified = {}
+    if expected is not None:
+        algorithm, digest = expected
+        actual = hashers[-1].hexdigest()
+        if actual != digest:
+            tmp_cached_fname.unlink()
+            raise ChecksumMismatch(
+                f"{url}: {algorithm} mismatch (expected {digest}, got {actual})"
+            )
+        verified[algorithm] = digest
+
+    entry = cache.store(
+        url,
+        tmp_cached_fname,
+        h.hexdigest(),
+        size,
+        etag=etag,
+        last_modified=last_modified,
+        verified=verified,
+    )
+    return entry.path, False
+
+
+def fetch_checksum(
+    url: str, algorithms: T.Optional[T.Sequence[str]] = None
+) -> T.Optional[T.Tuple[str, str]]:
+    """
+    Retrieves the checksum file published next to url, trying each of
+    algorithms in turn. Each missing file costs a round trip, so only list
+    the ones that the server is likely to have.
+
+    :param algorithms: defaults to :data:`CHECKSUM_ALGORITHMS`
+    :returns: (algorithm, hex digest), or None if there is no checksum file
+    """
+    if algorithms is None:
+        algorithms = CHECKSUM_ALGORITHMS
+
+    for algorithm in algorithms:
+        if algorithm not in _checksum_lengths:
+            raise ValueError(f"unsupported checksum file {algorithm!r} ({url})")
+
+    scheme = urllib.parse.urlsplit(url).scheme.lower()
+    if scheme not in ("http", "https"):
+        return None
+
+    for algorithm in algorithms:
+        try:
+            with open_url(f"{url}.{algorithm}", {"User-Agent": USER_AGENT}) as fp:
+                data = fp.read()
+        except urllib.error.HTTPError:
+            continue
+
+        # the digest may be followed by the filename, as sha256sum does
+        fields = data.decode("ascii", errors="replace").split()
+        if fields:
+            digest = fields[0].lower()
+            if len(digest) == _checksum_lengths[algorithm] and all(
+                c in "0123456789abcdef" for c in digest
+            ):
+                return algorithm, digest
+
+    return None
+
+
+def _new_hash(algorithm: str):
+    try:
+        # md5 and sha1 are only used to detect corruption
+        return hashlib.new(algorithm, usedforsecurity=False)
+    except TypeError:
+        return hashlib.new(algorithm)
+
+
+def open_url(url: str, headers: T.Dict[str, str]):
+    """
+    Opens a URL, using the shared connection pool for http(s)
+
+    :raises urllib.error.HTTPError: if the server does not return success
+    """
+    scheme = urllib.parse.urlsplit(url).scheme.lower()
+    if scheme not in ("http", "https"):
+        request = urllib.request.Request(url, headers=headers)
+        return urllib.request.urlopen(request)
+
+    response = get_pool().request("GET", url, headers)
+    if not 200 <= response.status < 300:
+        # drain the body so the connection can be reused
+        response.read()
+        response.close()
+        raise urllib.error.HTTPError(
+            url, response.status, response.reason, response.headers, None
+        )
+
+    return response
+
+
+def _read_partial_validator(meta_fname: pathlib.Path) -> T.Optional[str]:
+    try:
+        with open(meta_fname) as fp:
+            return json.load(fp)["validator"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _total_size(ufp) -> T.Optional[int]:
+    """:returns: size of the whole file that ufp is a response for, if known"""
+    if ufp.status == 206:
+        # Content-Range: bytes 1000-1999/2000
+        _, _, total = ufp.headers.get("Content-Range", "").rpartition("/")
+    else:
+        total = ufp.headers.get("Content-Length", "")
+    try:
+        return int(total)
+    except ValueError:
+        return None
+
+
+def _range_start(headers) -> T.Optional[int]:
+    # Content-Range: bytes 1000-1999/2000
+    content_range = headers.get("Content-Range", "")
+    unit, _, rng = content_range.partition(" ")
+    if unit != "bytes":
+        return None
+    start, _, _ = rng.partition("-")
+    try:
+        return int(start)
+    except ValueError:
+        return None
+
+
+class ExtractManifest:
+    """
+    Records the archive members that were extracted into a directory, so
+    that files whose content has not changed are not written again (which
+    would cause everything that depends on them to be rebuilt).
+
+    A file is considered unchanged when the CRC and size of its archive
+    member match what was recorded, and the file on disk has the same size
+    and mtime that it had after it was last written.
+
+    The manifest is saved outside of root (which is inside the package), so
+    that it isn't included in the wheel or sdist. See
+    :meth:`.ArtifactCache.manifest_path`.
+    """
+
+    def __init__(self, root: pathlib.Path, path: pathlib.Path) -> None:
+        """
+        :param root: the directory that files are extracted into
+        :param path: where the manifest is saved
+        """
+        self.root = root
+        self.path = path
+        self._prefix = os.path.join(str(root), "")
 
-        os.replace(tmp_cached_fname, cached_fname)
+        self._lock = threading.Lock()
+        self._current: T.Dict[str, T.Dict[str, int]] = {}
+        self._written: T.Set[str] = set()
 
-    return cached_fname, present
+        #: True if a manifest from a previous extraction exists
+        self.exists = False
+        self._previous: T.Dict[str, T.Dict[str, int]] = {}
+
+        try:
+            with open(self.path) as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            pass
+        else:
+            if isinstance(data, dict) and data.get("version") == 1:
+                self._previous = data["files"]
+                self.exists = True
+
+    def is_current(self, dst: pathlib.Path, info: zipfile.ZipInfo) -> bool:
+        """
+        :returns: True if dst already contains the content of info
+        """
+        key = self._key(dst)
+        entry = self._previous.get(key)
+        if (
+            entry is None
+            or entry["crc"] != info.CRC
+            or entry["size"] != info.file_size
+        ):
+            return False
+
+        try:
+            st = dst.stat()
+        except FileNotFoundError:
+            return False
+
+        if st.st_size != entry["fsize"] or st.st_mtime_ns != entry["mtime_ns"]:
+            return False
+
+        with self._lock:
+            self._current[key] = entry
+        return True
+
+    def record(self, dst: pathlib.Path, info: zipfile.ZipInfo) -> None:
+        """Records that info was written to dst"""
+        st = dst.stat()
+        key = self._key(dst)
+        with self._lock:
+            self._current[key] = {
+                "crc": info.CRC,
+                "size": info.file_size,
+                "fsize": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+            }
+            self._written.add(key)
+
+    def was_written(self, dst: pathlib.Path) -> bool:
+        """:returns: True if dst was (re)written during this extraction"""
+        with self._lock:
+            return self._key(dst) in self._written
+
+    def update_stat(self, dst: pathlib.Path) -> None:
+        """Call after modifying an extracted file (such as stripping it)"""
+        st = dst.stat()
+        with self._lock:
+            entry = self._current[self._key(dst)]
+            entry["fsize"] = st.st_size
+            entry["mtime_ns"] = st.st_mtime_ns
+
+    def remove_stale(self) -> T.List[pathlib.Path]:
+        """
+        Deletes files from the previous extraction that were not part of
+        this one, and any directories that become empty as a result
+        """
+        removed = []
+        dirs = set()
+        for key in self._previous.keys() - self._current.keys():
+            path = self.root / pathlib.PurePosixPath(key)
+            path.unlink(missing_ok=True)
+            removed.append(path)
+            dirs.update(path.parents)
+
+        # deepest first, stop at the root
+        for d in sorted(dirs, key=lambda p: len(p.parts), reverse=True):
+            if self.root in d.parents:
+                with contextlib.suppress(OSError):
+                    d.rmdir()
+
+        return removed
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # other processes may be building the same project
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as fp:
+            json.dump({"version": 1, "files": self._current}, fp, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def _key(self, dst: pathlib.Path) -> str:
+        # slicing the string is much cheaper than relative_to for every member
+        name = str(dst)
+        if name.startswith(self._prefix):
+            return name[len(self._prefix) :].replace(os.sep, "/")
+        return dst.relative_to(self.root).as_posix()
 
 
 def extract_zip(
-    fname: pathlib.Path, to: T.Dict[str, pathlib.Path]
-) -> T.List[pathlib.Path]:
+    fname: pathlib.Path,
+    to: T.Dict[str, pathlib.Path],
+    jobs: T.Optional[int] = None,
+    manifest: T.Optional[ExtractManifest] = None,
+    tree: T.Optional[pathlib.Path] = None,
+    link_mode: str = "copy",
+    verified: bool = False,
+) -> T.Iterator[pathlib.Path]:
     """
     Utility method intended to be useful for downloading/extracting
     third party source zipfiles
 
-    :param cache: directory to cache downloads to
-    :param to: is a dict of {src: dst}
+    Members are routed to their destinations in a single pass over the
+    archive and decompressed on a thread pool. Extracted paths (including
+    those that were already up to date) are yielded in archive order as
+    they are written.
+
+    :param to: is a dict of {src: dst}, where src is a file or directory
+               in the archive ("" is the whole archive)
+    :param jobs: number of threads to decompress with
+    :param manifest: if specified, files that are already up to date are
+                     not written again
+    :param tree: directory that fname has already been extracted to. If
+                 specified, files are created from it instead of being
+                 decompressed
+    :param link_mode: how files are created from tree, see
+                      :func:`.materialize`
+    :param verified: True if fname is a cache object, whose content is
+                     checked by its sha256. The CRCs of stored members are
+                     then not checked when the kernel copies them.
     """
-    extracted: T.List[pathlib.Path] = []
-
-    with zipfile.ZipFile(fname) as z:
-        for src, dst in to.items():
-            if src != "":
-                # if is directory, copy whole thing recursively
-                try:
-                    info = z.getinfo(src)
-                except KeyError as e:
-                    osrc = src
-                    src = src + "/"
-                    try:
-                        info = z.getinfo(src)
-                    except KeyError:
-                        info = None
-                    if info is None:
-                        msg = f"error extracting {osrc} from {fname}"
-                        raise ValueError(msg) from e
-
-                src = info.filename
-
-            if src == "" or info.is_dir():
-                ilen = len(src)
-                for minfo in z.infolist():
-                    if minfo.is_dir():
+
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    with zipfile.ZipFile(fname) as z, contextlib.ExitStack() as stack:
+        # each directory is created once instead of once per file
+        made: T.Set[pathlib.Path] = set()
+
+        # Members are checked against the manifest here, and only those
+        # that changed are given to the pool, which isn't started until
+        # there is one. The others are yielded in order with them. The
+        # queue is bounded so that huge archives don't create a future for
+        # every member at once
+        executor: T.Optional[ThreadPoolExecutor] = None
+        pending: T.Deque[T.Union[Future, pathlib.Path]] = collections.deque()
+        try:
+            for info, dsts in _route_members(z, fname, to):
+                for dst in dsts:
+                    if manifest is not None and manifest.is_current(dst, info):
+                        if pending:
+                            pending.append(dst)
+                        else:
+                            yield dst
                         continue
-                    srcname = posixpath.normpath(minfo.filename)
-                    if srcname.startswith(src):
-                        dstname = dst / srcname[ilen:]
-                        dstname.parent.mkdir(parents=True, exist_ok=True)
 
-                        with z.open(minfo.filename, "r") as zfp, open(
-                            dstname, "wb"
-                        ) as fp:
-                            shutil.copyfileobj(zfp, fp)
+                    if executor is None:
+                        r = stack.enter_context(
+                            contextlib.closing(_ArchiveReader(fname, verified))
+                        )
+                        executor = stack.enter_context(ThreadPoolExecutor(jobs))
+
+                    if dst.parent not in made:
+                        dst.parent.mkdir(parents=True, exist_ok=True)
+                        made.add(dst.parent)
+
+                    pending.append(
+                        executor.submit(
+                            _extract_member,
+                            z,
+                            r,
+                            info,
+                            dst,
+                            manifest,
+                            tree,
+                            link_mode,
+                        )
+                    )
+                    if len(pending) >= jobs * 4:
+                        yield _pending_result(pending.popleft())
+
+            while pending:
+                yield _pending_result(pending.popleft())
+        finally:
+            for item in pending:
+                if isinstance(item, Future):
+                    item.cancel()
+
+
+def _pending_result(item: T.Union[Future, pathlib.Path]) -> pathlib.Path:
+    return item.result() if isinstance(item, Future) else item
+
+
+def _route_members(
+    z: zipfile.ZipFile, fname: pathlib.Path, to: T.Dict[str, pathlib.Path]
+) -> T.Iterator[T.Tuple[zipfile.ZipInfo, T.List[pathlib.Path]]]:
+    """
+    :returns: each member that needs to be extracted, and where to, in
+              archive order
+    """
+
+    files: T.Dict[str, T.List[pathlib.Path]] = {}
+    dirs: T.Dict[str, T.List[pathlib.Path]] = {}
+
+    names = set(z.namelist())
+    for src, dst in to.items():
+        if src == "":
+            dirs.setdefault("", []).append(dst)
+        elif src in names and not src.endswith("/"):
+            files.setdefault(src, []).append(dst)
+        elif f"{src}/" in names or (src.endswith("/") and src in names):
+            dirs.setdefault(src.rstrip("/") + "/", []).append(dst)
+        else:
+            raise ValueError(f"error extracting {src} from {fname}")
+
+    for info in z.infolist():
+        if info.is_dir():
+            continue
+
+        name = info.filename
+        dsts = list(files.get(name, ()))
+
+        # check the root and every parent directory of the member
+        srcname = posixpath.normpath(name)
+        for dst in dirs.get("", ()):
+            dsts.append(dst / srcname)
+
+        idx = srcname.find("/")
+        while idx != -1:
+            for dst in dirs.get(srcname[: idx + 1], ()):
+                dsts.append(dst / srcname[idx + 1 :])
+            idx = srcname.find("/", idx + 1)
+
+        if dsts:
+            yield info, dsts
+
 
-                        extracted.append(dstname)
+def _extract_member(
+    z: zipfile.ZipFile,
+    r: "_ArchiveReader",
+    info: zipfile.ZipInfo,
+    dst: pathlib.Path,
+    manifest: T.Optional[ExtractManifest],
+    tree: T.Optional[pathlib.Path],
+    link_mode: str,
+) -> pathlib.Path:
+    # Files are overwritten in place. They are replaced instead if they may
+    # be linked to the cache, since writing to them would change it
+    if tree is not None and link_mode != "copy":
+        dst.unlink(missing_ok=True)
+    else:
+        try:
+            st = dst.stat()
+        except FileNotFoundError:
+            pass
+        else:
+            # files from the cache are read-only, even after it is removed
+            if st.st_nlink > 1 or not st.st_mode & stat.S_IWUSR:
+                dst.unlink()
+
+    if tree is not None:
+        materialize(tree / posixpath.normpath(info.filename), dst, link_mode)
+    elif not r.extract(info, dst):
+        with z.open(info, "r") as zfp, open(dst, "wb") as fp:
+            shutil.copyfileobj(zfp, fp, COPY_BUFSIZE)
+
+    if manifest is not None:
+        manifest.record(dst, info)
+    return dst
+
+
+class _ArchiveReader:
+    """
+    Extracts stored and deflated members without going through zipfile.
+    Members are read into a buffer that each thread reuses. The buffer is
+    filled each time that it is read into, so one read usually covers the
+    local header and data of several small members.
+
+    Stored members of verified archives that don't fit in the buffer are
+    copied by the kernel (copy_file_range or sendfile) where possible. Their
+    CRC is not checked, since the data is never read; the archive was
+    checked by its sha256 instead. Stored members of other archives are
+    copied through the buffer so that their CRC can be checked.
+    """
+
+    # set to False when the kernel or filesystem doesn't support them
+    use_copy_file_range = hasattr(os, "copy_file_range")
+    use_sendfile = sys.platform.startswith("linux") and hasattr(os, "sendfile")
+
+    def __init__(self, fname: pathlib.Path, verified: bool = False) -> None:
+        self.fname = fname
+        self.verified = verified
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._files: T.List[T.BinaryIO] = []
+
+    def close(self) -> None:
+        with self._lock:
+            for fp in self._files:
+                fp.close()
+            self._files.clear()
+
+    def extract(self, info: zipfile.ZipInfo, dst: pathlib.Path) -> bool:
+        """
+        :returns: False if the member must be extracted with zipfile instead
+        """
+        if info.flag_bits & 0x1 or info.compress_type not in (
+            zipfile.ZIP_STORED,
+            zipfile.ZIP_DEFLATED,
+        ):
+            return False
+
+        local = self._local
+        fp = getattr(local, "fp", None)
+        if fp is None:
+            # an unbuffered handle for each thread
+            fp = local.fp = open(self.fname, "rb", buffering=0)
+            local.view = memoryview(bytearray(COPY_BUFSIZE))
+            local.pos = local.n = 0
+            with self._lock:
+                self._files.append(fp)
+        view = local.view
+
+        # The buffer holds local.n bytes of the archive from local.pos.
+        # Members are extracted in archive order, so small ones have
+        # usually been read already along with the member before them
+        rel = info.header_offset - local.pos
+        if rel < 0 or rel + _LOCAL_HEADER_SIZE > local.n:
+            rel = self._fill(fp, info.header_offset)
+            if local.n < _LOCAL_HEADER_SIZE:
+                return False
+
+        # the data follows the local header, which has its own name and
+        # extra field lengths
+        fields = struct.unpack_from(_LOCAL_HEADER_FMT, view, rel)
+        if fields[0] != _LOCAL_HEADER_SIG:
+            return False
+        start = rel + _LOCAL_HEADER_SIZE + fields[-2] + fields[-1]
+        if rel and start + info.compress_size > local.n:
+            # only the start of it was read, read as much as fits instead
+            start -= rel
+            rel = self._fill(fp, info.header_offset)
+
+        offset = info.header_offset + start - rel
+        n = local.n
+        head = view[min(start, n) : min(start + info.compress_size, n)]
+        if len(head) < info.compress_size:
+            # the buffer is reused to read the rest
+            local.n = 0
+
+        with open(dst, "wb", buffering=0) as out:
+            if info.compress_type == zipfile.ZIP_STORED:
+                self._copy(fp, offset, info, out, head, view)
             else:
-                # otherwise write a single file
-                dst.parent.mkdir(parents=True, exist_ok=True)
-                with z.open(src, "r") as zfp, open(dst, "wb") as fp:
-                    shutil.copyfileobj(zfp, fp)
+                self._inflate(fp, offset, info, out, head, view)
+
+        return True
+
+    def _fill(self, fp: T.BinaryIO, pos: int) -> int:
+        """
+        Reads as much of the archive from pos as fits in the buffer
+
+        :returns: where pos is in the buffer (0)
+        """
+        local = self._local
+        fp.seek(pos)
+        local.pos = pos
+        local.n = fp.readinto(local.view)
+        return 0
+
+    def _copy(
+        self,
+        fp: T.BinaryIO,
+        offset: int,
+        info: zipfile.ZipInfo,
+        out: T.BinaryIO,
+        head: memoryview,
+        view: memoryview,
+    ) -> None:
+        size = info.file_size
+        _write_all(out, head)
+        crc = zlib.crc32(head)
+        pos = written = len(head)
+
+        if self.verified and written < size:
+            written += self._copy_zero(
+                fp.fileno(), out.fileno(), offset + written, size - written
+            )
+            if written == size:
+                return
+
+        # copy the rest through the buffer. What the kernel copied is read
+        # again, since the CRC covers the whole member
+        if pos < size:
+            fp.seek(offset + pos)
+        while pos < size:
+            n = fp.readinto(view[: min(len(view), size - pos)])
+            if not n:
+                raise zipfile.BadZipFile(f"truncated member {info.filename!r}")
+            if pos + n > written:
+                _write_all(out, view[max(written - pos, 0) : n])
+            crc = zlib.crc32(view[:n], crc)
+            pos += n
+
+        if crc != info.CRC:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for file {info.filename!r}")
+
+    def _copy_zero(self, src: int, dst: int, offset: int, count: int) -> int:
+        """
+        :returns: number of bytes the kernel copied from src at offset to dst
+        """
+        copied = 0
+        if self.use_copy_file_range:
+            try:
+                while copied < count:
+                    n = os.copy_file_range(src, dst, count - copied, offset + copied)
+                    if not n:
+                        break
+                    copied += n
+                return copied
+            except OSError as e:
+                if e.errno not in _ZERO_COPY_UNSUPPORTED:
+                    raise
+                _ArchiveReader.use_copy_file_range = False
+
+        if self.use_sendfile:
+            try:
+                while copied < count:
+                    n = os.sendfile(dst, src, offset + copied, count - copied)
+                    if not n:
+                        break
+                    copied += n
+            except OSError as e:
+                if e.errno not in _ZERO_COPY_UNSUPPORTED:
+                    raise
+                _ArchiveReader.use_sendfile = False
+
+        return copied
+
+    def _inflate(
+        self,
+        fp: T.BinaryIO,
+        offset: int,
+        info: zipfile.ZipInfo,
+        out: T.BinaryIO,
+        head: memoryview,
+        view: memoryview,
+    ) -> None:
+        d = zlib.decompressobj(-zlib.MAX_WBITS)
+        crc = 0
+        size = 0
+
+        block = head
+        remaining = info.compress_size - len(head)
+        if remaining:
+            fp.seek(offset + len(head))
+        while True:
+            # limit the output so highly compressed data doesn't use a
+            # lot of memory, and let go of each piece of it before the
+            # next is decompressed
+            while block:
+                data = d.decompress(block, COPY_BUFSIZE)
+                block = d.unconsumed_tail
+                _write_all(out, data)
+                crc = zlib.crc32(data, crc)
+                size += len(data)
+                del data
+
+            if not remaining:
+                break
+            n = fp.readinto(view[: min(len(view), remaining)])
+            if not n:
+                raise zipfile.BadZipFile(f"truncated member {info.filename!r}")
+            remaining -= n
+            block = view[:n]
+
+        data = d.flush()
+        _write_all(out, data)
+        crc = zlib.crc32(data, crc)
+        size += len(data)
+
+        if size != info.file_size or crc != info.CRC:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for file {info.filename!r}")
 
-                extracted.append(dst)
 
-        return extracted
+def _write_all(out: T.BinaryIO, data: T.Union[bytes, memoryview]) -> None:
+    # unbuffered writes may be partial
+    view = memoryview(data)
+    while view:
+        n = out.write(view)
+        view = view[n:]
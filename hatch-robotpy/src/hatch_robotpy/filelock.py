@@ -0,0 +1,53 @@
+"""
+Advisory file locks, used to coordinate processes that share a cache
+"""
+
+import contextlib
+import os
+import pathlib
+import typing as T
+
+if os.name == "nt":
+    import msvcrt
+
+    def _lock(fd: int) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                # LK_LOCK gives up after 10 seconds, keep waiting
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                pass
+
+    def _unlock(fd: int) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _lock(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def _unlock(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def lock_file(path: pathlib.Path) -> T.Iterator[None]:
+    """
+    Holds an exclusive lock on path, waiting for other holders to release
+    it. The lock is per open file, so it excludes other threads of this
+    process as well as other processes. The file is created if needed and
+    is never removed, since that could let two holders in at once.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        _lock(fd)
+        try:
+            yield
+        finally:
+            _unlock(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,253 @@
+"""
+Keep-alive HTTP connections shared by all downloads in a process.
+
+Artifacts for a build almost always come from the same maven repository,
+so reusing connections avoids a TCP and TLS handshake per artifact.
+"""
+
+import http.client
+import ssl
+import threading
+import typing as T
+import urllib.error
+import urllib.parse
+import urllib.request
+
+#: Maximum number of idle connections kept for each host
+MAX_IDLE_PER_HOST = 8
+
+#: Number of redirects that will be followed
+MAX_REDIRECTS = 10
+
+TIMEOUT = 60
+
+_Key = T.Tuple[str, str, int]
+
+
+class PooledResponse:
+    """
+    Wraps a response so that its connection is returned to the pool once
+    the body has been consumed. Always close it (or use it as a context
+    manager).
+    """
+
+    def __init__(
+        self,
+        pool: "ConnectionPool",
+        key: _Key,
+        conn: http.client.HTTPConnection,
+        response: http.client.HTTPResponse,
+        url: str,
+    ) -> None:
+        self._pool = pool
+        self._key = key
+        self._conn: T.Optional[http.client.HTTPConnection] = conn
+        self._response = response
+
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def read(self, amt: T.Optional[int] = None) -> bytes:
+        return self._response.read(amt)
+
+    def readinto(self, b) -> int:
+        return self._response.readinto(b)
+
+    def close(self) -> None:
+        conn = self._conn
+        if conn is None:
+            return
+        self._conn = None
+
+        # responses without a body (HEAD, 304) are complete already
+        if not self._response.isclosed() and self._response.length == 0:
+            self._response.read()
+
+        # connection can only be reused if the whole body was read
+        if self._response.isclosed() and not self._response.will_close:
+            self._pool._release(self._key, conn)
+        else:
+            self._response.close()
+            conn.close()
+
+    def __enter__(self) -> "PooledResponse":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Per-host pool of keep-alive connections. Safe to use from multiple
+    threads; each connection is only used by one request at a time.
+    """
+
+    def __init__(self, max_idle_per_host: int = MAX_IDLE_PER_HOST) -> None:
+        self.max_idle_per_host = max_idle_per_host
+        self._idle: T.Dict[_Key, T.List[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+        self._ssl_context: T.Optional[ssl.SSLContext] = None
+
+        #: Number of connections that have been opened
+        self.connections_opened = 0
+
+        #: Number of requests that have been sent
+        self.requests = 0
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: T.Optional[T.Dict[str, str]] = None,
+    ) -> PooledResponse:
+        """
+        Sends a request, following redirects. The response is returned
+        regardless of its status code.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._request(method, url, headers or {})
+            if response.status not in (301, 302, 303, 307, 308):
+                return response
+
+            location = response.headers.get("Location")
+            response.read()
+            response.close()
+            if not location:
+                return response
+
+            url = urllib.parse.urljoin(url, location)
+            if response.status == 303:
+                method = "GET"
+
+        raise urllib.error.URLError(f"too many redirects ({url})")
+
+    def clear(self) -> None:
+        """Closes all idle connections"""
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def _request(
+        self, method: str, url: str, headers: T.Dict[str, str]
+    ) -> PooledResponse:
+        parsed = urllib.parse.urlsplit(url)
+        scheme = parsed.scheme.lower()
+        if scheme not in ("http", "https"):
+            raise ValueError(f"unsupported url scheme {scheme!r} ({url})")
+
+        host = parsed.hostname or ""
+        port = parsed.port or (443 if scheme == "https" else 80)
+        key = (scheme, host, port)
+
+        proxy = self._get_proxy(scheme, host)
+        if proxy is not None and scheme == "http":
+            # plain http goes through the proxy with an absolute url
+            target = url
+        else:
+            target = parsed.path or "/"
+            if parsed.query:
+                target = f"{target}?{parsed.query}"
+
+        while True:
+            conn, reused = self._acquire(key, proxy)
+            with self._lock:
+                self.requests += 1
+            try:
+                conn.request(method, target, headers=headers)
+                response = conn.getresponse()
+            except (
+                http.client.RemoteDisconnected,
+                ConnectionResetError,
+                BrokenPipeError,
+            ):
+                conn.close()
+                # the server may have dropped an idle connection, retry on
+                # a new one; a new connection failing is a real error
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+
+            return PooledResponse(self, key, conn, response, url)
+
+    def _acquire(
+        self, key: _Key, proxy: T.Optional[urllib.parse.SplitResult]
+    ) -> T.Tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+            self.connections_opened += 1
+
+        scheme, host, port = key
+        conn: http.client.HTTPConnection
+        if proxy is not None:
+            proxy_port = proxy.port or 80
+            if scheme == "https":
+                conn = http.client.HTTPSConnection(
+                    proxy.hostname,
+                    proxy_port,
+                    timeout=TIMEOUT,
+                    context=self._get_ssl_context(),
+                )
+                conn.set_tunnel(host, port)
+            else:
+                conn = http.client.HTTPConnection(
+                    proxy.hostname, proxy_port, timeout=TIMEOUT
+                )
+        elif scheme == "https":
+            conn = http.client.HTTPSConnection(
+                host, port, timeout=TIMEOUT, context=self._get_ssl_context()
+            )
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=TIMEOUT)
+
+        return conn, False
+
+    def _release(self, key: _Key, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+
+        conn.close()
+
+    def _get_ssl_context(self) -> ssl.SSLContext:
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    def _get_proxy(
+        self, scheme: str, host: str
+    ) -> T.Optional[urllib.parse.SplitResult]:
+        proxy = urllib.request.getproxies().get(scheme)
+        if not proxy or urllib.request.proxy_bypass(host):
+            return None
+        if "://" not in proxy:
+            proxy = f"http://{proxy}"
+        return urllib.parse.urlsplit(proxy)
+
+
+_pool: T.Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    :returns: the connection pool shared by everything in this process
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
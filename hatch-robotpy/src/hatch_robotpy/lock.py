@@ -0,0 +1,149 @@
+"""
+Lock file that records the resolved downloads of a project for every
+platform, so builds don't need to resolve anything.
+
+robotpy-lock.json is created by ``python -m hatch_robotpy lock`` next to
+pyproject.toml. When it exists, the build hook uses the maven versions it
+records instead of fetching maven metadata, doesn't check that the
+artifacts exist, and pins each download to its recorded sha256 and size.
+With a populated cache this needs no network access at all.
+"""
+
+import dataclasses
+import json
+import os
+import pathlib
+import typing as T
+
+from .config import Download, MavenLibDownload
+
+LOCK_FILENAME = "robotpy-lock.json"
+LOCK_VERSION = 1
+
+_update_hint = f"run 'python -m hatch_robotpy lock' to update {LOCK_FILENAME}"
+
+
+class LockMismatch(ValueError):
+    pass
+
+
+@dataclasses.dataclass
+class LockedDownload:
+    url: str
+    size: int
+    sha256: str
+
+
+@dataclasses.dataclass
+class LockFile:
+    #: maven_key(mcfg): resolved version
+    maven: T.Dict[str, str] = dataclasses.field(default_factory=dict)
+
+    #: platform name: downloads for that platform, in configuration order
+    platforms: T.Dict[str, T.List[LockedDownload]] = dataclasses.field(
+        default_factory=dict
+    )
+
+    @classmethod
+    def load(cls, path: pathlib.Path) -> T.Optional["LockFile"]:
+        """
+        :returns: the lock file at path, or None if it doesn't exist
+        """
+        try:
+            with open(path) as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return None
+
+        if not isinstance(data, dict) or data.get("version") != LOCK_VERSION:
+            raise LockMismatch(f"{path}: unsupported version; {_update_hint}")
+
+        return cls(
+            maven=data["maven"],
+            platforms={
+                name: [LockedDownload(**d) for d in downloads]
+                for name, downloads in data["platforms"].items()
+            },
+        )
+
+    def save(self, path: pathlib.Path) -> None:
+        data = {
+            "version": LOCK_VERSION,
+            "maven": self.maven,
+            "platforms": {
+                name: [dataclasses.asdict(d) for d in downloads]
+                for name, downloads in self.platforms.items()
+            },
+        }
+
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        with open(tmp_path, "w") as fp:
+            json.dump(data, fp, indent=2, sort_keys=True)
+            fp.write("\n")
+        os.replace(tmp_path, path)
+
+    def resolve_versions(
+        self, mcfgs: T.List[MavenLibDownload]
+    ) -> T.List[MavenLibDownload]:
+        """
+        :returns: copies of mcfgs with the locked versions
+        :raises LockMismatch: if a maven download isn't in the lock file
+        """
+        resolved = []
+        missing = []
+        for mcfg in mcfgs:
+            version = self.maven.get(maven_key(mcfg))
+            if version is None:
+                missing.append(maven_key(mcfg))
+            else:
+                resolved.append(dataclasses.replace(mcfg, version=version))
+
+        if missing:
+            msg = f"{LOCK_FILENAME} has no version for:"
+            raise LockMismatch("\n  ".join([msg] + missing + [_update_hint]))
+
+        return resolved
+
+    def apply(self, platform_name: str, downloads: T.List[Download]) -> None:
+        """
+        Pins each download to the sha256 and size in the lock file
+
+        :raises LockMismatch: if the downloads are not the ones that were
+                              locked for the platform
+        """
+        locked = self.platforms.get(platform_name)
+        if locked is None:
+            raise LockMismatch(
+                f"{LOCK_FILENAME} has no downloads for platform {platform_name}; "
+                f"{_update_hint}"
+            )
+
+        by_url = {d.url: d for d in locked}
+        unused = set(by_url)
+        problems = []
+        for download in downloads:
+            ld = by_url.get(download.url)
+            unused.discard(download.url)
+            if ld is None:
+                problems.append(f"not locked: {download.url}")
+            elif download.sha256 and download.sha256.lower() != ld.sha256:
+                problems.append(
+                    f"sha256 in config ({download.sha256}) differs from the "
+                    f"locked sha256 ({ld.sha256}): {download.url}"
+                )
+            else:
+                download.sha256 = ld.sha256
+                download.size = ld.size
+
+        problems.extend(f"no longer used: {url}" for url in sorted(unused))
+
+        if problems:
+            msg = f"{LOCK_FILENAME} does not match the config for {platform_name}:"
+            raise LockMismatch("\n  ".join([msg] + problems + [_update_hint]))
+
+
+def maven_key(mcfg: MavenLibDownload) -> str:
+    """
+    :returns: key that identifies a maven download and its requested version
+    """
+    return f"{mcfg.repo_url}:{mcfg.group_id}:{mcfg.artifact_id}:{mcfg.version}"
@@ -0,0 +1,79 @@
+"""
+Create files from the shared cache as cheaply as the filesystem allows
+"""
+
+import errno
+import os
+import pathlib
+import shutil
+import sys
+
+#: Link modes that can be configured
+LINK_MODES = ("auto", "reflink", "hardlink", "copy")
+
+# from linux/fs.h
+_FICLONE = 0x40049409
+
+# errors that mean "can't do that here", rather than a real failure
+_UNSUPPORTED = {
+    errno.EXDEV,
+    errno.EPERM,
+    errno.EINVAL,
+    errno.ENOTTY,
+    errno.EOPNOTSUPP,
+    errno.EMLINK,
+}
+if hasattr(errno, "ENOTSUP"):
+    _UNSUPPORTED.add(errno.ENOTSUP)
+
+
+def reflink(src: pathlib.Path, dst: pathlib.Path) -> bool:
+    """
+    Creates dst as a copy-on-write clone of src
+
+    :returns: False if the filesystem does not support it
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+
+    import fcntl
+
+    with open(src, "rb") as sfp:
+        try:
+            with open(dst, "xb") as dfp:
+                fcntl.ioctl(dfp.fileno(), _FICLONE, sfp.fileno())
+        except OSError as e:
+            if e.errno in _UNSUPPORTED:
+                dst.unlink(missing_ok=True)
+                return False
+            raise
+
+    return True
+
+
+def materialize(src: pathlib.Path, dst: pathlib.Path, mode: str) -> str:
+    """
+    Creates dst with the content of src. dst must not exist, unless mode is
+    "copy" (dst is then overwritten).
+
+    :param mode: "auto" tries a reflink, then a hardlink, then copies.
+                 "reflink" tries a reflink and copies if that fails.
+                 "hardlink" tries a hardlink and copies if that fails.
+                 "copy" always copies. Only use a mode that allows
+                 hardlinks if dst will never be modified in place.
+    :returns: how the file was created
+    """
+    if mode in ("auto", "reflink"):
+        if reflink(src, dst):
+            return "reflink"
+
+    if mode in ("auto", "hardlink"):
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+
+    shutil.copyfile(src, dst)
+    return "copy"
@@ -1,16 +1,57 @@
+import dataclasses
+import os
+import pathlib
 import typing as T
+import urllib.parse
+import urllib.request
 
-from .config import Download, MavenLibDownload
+from .config import Download, HookConfig, MavenLibDownload
+from .platforms import WPILibMavenPlatform
 
+#: Checksum files that maven repositories publish next to every artifact
+MAVEN_CHECKSUMS = ("sha1",)
 
-def _get_artifact_url(dlcfg: MavenLibDownload, classifier: str) -> str:
-    # TODO: support development against locally installed things?
-    repo_url = dlcfg.repo_url
+
+def _get_artifact_path(dlcfg: MavenLibDownload, classifier: str) -> str:
     grp = dlcfg.group_id.replace(".", "/")
     art = dlcfg.artifact_id
     ver = dlcfg.version
 
-    return f"{repo_url}/{grp}/{art}/{ver}/{art}-{ver}-{classifier}.zip"
+    return f"{grp}/{art}/{ver}/{art}-{ver}-{classifier}.zip"
+
+
+def _get_artifact_url(dlcfg: MavenLibDownload, classifier: str) -> str:
+    return f"{dlcfg.repo_url}/{_get_artifact_path(dlcfg, classifier)}"
+
+
+def get_local_repos(mcfg: MavenLibDownload) -> T.List[str]:
+    """
+    :returns: local repository directories to search for mcfg, in order
+    """
+    repos = []
+    env_repos = os.environ.get("HATCH_ROBOTPY_LOCAL_REPOS")
+    if env_repos:
+        repos.extend(r for r in env_repos.split(os.pathsep) if r)
+    if mcfg.local_repos:
+        repos.extend(mcfg.local_repos)
+
+    paths = []
+    for repo in repos:
+        if repo.startswith("file:"):
+            repo = urllib.request.url2pathname(urllib.parse.urlsplit(repo).path)
+        paths.append(os.path.expanduser(repo))
+    return paths
+
+
+def _get_local_files(
+    mcfg: MavenLibDownload, classifier: str
+) -> T.Optional[T.List[str]]:
+    repos = get_local_repos(mcfg)
+    if not repos:
+        return None
+
+    path = _get_artifact_path(mcfg, classifier)
+    return [f"{repo.rstrip('/')}/{path}" for repo in repos]
 
 
 def convert_maven_to_downloads(mcfg: MavenLibDownload) -> T.List[Download]:
@@ -48,19 +89,28 @@ def convert_maven_to_downloads(mcfg: MavenLibDownload) -> T.List[Download]:
             dl_lib["libs"] = libs
             dl_lib["libdir"] = "${OS}/${ARCH}/shared"
             dl_lib["url"] = _get_artifact_url(mcfg, "${OS}${ARCH}")
+            dl_lib["local_files"] = _get_local_files(mcfg, "${OS}${ARCH}")
             dl_lib["strip"] = mcfg.strip
+            dl_lib["revalidate"] = mcfg.revalidate
+            dl_lib["checksums"] = list(MAVEN_CHECKSUMS)
 
         if mcfg.staticlibs is not None:
             dl_static["extract_to"] = mcfg.extract_to
             dl_static["staticlibs"] = mcfg.staticlibs
             dl_static["libdir"] = "${OS}/${ARCH}/static"
             dl_static["url"] = _get_artifact_url(mcfg, "${OS}${ARCH}static")
+            dl_static["local_files"] = _get_local_files(mcfg, "${OS}${ARCH}static")
             dl_static["strip"] = mcfg.strip
+            dl_static["revalidate"] = mcfg.revalidate
+            dl_static["checksums"] = list(MAVEN_CHECKSUMS)
 
     # headers
     dl_header["extract_to"] = mcfg.extract_to
     dl_header["incdir"] = ""
     dl_header["url"] = _get_artifact_url(mcfg, "headers")
+    dl_header["local_files"] = _get_local_files(mcfg, "headers")
+    dl_header["revalidate"] = mcfg.revalidate
+    dl_header["checksums"] = list(MAVEN_CHECKSUMS)
     # dl_header["header_patches"] = mcfg.header_patches
 
     # Construct downloads and return it
@@ -70,3 +120,57 @@ def convert_maven_to_downloads(mcfg: MavenLibDownload) -> T.List[Download]:
             downloads.append(Download(**d))
 
     return downloads
+
+
+def get_downloads(
+    cfg: HookConfig,
+    platform: WPILibMavenPlatform,
+    mcfgs: T.Optional[T.List[MavenLibDownload]] = None,
+) -> T.List[Download]:
+    """
+    Expands the downloads of a hook configuration for a platform
+
+    :param mcfgs: maven downloads to use instead of cfg.maven_lib_download,
+                  such as ones with resolved versions
+    """
+    if mcfgs is None:
+        mcfgs = cfg.maven_lib_download
+
+    downloads = [dataclasses.replace(d) for d in cfg.download]
+    for download in downloads:
+        download._update_with_platform(platform)
+
+    return downloads + get_maven_downloads(mcfgs, platform)
+
+
+def get_maven_downloads(
+    mcfgs: T.List[MavenLibDownload], platform: WPILibMavenPlatform
+) -> T.List[Download]:
+    """
+    Expands maven downloads for a platform
+    """
+    downloads = []
+    for mcfg in mcfgs:
+        dls = convert_maven_to_downloads(mcfg)
+        downloads.extend(dls)
+
+    for download in downloads:
+        download._update_with_platform(platform)
+
+    return downloads
+
+
+def find_local_file(
+    download: Download, root: pathlib.Path
+) -> T.Optional[pathlib.Path]:
+    """
+    :param root: directory that relative local files are relative to
+    :returns: the first of download.local_files that exists
+    """
+    if download.local_files:
+        for local_file in download.local_files:
+            path = root / os.path.expanduser(local_file)
+            if path.is_file():
+                return path
+
+    return None
@@ -0,0 +1,298 @@
+"""
+Resolves maven versions using maven-metadata.xml, and checks that the
+artifacts needed for a build exist before anything is downloaded.
+
+Supported version specifications:
+
+* An exact version such as ``1.2.3`` (no metadata is fetched)
+* ``latest`` or ``release``
+* Maven version ranges such as ``[1.0,2.0)``, ``[1.5,)`` or ``(,2.0]``,
+  optionally several of them separated by commas
+"""
+
+import dataclasses
+import os
+import pathlib
+import re
+import time
+import typing as T
+import urllib.error
+import urllib.parse
+import uuid
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import url_key
+from .config import Download, MavenLibDownload
+from .download import USER_AGENT, open_url
+from .httppool import get_pool
+from .maven import get_local_repos
+
+#: Number of seconds that cached maven-metadata.xml files are used for. The
+#: HATCH_ROBOTPY_METADATA_TTL environment variable overrides this.
+DEFAULT_TTL = 60 * 60
+
+_range_re = re.compile(r"[\[\(][^\]\)]*[\]\)]")
+_token_re = re.compile(r"\d+|[a-zA-Z]+")
+
+# maven qualifier ordering, a version without a qualifier is a release
+_qualifiers = {
+    "alpha": 0,
+    "a": 0,
+    "beta": 1,
+    "b": 1,
+    "milestone": 2,
+    "m": 2,
+    "rc": 3,
+    "cr": 3,
+    "snapshot": 4,
+    "": 5,
+    "ga": 5,
+    "final": 5,
+    "release": 5,
+    "sp": 6,
+}
+_RELEASE = (1, 5, "")
+
+
+def version_key(version: str) -> T.List[T.Tuple[int, int, str]]:
+    """
+    Sort key that approximates maven version ordering: numbers compare
+    numerically, known qualifiers (alpha, beta, rc...) sort before a
+    release, and unknown qualifiers sort before known ones
+    """
+    key = []
+    for token in _token_re.findall(version):
+        if token.isdigit():
+            key.append((2, int(token), ""))
+        else:
+            q = _qualifiers.get(token.lower())
+            if q is None:
+                key.append((0, 0, token.lower()))
+            else:
+                key.append((1, q, ""))
+
+    key.append(_RELEASE)
+    return key
+
+
+def _in_range(version: str, spec: str) -> bool:
+    lower_inc = spec[0] == "["
+    upper_inc = spec[-1] == "]"
+    bounds = spec[1:-1]
+
+    if "," not in bounds:
+        # [1.0] is an exact version
+        return version_key(version) == version_key(bounds.strip())
+
+    lower, upper = (b.strip() for b in bounds.split(",", 1))
+    key = version_key(version)
+    if lower:
+        lkey = version_key(lower)
+        if key < lkey or (key == lkey and not lower_inc):
+            return False
+    if upper:
+        ukey = version_key(upper)
+        if key > ukey or (key == ukey and not upper_inc):
+            return False
+    return True
+
+
+@dataclasses.dataclass
+class MavenMetadata:
+    versions: T.List[str]
+    latest: T.Optional[str] = None
+    release: T.Optional[str] = None
+
+
+class MavenResolver:
+    """
+    Fetches maven-metadata.xml once per artifact and caches it on disk.
+    """
+
+    def __init__(
+        self, cache_dir: T.Optional[pathlib.Path], ttl: T.Optional[float] = None
+    ) -> None:
+        self.cache_dir = cache_dir
+        if ttl is None:
+            ttl = float(os.environ.get("HATCH_ROBOTPY_METADATA_TTL", DEFAULT_TTL))
+        self.ttl = ttl
+
+    def resolve_versions(
+        self, mcfgs: T.List[MavenLibDownload], jobs: int = 4
+    ) -> T.List[MavenLibDownload]:
+        """
+        Resolves the version of every artifact, fetching the metadata for
+        all of them in parallel
+
+        :returns: copies of mcfgs with exact versions
+        """
+        need = [m for m in mcfgs if self.needs_metadata(m.version)]
+        coords = {(m.repo_url, m.group_id, m.artifact_id): m for m in need}
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            fetched = dict(
+                zip(coords, executor.map(self.get_metadata, coords.values()))
+            )
+
+        resolved = []
+        errors = []
+        for mcfg in mcfgs:
+            if not self.needs_metadata(mcfg.version):
+                resolved.append(mcfg)
+                continue
+
+            metadata = fetched[(mcfg.repo_url, mcfg.group_id, mcfg.artifact_id)]
+            version = self.select_version(metadata, mcfg.version)
+            if version is None:
+                errors.append(
+                    f"{mcfg.group_id}:{mcfg.artifact_id}: no version matches "
+                    f"{mcfg.version!r} (available: {', '.join(metadata.versions)})"
+                )
+            else:
+                resolved.append(dataclasses.replace(mcfg, version=version))
+
+        if errors:
+            msg = "\n  ".join(["could not resolve maven versions:"] + errors)
+            raise ValueError(msg)
+
+        return resolved
+
+    @staticmethod
+    def needs_metadata(version: str) -> bool:
+        if version in ("latest", "release"):
+            return True
+        return _range_re.match(version) is not None
+
+    @staticmethod
+    def select_version(metadata: MavenMetadata, spec: str) -> T.Optional[str]:
+        versions = sorted(metadata.versions, key=version_key)
+        if spec == "latest":
+            if metadata.latest:
+                return metadata.latest
+            return versions[-1] if versions else None
+
+        if spec == "release":
+            if metadata.release:
+                return metadata.release
+            versions = [v for v in versions if not v.endswith("-SNAPSHOT")]
+            return versions[-1] if versions else None
+
+        ranges = _range_re.findall(spec)
+        for version in reversed(versions):
+            if any(_in_range(version, r) for r in ranges):
+                return version
+        return None
+
+    def get_metadata(self, mcfg: MavenLibDownload) -> MavenMetadata:
+        """
+        :returns: versions available in local repositories and repo_url
+        """
+        grp = mcfg.group_id.replace(".", "/")
+        art = mcfg.artifact_id
+
+        versions: T.Set[str] = set()
+        for repo in get_local_repos(mcfg):
+            artifact_dir = pathlib.Path(repo) / grp / art
+            if artifact_dir.is_dir():
+                versions.update(
+                    p.name for p in artifact_dir.iterdir() if p.is_dir()
+                )
+
+        url = f"{mcfg.repo_url}/{grp}/{art}/maven-metadata.xml"
+        try:
+            data = self._fetch(url)
+        except (OSError, urllib.error.URLError):
+            # offline, but maybe what is available locally is enough
+            if not versions:
+                raise
+            data = None
+
+        metadata = MavenMetadata(versions=[])
+        if data is not None:
+            metadata = _parse_metadata(data)
+
+        versions.update(metadata.versions)
+        metadata.versions = sorted(versions, key=version_key)
+        return metadata
+
+    def _fetch(self, url: str) -> T.Optional[bytes]:
+        """
+        :returns: contents of url, or None if it doesn't exist
+        """
+        cached = None
+        if self.cache_dir is not None:
+            cached = self.cache_dir / f"{url_key(url)}.xml"
+            try:
+                if time.time() - cached.stat().st_mtime < self.ttl:
+                    return cached.read_bytes()
+            except FileNotFoundError:
+                pass
+
+        try:
+            with open_url(url, {"User-Agent": USER_AGENT}) as fp:
+                data = fp.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+        except (OSError, urllib.error.URLError):
+            # use stale metadata rather than failing
+            if cached is not None and cached.exists():
+                return cached.read_bytes()
+            raise
+
+        if cached is not None:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            # other processes may be writing it too
+            tmp_path = cached.with_name(f"{cached.name}.{uuid.uuid4().hex}.tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, cached)
+
+        return data
+
+
+def check_downloads_exist(downloads: T.List[Download], jobs: int = 4) -> None:
+    """
+    Checks that each download exists on its server, so that a missing
+    artifact (such as a resolved version that wasn't published for this
+    platform) is found before the build starts instead of partway through it
+
+    :raises ValueError: listing every download that does not exist
+    """
+
+    def _check(download: Download) -> T.Optional[str]:
+        scheme = urllib.parse.urlsplit(download.url).scheme.lower()
+        if scheme not in ("http", "https"):
+            return None
+
+        headers = {"User-Agent": USER_AGENT}
+        try:
+            with get_pool().request("HEAD", download.url, headers) as response:
+                if response.status in (404, 410):
+                    return download.url
+        except (OSError, urllib.error.URLError):
+            pass
+        # other errors will be reported when the download happens
+        return None
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        missing = [url for url in executor.map(_check, downloads) if url]
+
+    if missing:
+        msg = "the following artifacts do not exist (is this platform supported?):"
+        raise ValueError("\n  ".join([msg] + missing))
+
+
+def _parse_metadata(data: bytes) -> MavenMetadata:
+    root = ET.fromstring(data)
+    versioning = root.find("versioning")
+    if versioning is None:
+        version = root.findtext("version")
+        return MavenMetadata(versions=[version] if version else [])
+
+    return MavenMetadata(
+        versions=[v.text for v in versioning.iterfind("versions/version") if v.text],
+        latest=versioning.findtext("latest") or None,
+        release=versioning.findtext("release") or None,
+    )
@@ -90,6 +90,19 @@ def get_platform(name: typing.Optional[str] = None) -> WPILibMavenPlatform:
     Retrieve platform specific information
     """
 
+    name = get_platform_name(name)
+
+    try:
+        return _platforms[name]
+    except KeyError:
+        raise KeyError(f"platform {name} is not supported")
+
+
+def get_platform_name(name: typing.Optional[str] = None) -> str:
+    """
+    Retrieve the name of the platform that is being built for, if not given
+    """
+
     # TODO: _PYTHON_HOST_PLATFORM is used for cross builds,
     #       and is returned directly from get_platform. Might
     #       be useful to note for the future.
@@ -105,7 +118,7 @@ def get_platform(name: typing.Optional[str] = None) -> WPILibMavenPlatform:
             or re.fullmatch(r"macosx-.*-arm64", pyplatform)
             or re.fullmatch(r"macosx-.*-universal2", pyplatform)
         ):
-            return _platforms["macos-universal"]
+            return "macos-universal"
 
         if pyplatform == "linux-armv7l":
             try:
@@ -132,10 +145,7 @@ def get_platform(name: typing.Optional[str] = None) -> WPILibMavenPlatform:
 
         name = pyplatform
 
-    try:
-        return _platforms[name]
-    except KeyError:
-        raise KeyError(f"platform {name} is not supported")
+    return name
 
 
 def get_platform_override_keys(platform: WPILibMavenPlatform):
@@ -1,22 +1,24 @@
-import contextlib
 import functools
 import os
 import pathlib
 import posixpath
 import shutil
-import subprocess
 import sys
-import sysconfig
-import tempfile
+import time
 import typing as T
 
 from hatchling.builders.hooks.plugin.interface import BuildHookInterface
-from validobj.validation import parse_input
 
-from .config import HookConfig, Download
-from .download import download_file, extract_zip
-from .maven import convert_maven_to_downloads
-from .platforms import get_platform
+from . import tracing
+
+# hatch imports every installed hook plugin to register it, even for
+# projects that don't use it and for sdists. Keep this module cheap to
+# import: everything else is imported where it is first needed, and
+# benchmarks/import_time.py checks that it stays that way.
+if T.TYPE_CHECKING:
+    from .config import Download, HookConfig
+    from .download import ChecksumMismatch, ExtractManifest
+    from .lock import LockFile
 
 
 class DownloadHook(BuildHookInterface):
@@ -26,74 +28,291 @@ class DownloadHook(BuildHookInterface):
         # Don't need to generate files when creating an sdist
         # - this violates the idea that an sdist should be able to be used
         #   offline, but because we're downloading the external artifacts
-        #   we don't expect that to be a usecase anyways
-        #   TODO: add support for getting files from local maven repository?
+        #   we don't expect that to be a usecase anyways. Use local_repos
+        #   to build without network access.
         if self.target_name != "wheel":
             return
 
         build_data["pure_python"] = False
 
-        root = pathlib.Path(self.root)
+        # HATCH_ROBOTPY_TRACE=trace.json records where the time goes
+        with tracing.trace("HATCH_ROBOTPY") as tracer:
+            try:
+                self._initialize(build_data)
+            finally:
+                if tracer.enabled:
+                    self.app.display_info(self._trace_summary(tracer))
+
+        # Setup the wheel tag
+        if "tag" not in build_data:
+            build_data["tag"] = f"py3-none-{self.platform.tag}"
+
+    def _initialize(self, build_data: T.Dict[str, T.Any]) -> None:
+        from concurrent.futures import Future, ThreadPoolExecutor
+
+        from .download import ExtractManifest
+
+        tracer = tracing.get_tracer()
 
         self.setup_cache()
         try:
+            with tracer.span("resolve", "phase"):
+                downloads = self.resolved_downloads
+
+            # Output directories are shared between downloads (shared and
+            # static libraries both go to lib), so prepare them all before
+            # anything is extracted
+            manifests: T.Dict[pathlib.Path, ExtractManifest] = {}
+            jobs = []
+            for download in downloads:
+                extract_root = self.get_dl_extract_root(download)
+                manifest = manifests.get(extract_root)
+                if manifest is None:
+                    manifest = ExtractManifest(
+                        extract_root, self.cache.manifest_path(extract_root)
+                    )
+                    manifests[extract_root] = manifest
 
-            for download in self.downloads:
                 lib_map = self.make_lib_map(download)
-                downloaded = self.download(download, lib_map.copy())
-
-                # strip bin
-                if self.target_name == "wheel":
-                    if self.platform.os == "linux":
-                        for lib in lib_map.values():
-                            self.strip(lib)
-
-                build_data["artifacts"] += [
-                    p.relative_to(root).as_posix() for p in downloaded
+                to = self.prepare_download(download, lib_map.copy(), manifest)
+                jobs.append((download, lib_map, to, manifest))
+
+            # Fetch in parallel, each download is extracted by its worker as
+            # soon as it is available. Results are processed in config order
+            # so that the artifact list is deterministic
+            stripping: T.List[T.Tuple[pathlib.Path, ExtractManifest, Future]] = []
+            strip_start = time.monotonic()
+            with ThreadPoolExecutor(
+                max_workers=self.download_jobs
+            ) as executor, ThreadPoolExecutor() as strip_executor:
+                futures = [
+                    executor.submit(
+                        self.download,
+                        download,
+                        to,
+                        manifest,
+                        self.will_strip(download),
+                    )
+                    for download, _, to, manifest in jobs
                 ]
+                try:
+                    with tracer.span("fetch", "phase"):
+                        for (download, lib_map, _, manifest), future in zip(
+                            jobs, futures
+                        ):
+                            artifacts = future.result()
+
+                            # strip bin in the background, unless it was
+                            # stripped by a previous build
+                            if self.will_strip(download):
+                                for lib in lib_map.values():
+                                    if manifest.was_written(lib):
+                                        if not stripping:
+                                            strip_start = time.monotonic()
+                                        f = strip_executor.submit(self.strip, lib)
+                                        stripping.append((lib, manifest, f))
+
+                            build_data["artifacts"] += artifacts
+
+                    # strip jobs still running after the last download
+                    cached = 0
+                    with tracer.span("strip", "phase"):
+                        for lib, manifest, f in stripping:
+                            cached += f.result()
+                            manifest.update_stat(lib)
+                finally:
+                    for future in futures:
+                        future.cancel()
+                    for _, _, f in stripping:
+                        f.cancel()
+
+            if stripping:
+                elapsed = time.monotonic() - strip_start
+                self.app.display_info(
+                    f"Stripped {len(stripping)} libraries in {elapsed:.2f}s "
+                    f"({cached} from cache)"
+                )
+
+            with tracer.span("finish", "phase"):
+                for manifest in manifests.values():
+                    for path in manifest.remove_stale():
+                        self.app.display_debug(f"Removed {path}")
+                    try:
+                        manifest.save()
+                    except OSError as e:
+                        # the next build just writes every file again
+                        self.app.display_debug(f"Could not save {manifest.path}: {e}")
+                self.cache.remove_stale_manifests()
 
         finally:
             self.cleanup_cache()
 
-        # Setup the wheel tag
-        if "tag" not in build_data:
-            build_data["tag"] = f"py3-none-{self.platform.tag}"
+    def _trace_summary(self, tracer: tracing.Tracer) -> str:
+        from .cache import format_size
+
+        c = tracer.counters
+        return (
+            f"Trace: {tracer.summary()}; "
+            f"{c.get('downloads', 0)} downloads "
+            f"({c.get('cache hits', 0)} cached, "
+            f"{format_size(c.get('bytes downloaded', 0))} downloaded), "
+            f"{c.get('files extracted', 0)} files extracted, "
+            f"{c.get('libraries stripped', 0)} libraries stripped, "
+            f"{c.get('subprocesses', 0)} subprocesses -> {tracer.path}"
+        )
 
     @functools.cached_property
-    def parsed_cfg(self):
+    def parsed_cfg(self) -> "HookConfig":
+        from validobj.validation import parse_input
+
+        from .config import HookConfig
+
         return parse_input(self.config, HookConfig)
 
+    @functools.cached_property
+    def download_jobs(self) -> int:
+        jobs = os.environ.get("HATCH_ROBOTPY_DOWNLOAD_JOBS")
+        if jobs:
+            try:
+                njobs = int(jobs)
+            except ValueError:
+                raise ValueError(
+                    f"HATCH_ROBOTPY_DOWNLOAD_JOBS must be an integer (got {jobs!r})"
+                )
+        else:
+            njobs = self.parsed_cfg.download_jobs
+
+        return max(njobs, 1)
+
+    @functools.cached_property
+    def revalidate(self) -> bool:
+        # HATCH_ROBOTPY_REVALIDATE=1 checks all cached artifacts with the server
+        return os.environ.get("HATCH_ROBOTPY_REVALIDATE", "0") not in ("", "0")
+
+    @functools.cached_property
+    def remote_zip(self) -> bool:
+        remote_zip = os.environ.get("HATCH_ROBOTPY_REMOTE_ZIP")
+        if remote_zip is None:
+            return self.parsed_cfg.remote_zip
+        return remote_zip not in ("", "0")
+
+    @functools.cached_property
+    def link_mode(self) -> str:
+        from .materialize import LINK_MODES
+
+        link_mode = (
+            os.environ.get("HATCH_ROBOTPY_LINK_MODE") or self.parsed_cfg.link_mode
+        )
+        if link_mode not in LINK_MODES:
+            raise ValueError(
+                f"link_mode must be one of {', '.join(LINK_MODES)} (got {link_mode!r})"
+            )
+        return link_mode
+
+    @functools.cached_property
+    def platform_name(self) -> str:
+        from .platforms import get_platform_name
+
+        return get_platform_name()
+
     @functools.cached_property
     def platform(self):
-        return get_platform()
+        from .platforms import get_platform
+
+        return get_platform(self.platform_name)
 
     @functools.cached_property
-    def downloads(self):
+    def lock(self) -> T.Optional["LockFile"]:
+        from .lock import LOCK_FILENAME, LockFile
+
+        return LockFile.load(pathlib.Path(self.root) / LOCK_FILENAME)
 
-        downloads = self.parsed_cfg.download[:]
+    @functools.cached_property
+    def downloads(self) -> T.List["Download"]:
+        """
+        Downloads as configured. Maven versions are not resolved, so only
+        use this for things that don't depend on the version.
+        """
+        from .maven import get_downloads
 
-        for mcfg in self.parsed_cfg.maven_lib_download:
-            dls = convert_maven_to_downloads(mcfg)
-            downloads.extend(dls)
+        return get_downloads(self.parsed_cfg, self.platform)
 
-        for download in downloads:
-            download._update_with_platform(self.platform)
+    @functools.cached_property
+    def resolved_downloads(self) -> T.List["Download"]:
+        """
+        Downloads with maven versions resolved. Downloads whose version was
+        resolved from maven metadata, and that aren't available locally,
+        are checked to exist on the server in one pass before anything is
+        downloaded. Requires setup_cache.
+
+        If there is a lock file, the versions and hashes recorded in it are
+        used instead, which doesn't need network access.
+        """
+        from .maven import get_downloads, get_maven_downloads
+        from .metadata import MavenResolver, check_downloads_exist
+
+        lock = self.lock
+        if lock is not None:
+            mcfgs = lock.resolve_versions(self.parsed_cfg.maven_lib_download)
+            downloads = get_downloads(self.parsed_cfg, self.platform, mcfgs)
+            lock.apply(self.platform_name, downloads)
+            return downloads
+
+        resolver = MavenResolver(self.cache.root / "metadata")
+        mcfgs = resolver.resolve_versions(
+            self.parsed_cfg.maven_lib_download, self.download_jobs
+        )
+        downloads = get_downloads(self.parsed_cfg, self.platform, mcfgs)
+
+        # a resolved version may not have been published for this platform;
+        # any other missing artifact is reported when it is downloaded
+        resolved = [
+            mcfg
+            for orig, mcfg in zip(self.parsed_cfg.maven_lib_download, mcfgs)
+            if resolver.needs_metadata(orig.version)
+        ]
+        unavailable = [
+            download
+            for download in get_maven_downloads(resolved, self.platform)
+            if self.find_local_file(download) is None
+            and not self.cache.contains(download.url)
+        ]
+        check_downloads_exist(unavailable, self.download_jobs)
 
         return downloads
 
     def setup_cache(self):
+        import tempfile
+
+        from .cache import ArtifactCache, get_max_size, get_user_cache_dir
+
         if "HATCH_ROBOTPY_CACHE" in os.environ:
-            self.cache = pathlib.Path(os.environ["HATCH_ROBOTPY_CACHE"])
-            self.cache.mkdir(parents=True, exist_ok=True)
+            root = pathlib.Path(os.environ["HATCH_ROBOTPY_CACHE"])
+            max_size = get_max_size(self.parsed_cfg.cache_max_size)
+            manifests_dir = None
+            self.cache_is_shared = True
         else:
             self._cache = tempfile.TemporaryDirectory()
-            self.cache = pathlib.Path(self._cache.name)
+            root = pathlib.Path(self._cache.name)
+            max_size = None
+            # the next build needs the manifests to skip unchanged files
+            manifests_dir = get_user_cache_dir() / "manifests"
+            self.cache_is_shared = False
+
+        self.cache = ArtifactCache(root, max_size, manifests_dir)
 
     def cleanup_cache(self):
         if hasattr(self, "_cache"):
             self._cache.cleanup()
 
     def clean(self, versions: T.List[str]) -> None:
+        self.setup_cache()
+        try:
+            self._clean_downloads()
+        finally:
+            self.cleanup_cache()
+
+    def _clean_downloads(self) -> None:
         for download in self.downloads:
             incdir = self.get_dl_include_dir(download)
             if incdir is not None:
@@ -103,18 +322,21 @@ class DownloadHook(BuildHookInterface):
             if libdir is not None:
                 shutil.rmtree(libdir, ignore_errors=True)
 
-    def get_dl_extract_root(self, download: Download) -> pathlib.Path:
+            manifest = self.cache.manifest_path(self.get_dl_extract_root(download))
+            manifest.unlink(missing_ok=True)
+
+    def get_dl_extract_root(self, download: "Download") -> pathlib.Path:
         return pathlib.Path(self.root) / pathlib.PurePosixPath(download.extract_to)
 
-    def get_dl_include_dir(self, download: Download) -> T.Optional[pathlib.Path]:
+    def get_dl_include_dir(self, download: "Download") -> T.Optional[pathlib.Path]:
         if download.incdir is not None:
             return self.get_dl_extract_root(download) / "include"
 
-    def get_dl_lib_dir(self, download: Download) -> T.Optional[pathlib.Path]:
+    def get_dl_lib_dir(self, download: "Download") -> T.Optional[pathlib.Path]:
         if download.libs is not None or download.staticlibs is not None:
             return self.get_dl_extract_root(download) / "lib"
 
-    def make_lib_map(self, download: Download) -> T.Dict[str, pathlib.Path]:
+    def make_lib_map(self, download: "Download") -> T.Dict[str, pathlib.Path]:
 
         to: T.Dict[str, pathlib.Path] = {}
 
@@ -143,32 +365,201 @@ class DownloadHook(BuildHookInterface):
 
         return to
 
-    def download(
-        self, download: Download, to: T.Dict[str, pathlib.Path]
-    ) -> T.List[pathlib.Path]:
+    def prepare_download(
+        self,
+        download: "Download",
+        to: T.Dict[str, pathlib.Path],
+        manifest: "ExtractManifest",
+    ) -> T.Dict[str, pathlib.Path]:
+        """
+        Adds the include directory to the extraction map. If there is no
+        record of what was previously extracted, previous output of the
+        download is removed.
+        """
 
         incdir = self.get_dl_include_dir(download)
         libdir = self.get_dl_lib_dir(download)
 
         if incdir is not None:
             assert download.incdir is not None
-            shutil.rmtree(incdir, ignore_errors=True)
+            if not manifest.exists:
+                shutil.rmtree(incdir, ignore_errors=True)
             to[download.incdir] = incdir
 
         if libdir is not None:
-            shutil.rmtree(libdir, ignore_errors=True)
+            if not manifest.exists:
+                shutil.rmtree(libdir, ignore_errors=True)
+
+        return to
+
+    def download(
+        self,
+        download: "Download",
+        to: T.Dict[str, pathlib.Path],
+        manifest: T.Optional["ExtractManifest"] = None,
+        modified: bool = False,
+    ) -> T.List[str]:
+        """
+        Fetches a download and extracts it. This is called from worker
+        threads, so it must not modify shared state.
+
+        :param modified: True if extracted files will be modified in place
+        :returns: artifacts relative to the project root
+        """
+        import uuid
+
+        from .download import ChecksumMismatch, download_file
+        from .remotezip import fetch_zip_members
+
+        tracer = tracing.get_tracer()
+        tracer.count("downloads")
+
+        local_file = self.find_local_file(download)
+        if local_file is not None:
+            self.app.display_info(f"Using {local_file}")
+            if download.size is not None:
+                actual_size = local_file.stat().st_size
+                if actual_size != download.size:
+                    raise self._checksum_mismatch(
+                        ChecksumMismatch(
+                            f"{local_file}: size mismatch (expected "
+                            f"{download.size}, got {actual_size})"
+                        )
+                    )
+            if download.sha256:
+                from .cache import file_sha256
+
+                with tracer.span("check local file", path=str(local_file)):
+                    actual = file_sha256(local_file)
+                if actual != download.sha256.lower():
+                    raise self._checksum_mismatch(
+                        ChecksumMismatch(
+                            f"{local_file}: sha256 mismatch (expected "
+                            f"{download.sha256.lower()}, got {actual})"
+                        )
+                    )
+            tracer.count("cache hits")
+            return self._extract(local_file, to, manifest)
+
+        # a partial download can't be checked against the sha256 of the
+        # whole file, so pinned downloads are always fetched whole
+        if (
+            self.remote_zip
+            and not download.sha256
+            and not self.cache.contains(download.url)
+        ):
+            fname = self.cache.tmp_dir / f"{uuid.uuid4().hex}.zip"
+            self.app.display_info(f"Downloading members of {download.url}")
+            try:
+                with tracer.span("download", url=download.url, cache="partial"):
+                    fetched = fetch_zip_members(download.url, to, fname)
+                if fetched:
+                    return self._extract(fname, to, manifest)
+            finally:
+                fname.unlink(missing_ok=True)
+
+            self.app.display_info(
+                f"-> partial download not possible, downloading all of {download.url}"
+            )
 
         self.app.display_info(f"Downloading {download.url}")
-        cached_fname, present = download_file(download.url, self.cache)
+        revalidate = download.revalidate or self.revalidate
+        with tracer.span("download", url=download.url) as args:
+            try:
+                cached_fname, present = download_file(
+                    download.url,
+                    self.cache,
+                    revalidate,
+                    download.sha256,
+                    download.checksums,
+                    download.size,
+                )
+            except ChecksumMismatch as e:
+                raise self._checksum_mismatch(e) from e
+            if present:
+                args["cache"] = "hit"
+                tracer.count("cache hits")
+            else:
+                # a resumed download transferred less than this
+                size = cached_fname.stat().st_size
+                args["cache"] = "miss"
+                args["bytes"] = size
+                tracer.count("bytes downloaded", size)
+
         if present:
-            self.app.display_info("-> already present in cache")
+            self.app.display_info(f"-> {download.url} already present in cache")
+
+        # Share the extracted artifact with other projects
+        tree = None
+        link_mode = self.link_mode
+        if link_mode != "copy" and self.cache_is_shared:
+            with tracer.span("extracted tree", url=download.url):
+                tree = self.cache.extracted_tree(download.url)
+            if modified and link_mode in ("auto", "hardlink"):
+                link_mode = "reflink" if link_mode == "auto" else "copy"
+
+        return self._extract(
+            cached_fname, to, manifest, tree, link_mode, verified=True
+        )
+
+    def _checksum_mismatch(self, e: "ChecksumMismatch") -> "ChecksumMismatch":
+        from .download import ChecksumMismatch
+        from .lock import LOCK_FILENAME
+
+        if self.lock is not None:
+            return ChecksumMismatch(
+                f"{e}\n{LOCK_FILENAME} is out of date, or the artifact "
+                f"was changed"
+            )
+        return e
+
+    def _extract(
+        self,
+        fname: pathlib.Path,
+        to: T.Dict[str, pathlib.Path],
+        manifest: T.Optional["ExtractManifest"],
+        tree: T.Optional[pathlib.Path] = None,
+        link_mode: str = "copy",
+        verified: bool = False,
+    ) -> T.List[str]:
+        from .download import extract_zip
 
-        return extract_zip(cached_fname, to)
+        root = pathlib.Path(self.root)
+        tracer = tracing.get_tracer()
+        with tracer.span("extract", zip=fname.name, link_mode=link_mode) as args:
+            artifacts = [
+                p.relative_to(root).as_posix()
+                for p in extract_zip(
+                    fname,
+                    to,
+                    manifest=manifest,
+                    tree=tree,
+                    link_mode=link_mode,
+                    verified=verified,
+                )
+            ]
+            args["files"] = len(artifacts)
+            tracer.count("files extracted", len(artifacts))
+        return artifacts
+
+    def find_local_file(self, download: "Download") -> T.Optional[pathlib.Path]:
+        from .maven import find_local_file
+
+        return find_local_file(download, pathlib.Path(self.root))
+
+    def will_strip(self, download: "Download") -> bool:
+        return (
+            self.target_name == "wheel"
+            and self.platform.os == "linux"
+            and self.get_dl_lib_dir(download) is not None
+        )
 
     @functools.cached_property
     def strip_exe(self):
         strip_exe = "strip"
         if getattr(sys, "cross_compiling", False):
+            import sysconfig
+
             # This is a hack, but the information doesn't seem to be available
             # in other accessible ways
             ar_exe = sysconfig.get_config_var("AR")
@@ -177,7 +568,29 @@ class DownloadHook(BuildHookInterface):
 
         return strip_exe
 
-    def strip(self, path: pathlib.Path):
+    def strip(self, path: pathlib.Path) -> bool:
+        """
+        Strips a library, reusing the result from the cache if the same
+        library has been stripped before. This is called from worker threads.
+
+        :returns: True if the result came from the cache
+        """
+        from .strip import strip_library
+
         strip_exe = self.strip_exe
-        self.app.display_info(f"+ {strip_exe} {path}")
-        subprocess.check_call([strip_exe, str(path)])
+        cache = self.cache if self.cache_is_shared else None
+
+        tracer = tracing.get_tracer()
+        start = time.monotonic()
+        with tracer.span("strip library", path=path.name) as args:
+            cached = strip_library(path, strip_exe, cache=cache)
+            args["cached"] = cached
+        elapsed = time.monotonic() - start
+
+        tracer.count("libraries stripped")
+        if not cached:
+            tracer.count("subprocesses")
+
+        how = "from cache" if cached else f"{elapsed:.2f}s"
+        self.app.display_info(f"+ {strip_exe} {path} ({how})")
+        return cached
@@ -0,0 +1,208 @@
+"""
+Fill the download cache for several projects and platforms at once, so that
+builds can start from a warm cache, and create lock files.
+"""
+
+import dataclasses
+import pathlib
+import sys
+import typing as T
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from validobj.validation import parse_input
+
+from .cache import ArtifactCache, file_sha256
+from .config import Download, HookConfig
+from .download import ChecksumMismatch, download_file
+from .lock import LockedDownload, LockFile, maven_key
+from .maven import find_local_file, get_downloads
+from .metadata import MavenResolver
+from .platforms import get_platform
+
+if sys.version_info >= (3, 11):
+    import tomllib
+else:
+    import tomli as tomllib
+
+# options that hatch handles for every build hook
+_HATCH_HOOK_OPTIONS = (
+    "dependencies",
+    "enable-by-default",
+    "require-runtime-dependencies",
+    "require-runtime-features",
+)
+
+
+@dataclasses.dataclass
+class Project:
+    #: pyproject.toml that the configuration came from
+    pyproject: pathlib.Path
+
+    cfg: HookConfig
+
+    @property
+    def root(self) -> pathlib.Path:
+        return self.pyproject.parent
+
+
+@dataclasses.dataclass
+class PrefetchResult:
+    url: str
+
+    #: True if the file was already in the cache
+    present: bool = False
+
+    #: Size and sha256 of the cached file
+    size: int = 0
+    sha256: T.Optional[str] = None
+
+    #: Why the download failed
+    error: T.Optional[str] = None
+
+
+def load_project(pyproject: pathlib.Path) -> Project:
+    """
+    Reads the robotpy hook configuration from a pyproject.toml
+    """
+    with open(pyproject, "rb") as fp:
+        data = tomllib.load(fp)
+
+    build = data.get("tool", {}).get("hatch", {}).get("build", {})
+    raw = build.get("hooks", {}).get("robotpy")
+    if raw is None:
+        raw = build.get("targets", {}).get("wheel", {}).get("hooks", {})
+        raw = raw.get("robotpy")
+    if raw is None:
+        raise ValueError(f"{pyproject}: no [tool.hatch.build.hooks.robotpy] section")
+
+    raw = {k: v for k, v in raw.items() if k not in _HATCH_HOOK_OPTIONS}
+    return Project(pyproject=pyproject.absolute(), cfg=parse_input(raw, HookConfig))
+
+
+def get_project_downloads(
+    projects: T.List[Project],
+    platform_names: T.List[str],
+    resolver: MavenResolver,
+    jobs: int = 4,
+) -> T.List[Download]:
+    """
+    Resolves the downloads of each project for each platform. Downloads that
+    are available as local files are left out, and each URL is only
+    returned once.
+    """
+    # resolve the versions of all projects in a single pass
+    mcfgs = resolver.resolve_versions(
+        [mcfg for project in projects for mcfg in project.cfg.maven_lib_download],
+        jobs,
+    )
+
+    downloads: T.Dict[str, Download] = {}
+    for project in projects:
+        n = len(project.cfg.maven_lib_download)
+        project_mcfgs, mcfgs = mcfgs[:n], mcfgs[n:]
+
+        for name in platform_names:
+            platform = get_platform(name)
+            for download in get_downloads(project.cfg, platform, project_mcfgs):
+                if find_local_file(download, project.root) is None:
+                    downloads.setdefault(download.url, download)
+
+    return list(downloads.values())
+
+
+def prefetch(
+    downloads: T.List[Download],
+    cache: ArtifactCache,
+    jobs: int = 4,
+    revalidate: bool = False,
+) -> T.Iterator[PrefetchResult]:
+    """
+    Downloads everything into the cache in parallel. A failed download
+    doesn't stop the others.
+
+    :returns: a result for each download, in the order they finish
+    """
+
+    def _fetch(download: Download) -> PrefetchResult:
+        result = PrefetchResult(url=download.url)
+        try:
+            path, result.present = download_file(
+                download.url,
+                cache,
+                revalidate or download.revalidate,
+                download.sha256,
+                download.checksums,
+                download.size,
+            )
+        except urllib.error.HTTPError as e:
+            result.error = f"{e.code} {e.reason}"
+        except (ChecksumMismatch, OSError, urllib.error.URLError) as e:
+            result.error = str(e)
+        else:
+            result.size = path.stat().st_size
+            # cached objects are named by their sha256
+            result.sha256 = path.name
+        return result
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(_fetch, download) for download in downloads]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def create_lock(
+    project: Project,
+    platform_names: T.List[str],
+    cache: ArtifactCache,
+    resolver: MavenResolver,
+    jobs: int = 4,
+) -> T.Tuple[LockFile, T.List[PrefetchResult]]:
+    """
+    Resolves and downloads everything the project needs on each platform,
+    and records it. Downloads available as local files are hashed in place.
+    A platform is left out of the lock if any of its downloads failed.
+
+    :returns: the lock, and the downloads that failed
+    """
+    cfg = project.cfg
+    mcfgs = resolver.resolve_versions(cfg.maven_lib_download, jobs)
+    maven = {
+        maven_key(mcfg): resolved.version
+        for mcfg, resolved in zip(cfg.maven_lib_download, mcfgs)
+    }
+
+    per_platform = {
+        name: get_downloads(cfg, get_platform(name), mcfgs) for name in platform_names
+    }
+
+    locked: T.Dict[str, LockedDownload] = {}
+    remote: T.Dict[str, Download] = {}
+    for downloads in per_platform.values():
+        for download in downloads:
+            local_file = find_local_file(download, project.root)
+            if local_file is not None:
+                locked[download.url] = LockedDownload(
+                    url=download.url,
+                    size=local_file.stat().st_size,
+                    sha256=file_sha256(local_file),
+                )
+            else:
+                remote.setdefault(download.url, download)
+
+    failed = []
+    for result in prefetch(list(remote.values()), cache, jobs):
+        if result.error is not None:
+            failed.append(result)
+        else:
+            assert result.sha256 is not None
+            locked[result.url] = LockedDownload(
+                url=result.url, size=result.size, sha256=result.sha256
+            )
+
+    lock = LockFile(maven=maven)
+    for name, downloads in per_platform.items():
+        if all(download.url in locked for download in downloads):
+            lock.platforms[name] = [locked[download.url] for download in downloads]
+
+    return lock, failed
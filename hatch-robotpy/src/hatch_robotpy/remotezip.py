@@ -0,0 +1,233 @@
+"""
+Fetch only some members of a zip file on a remote server.
+
+The central directory at the end of the archive is fetched with an HTTP
+Range request, and then only the byte ranges of the members that are
+needed. These are written into a sparse local file at the same offsets as
+the remote archive, so the result can be read with zipfile as usual as
+long as only the fetched members are accessed.
+"""
+
+import pathlib
+import struct
+import typing as T
+import urllib.parse
+import zipfile
+
+from .download import USER_AGENT
+from .httppool import PooledResponse, get_pool
+
+# End of central directory record
+_EOCD_SIG = b"PK\x05\x06"
+_EOCD_FMT = "<4s4H2LH"
+_EOCD_SIZE = struct.calcsize(_EOCD_FMT)
+
+# Zip64 end of central directory locator and record
+_EOCD64_LOC_SIG = b"PK\x06\x07"
+_EOCD64_LOC_FMT = "<4sLQL"
+_EOCD64_LOC_SIZE = struct.calcsize(_EOCD64_LOC_FMT)
+_EOCD64_SIG = b"PK\x06\x06"
+_EOCD64_FMT = "<4sQ2H2L4Q"
+_EOCD64_SIZE = struct.calcsize(_EOCD64_FMT)
+
+#: Enough to find the end of central directory record behind a maximum
+#: length comment
+_TAIL_SIZE = _EOCD_SIZE + 0xFFFF
+
+#: Ranges that are closer than this are fetched with a single request
+_MERGE_GAP = 64 * 1024
+
+#: If more than this fraction of the archive is needed, downloading the
+#: whole thing (which can be cached) is better
+MAX_PARTIAL_FRACTION = 0.75
+
+
+class RangeNotSupported(Exception):
+    pass
+
+
+class _RemoteFile:
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.size = 0
+        self.validator: T.Optional[str] = None
+
+    def fetch(self, start: int, end: T.Optional[int] = None) -> T.Tuple[int, bytes]:
+        """
+        Fetch bytes [start, end), or if start is negative, the last -start
+        bytes. Returns the offset of the data and the data.
+        """
+        if start < 0:
+            rng = f"bytes={start}"
+        else:
+            assert end is not None
+            rng = f"bytes={start}-{end - 1}"
+
+        headers = {"User-Agent": USER_AGENT, "Range": rng}
+        if self.validator:
+            headers["If-Range"] = self.validator
+
+        with get_pool().request("GET", self.url, headers) as response:
+            if response.status != 206:
+                raise RangeNotSupported(f"{self.url}: status {response.status}")
+
+            offset, total = _parse_content_range(response)
+            if self.validator is None:
+                self.size = total
+                etag = response.headers.get("ETag")
+                if etag and not etag.startswith("W/"):
+                    self.validator = etag
+                else:
+                    self.validator = response.headers.get("Last-Modified")
+            elif total != self.size:
+                raise RangeNotSupported(f"{self.url}: changed while reading")
+
+            return offset, response.read()
+
+
+def fetch_zip_members(
+    url: str, to: T.Dict[str, pathlib.Path], dest: pathlib.Path
+) -> bool:
+    """
+    Writes the parts of the zip file at url needed to extract the `to` map
+    (see :func:`.extract_zip`) to dest.
+
+    :returns: False if a partial fetch is not possible or not worth it, in
+              which case the whole file should be downloaded instead
+    """
+
+    # extracting everything needs the whole file
+    if "" in to:
+        return False
+
+    scheme = urllib.parse.urlsplit(url).scheme.lower()
+    if scheme not in ("http", "https"):
+        return False
+
+    remote = _RemoteFile(url)
+
+    try:
+        ok = _fetch_zip_members(remote, to, dest)
+    except (RangeNotSupported, zipfile.BadZipFile):
+        ok = False
+
+    if not ok:
+        dest.unlink(missing_ok=True)
+    return ok
+
+
+def _fetch_zip_members(
+    remote: _RemoteFile, to: T.Dict[str, pathlib.Path], dest: pathlib.Path
+) -> bool:
+    tail_offset, tail = remote.fetch(-_TAIL_SIZE)
+    cd_offset, cd_size = _find_central_directory(remote, tail_offset, tail)
+
+    with open(dest, "wb") as fp:
+        fp.truncate(remote.size)
+        fp.seek(tail_offset)
+        fp.write(tail)
+
+        if cd_offset < tail_offset:
+            offset, data = remote.fetch(cd_offset, tail_offset)
+            fp.seek(offset)
+            fp.write(data)
+
+        fp.flush()
+        with zipfile.ZipFile(dest) as z:
+            infolist = z.infolist()
+
+        ranges = _get_member_ranges(infolist, to, cd_offset)
+        needed = sum(end - start for start, end in ranges)
+        if needed > remote.size * MAX_PARTIAL_FRACTION:
+            return False
+
+        for start, end in ranges:
+            offset, data = remote.fetch(start, end)
+            fp.seek(offset)
+            fp.write(data)
+
+    return True
+
+
+def _parse_content_range(response: PooledResponse) -> T.Tuple[int, int]:
+    # Content-Range: bytes 1000-1999/2000
+    content_range = response.headers.get("Content-Range", "")
+    unit, _, rng = content_range.partition(" ")
+    rng, _, total = rng.partition("/")
+    start, _, _ = rng.partition("-")
+    try:
+        if unit != "bytes":
+            raise ValueError
+        return int(start), int(total)
+    except ValueError:
+        raise RangeNotSupported(f"invalid Content-Range {content_range!r}")
+
+
+def _find_central_directory(
+    remote: _RemoteFile, tail_offset: int, tail: bytes
+) -> T.Tuple[int, int]:
+    pos = tail.rfind(_EOCD_SIG)
+    if pos == -1 or pos + _EOCD_SIZE > len(tail):
+        raise zipfile.BadZipFile("end of central directory not found")
+
+    _, _, _, _, _, cd_size, cd_offset, _ = struct.unpack(
+        _EOCD_FMT, tail[pos : pos + _EOCD_SIZE]
+    )
+
+    if cd_offset == 0xFFFFFFFF or cd_size == 0xFFFFFFFF:
+        loc_pos = pos - _EOCD64_LOC_SIZE
+        if loc_pos < 0:
+            raise zipfile.BadZipFile("zip64 locator not found")
+        sig, _, eocd64_offset, _ = struct.unpack(
+            _EOCD64_LOC_FMT, tail[loc_pos:pos]
+        )
+        if sig != _EOCD64_LOC_SIG:
+            raise zipfile.BadZipFile("zip64 locator not found")
+
+        rel = eocd64_offset - tail_offset
+        if rel >= 0:
+            record = tail[rel : rel + _EOCD64_SIZE]
+        else:
+            _, record = remote.fetch(eocd64_offset, eocd64_offset + _EOCD64_SIZE)
+
+        fields = struct.unpack(_EOCD64_FMT, record)
+        if fields[0] != _EOCD64_SIG:
+            raise zipfile.BadZipFile("zip64 end of central directory not found")
+        cd_size, cd_offset = fields[8], fields[9]
+
+    return cd_offset, cd_size
+
+
+def _get_member_ranges(
+    infolist: T.List[zipfile.ZipInfo], to: T.Dict[str, pathlib.Path], cd_offset: int
+) -> T.List[T.Tuple[int, int]]:
+    """
+    :returns: merged byte ranges (start, end) that contain the members
+              needed for the `to` map
+    """
+
+    files = set()
+    prefixes = []
+    for src in to:
+        files.add(src)
+        prefixes.append(src.rstrip("/") + "/")
+
+    # members end where the next one starts
+    by_offset = sorted(infolist, key=lambda i: i.header_offset)
+    ends = [i.header_offset for i in by_offset[1:]] + [cd_offset]
+
+    ranges: T.List[T.Tuple[int, int]] = []
+    for info, end in zip(by_offset, ends):
+        if info.is_dir():
+            continue
+        name = info.filename
+        if name not in files and not name.startswith(tuple(prefixes)):
+            continue
+
+        start = info.header_offset
+        if ranges and start - ranges[-1][1] <= _MERGE_GAP:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+
+    return ranges
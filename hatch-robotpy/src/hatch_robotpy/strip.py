@@ -0,0 +1,52 @@
+import functools
+import hashlib
+import os
+import pathlib
+import shutil
+import subprocess
+import typing as T
+
+from .cache import ArtifactCache, file_sha256
+from .materialize import materialize
+
+
+@functools.lru_cache(maxsize=None)
+def _strip_exe_id(strip_exe: str) -> str:
+    # a different strip executable may produce different output
+    path = shutil.which(strip_exe) or strip_exe
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path
+    return f"{path}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def strip_library(
+    fname: pathlib.Path,
+    strip_exe: str,
+    flags: T.Sequence[str] = (),
+    cache: T.Optional[ArtifactCache] = None,
+) -> bool:
+    """
+    Strips a library in place. The output only depends on the input file,
+    the strip executable and flags, so if a cache is given the result is
+    stored there and reused the next time the same file is stripped.
+
+    :returns: True if the stripped file came from the cache
+    """
+    if cache is None:
+        subprocess.check_call([strip_exe, *flags, str(fname)])
+        return False
+
+    key_src = "\0".join([file_sha256(fname), _strip_exe_id(strip_exe), *flags])
+    key = hashlib.sha256(key_src.encode("utf-8")).hexdigest()
+
+    cached = cache.lookup_stripped(key)
+    if cached is not None:
+        fname.unlink()
+        materialize(cached, fname, "reflink")
+        return True
+
+    subprocess.check_call([strip_exe, *flags, str(fname)])
+    cache.store_stripped(key, fname)
+    return False
@@ -0,0 +1,174 @@
+"""
+Opt-in timing instrumentation for build hooks.
+
+Set PREFIX_TRACE (such as HATCH_ROBOTPY_TRACE) to a filename to record where
+the build spends its time. The result is Chrome trace-event JSON, which can
+be opened with chrome://tracing or https://ui.perfetto.dev. Set
+PREFIX_PROFILE to a filename to also write cProfile statistics for the hook.
+
+This module is the same in hatch-robotpy and hatch-mkpkgconf, which don't
+depend on each other. Change both copies; benchmarks/check_shared.py in the
+repository root fails if they differ.
+"""
+
+import contextlib
+import os
+import pathlib
+import threading
+import time
+import typing as T
+
+
+class Tracer:
+    """
+    Records spans and counters. A tracer without a path is disabled, and
+    recording to it does nothing.
+    """
+
+    def __init__(self, path: T.Optional[pathlib.Path] = None) -> None:
+        self.path = path
+        self.enabled = path is not None
+
+        #: Chrome trace events
+        self.events: T.List[T.Dict[str, T.Any]] = []
+
+        #: name: value of each counter
+        self.counters: T.Dict[str, int] = {}
+
+        #: name: total seconds of each phase
+        self.phases: T.Dict[str, float] = {}
+
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._pid = os.getpid()
+
+    @contextlib.contextmanager
+    def span(
+        self, name: str, cat: str = "hook", **args: T.Any
+    ) -> T.Iterator[T.Dict[str, T.Any]]:
+        """
+        Records the time spent in the with block. The yielded dict is stored
+        as the arguments of the event, so details that are only known at the
+        end (bytes transferred, cache hit or miss) can be added to it.
+
+        Spans with cat="phase" are included in :meth:`summary`.
+        """
+        if not self.enabled:
+            yield args
+            return
+
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter()
+            event = {
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": (start - self._start) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": self._pid,
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+            with self._lock:
+                self.events.append(event)
+                if cat == "phase":
+                    self.phases[name] = self.phases.get(name, 0.0) + end - start
+
+    def count(self, name: str, n: int = 1) -> None:
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+
+        import json
+
+        with self._lock:
+            events = list(self.events)
+            ts = (time.perf_counter() - self._start) * 1e6
+            events.extend(
+                {
+                    "name": name,
+                    "ph": "C",
+                    "ts": ts,
+                    "pid": self._pid,
+                    "args": {name: value},
+                }
+                for name, value in self.counters.items()
+            )
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w") as fp:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fp)
+
+    def summary(self) -> str:
+        """
+        :returns: the time spent in each phase, such as "fetch 1.20s, strip 0.31s"
+        """
+        return ", ".join(f"{name} {secs:.2f}s" for name, secs in self.phases.items())
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """
+    :returns: the active tracer, which is disabled unless :func:`start` was called
+    """
+    return _tracer
+
+
+def start(path: T.Optional[str]) -> Tracer:
+    """
+    Makes a new tracer active. If path is empty, it is disabled.
+    """
+    global _tracer
+    _tracer = Tracer(pathlib.Path(path).absolute() if path else None)
+    return _tracer
+
+
+def stop() -> None:
+    global _tracer
+    _tracer = Tracer()
+
+
+@contextlib.contextmanager
+def trace(env_prefix: str) -> T.Iterator[Tracer]:
+    """
+    Traces the with block to the file named by {env_prefix}_TRACE, and
+    profiles it to {env_prefix}_PROFILE. The trace is saved at the end.
+    """
+    tracer = start(os.environ.get(f"{env_prefix}_TRACE"))
+    try:
+        with profile(os.environ.get(f"{env_prefix}_PROFILE")):
+            yield tracer
+    finally:
+        stop()
+        tracer.save()
+
+
+@contextlib.contextmanager
+def profile(path: T.Optional[str]) -> T.Iterator[None]:
+    """
+    Writes cProfile statistics for the with block to path, if given. Only
+    the calling thread is profiled, work done by worker threads shows up as
+    time spent waiting for them.
+    """
+    if not path:
+        yield
+        return
+
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)